@@ -0,0 +1,138 @@
+"""
+Compare FileController with AsyncFileController under concurrent load.
+
+Requests are sent straight to Django's ASGI application, the same code path
+uvicorn or daphne would use, so sync views pay for their thread hand-off
+exactly as they do in production. Besides latency and throughput the script
+reports the peak number of threads, which is what slow clients exhaust.
+
+    python -m benchmarks.async_throughput --operation upload --slow-client-ms 20
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+from benchmarks.common import (
+    asgi_request,
+    create_user,
+    multipart,
+    scratch_environment,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+ROUTES = {
+    "sync": "/api/file",
+    "async": "/api/async/file",
+}
+
+
+def build_request(operation, prefix, file_guids, index, payload):
+    if operation == "list":
+        return "GET", prefix + "/list?size=30", b"", None
+    if operation == "details":
+        guid = file_guids[index % len(file_guids)]
+        return "GET", prefix + "/details?file_guid=" + guid, b"", None
+    body, content_type = multipart(
+        {"file_name": "bench-" + str(index)},
+        {"file": ("bench.bin", payload + str(index).encode())},
+    )
+    return "POST", prefix + "/upload", body, content_type
+
+
+async def run_variant(app, args, prefix, token, file_guids, payload):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+    peak_threads = threading.active_count()
+
+    async def one(index):
+        nonlocal peak_threads
+        method, url, body, content_type = build_request(
+            args.operation, prefix, file_guids, index, payload
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            status, _, _ = await asgi_request(
+                app,
+                method,
+                url,
+                token=token,
+                body=body,
+                content_type=content_type,
+                chunk_size=args.client_chunk_size,
+                chunk_delay=args.slow_client_ms / 1000,
+            )
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            peak_threads = max(peak_threads, threading.active_count())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "elapsed_s": round(elapsed, 3),
+        "peak_threads": peak_threads,
+        "statuses": statuses,
+        "latency": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--operation", choices=["list", "details", "upload"], default="list"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--payload-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--client-chunk-size", type=int, default=16 * 1024)
+    parser.add_argument(
+        "--slow-client-ms",
+        type=float,
+        default=0,
+        help="delay between request body chunks sent by each client",
+    )
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.asgi import get_asgi_application
+
+    with scratch_environment():
+        app = get_asgi_application()
+        _, token = create_user("bench@example.com")
+        payload = b"x" * args.payload_bytes
+        for index in range(args.files):
+            body, content_type = multipart(
+                {"file_name": "seed-" + str(index)},
+                {"file": ("seed.bin", payload + str(index).encode())},
+            )
+            asyncio.run(
+                asgi_request(
+                    app,
+                    "POST",
+                    "/api/file/upload",
+                    token=token,
+                    body=body,
+                    content_type=content_type,
+                )
+            )
+        from file.models import File
+
+        file_guids = [str(guid) for guid in File.objects.values_list("guid", flat=True)]
+
+        results = {"config": vars(args), "variants": {}}
+        for variant, prefix in ROUTES.items():
+            results["variants"][variant] = asyncio.run(
+                run_variant(app, args, prefix, token, file_guids, payload)
+            )
+    write_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
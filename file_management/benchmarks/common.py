@@ -0,0 +1,161 @@
+"""
+Helpers shared by the benchmark scripts. Run the scripts from the project
+directory, e.g. ``python -m benchmarks.async_throughput``. Every run uses a
+throwaway SQLite database and media directory.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+from urllib.parse import urlsplit
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "file_management.settings")
+    import django
+
+    django.setup()
+    # Per-request access logs would swamp the results.
+    logging.disable(logging.WARNING)
+
+
+@contextlib.contextmanager
+def scratch_environment():
+    """Create a scratch database and MEDIA_ROOT, removing both afterwards."""
+    from django.db import connection
+    from django.test.utils import (
+        override_settings,
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    workdir = tempfile.mkdtemp(prefix="file-management-bench-")
+    if connection.vendor == "sqlite":
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(
+            workdir, "bench.sqlite3"
+        )
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    media = override_settings(MEDIA_ROOT=workdir)
+    media.enable()
+    try:
+        yield workdir
+    finally:
+        media.disable()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def create_user(email: str, password: str = "Bench-Password-1"):
+    """Create a verified user and return it with an access token."""
+    from core.auth import get_tokens_for_user
+    from user.models import User
+
+    user = User.objects.create_user(
+        email=email, name=email.split("@")[0], password=password, is_verified=True
+    )
+    return user, get_tokens_for_user(user)["access"]
+
+
+async def asgi_request(
+    app,
+    method: str,
+    url: str,
+    token: str = None,
+    body: bytes = b"",
+    content_type: str = None,
+    chunk_size: int = 64 * 1024,
+    chunk_delay: float = 0,
+):
+    """
+    Send one request straight to an ASGI application and return
+    ``(status, headers, body)``. ``chunk_delay`` sleeps between body chunks to
+    simulate a slow client.
+    """
+    parts = urlsplit(url)
+    headers = [(b"host", b"testserver")]
+    if token:
+        headers.append((b"authorization", b"Bearer " + token.encode()))
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    if body:
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    chunks = chunks or [b""]
+    response = {"status": None, "headers": [], "body": []}
+
+    async def receive():
+        if chunks:
+            if chunk_delay:
+                await asyncio.sleep(chunk_delay)
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], dict(response["headers"]), b"".join(response["body"])
+
+
+def multipart(fields: dict, files: dict):
+    """Encode form fields and ``{name: (filename, bytes)}`` files."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+    data = dict(fields)
+    for name, (filename, content) in files.items():
+        data[name] = SimpleUploadedFile(filename, content)
+    return encode_multipart(BOUNDARY, data), MULTIPART_CONTENT
+
+
+def summarize(latencies) -> dict:
+    """Latency percentiles in milliseconds."""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"count": 0}
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p95_ms": round(percentile(95) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def write_json(results, path: str = None):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,441 @@
+"""
+Drive a weighted mix of real API operations from concurrent clients.
+
+The mix covers signup and login, upload, list, details, update and delete of
+files, and the /api/access grant, revoke and check endpoints. Users and files
+are created through the API first, so the same run works in process against
+Django's ASGI application on a throwaway database (``--transport asgi``) or
+over HTTP against a running server (``--transport http --url ...``; use a
+development database, the run leaves its users and files behind).
+
+Each operation reports throughput, p50/p95/p99 latency, status counts and
+SQL queries per request, read from the Server-Timing header that
+RequestMetricsMiddleware adds under DEBUG or with METRICS_SERVER_TIMING=1.
+Write the results with ``--json`` and diff two runs to spot regressions.
+
+    python -m benchmarks.loadtest --requests 2000 --concurrency 20
+    python -m benchmarks.loadtest --mix list=5,details=3,grant=1 --json run.json
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks.common import (
+    asgi_request,
+    multipart,
+    scratch_environment,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+PASSWORD = "Bench-Password-1"
+DEFAULT_MIX = (
+    "list=30,details=20,check=10,upload=8,update=5,grant=8,revoke=4,"
+    "delete=3,login=8,signup=4"
+)
+ACCESS_PERMS = ("read", "update", "delete")
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class AsgiTransport:
+    """Requests straight to Django's ASGI application in this process."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method, url, token=None, body=b"", content_type=None):
+        status, headers, content = await asgi_request(
+            self.app, method, url, token=token, body=body, content_type=content_type
+        )
+        headers = {
+            name.decode().lower(): value.decode() for name, value in headers.items()
+        }
+        return status, headers, content
+
+
+class HttpTransport:
+    """Requests over keep-alive HTTP connections, one per client thread."""
+
+    def __init__(self, url: str, concurrency: int):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def connection(self, fresh=False):
+        if fresh or getattr(self.local, "connection", None) is None:
+            self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=60
+            )
+        return self.local.connection
+
+    def send(self, method, url, token, body, content_type):
+        headers = {"Content-Length": str(len(body))}
+        if token:
+            headers["Authorization"] = "Bearer " + token
+        if content_type:
+            headers["Content-Type"] = content_type
+        for fresh in (False, True):
+            connection = self.connection(fresh)
+            try:
+                connection.request(method, self.prefix + url, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed an idle keep-alive connection; retry once.
+                connection.close()
+                if fresh:
+                    raise
+                continue
+            headers = {name.lower(): value for name, value in response.getheaders()}
+            return response.status, headers, content
+
+    async def request(self, method, url, token=None, body=b"", content_type=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.send, method, url, token, body, content_type
+        )
+
+
+class LoadTest:
+    def __init__(self, transport, args):
+        self.transport = transport
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.payload = b"x" * args.payload_bytes
+        self.users = []  # (email, token, [file guids])
+        self.disposable = []  # (token, file guid) for delete
+        self.counter = 0
+        self.results = {}
+
+    async def call(
+        self, method, url, token=None, json_body=None, form=None, files=None
+    ):
+        if form is not None:
+            body, content_type = multipart(form, files or {})
+        elif json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), "application/json"
+        else:
+            body, content_type = b"", None
+        return await self.transport.request(method, url, token, body, content_type)
+
+    def unique(self, prefix: str) -> str:
+        self.counter += 1
+        return f"{prefix}-{self.counter}"
+
+    # Setup, through the API so it works against any server.
+
+    async def signup(self, email: str):
+        status, _, content = await self.call(
+            "POST",
+            "/api/auth/signup",
+            json_body={
+                "email": email,
+                "name": email.split("@")[0],
+                "password": PASSWORD,
+            },
+        )
+        return status, content
+
+    async def create_user(self, email: str) -> str:
+        status, content = await self.signup(email)
+        if status != 201:
+            raise RuntimeError(f"Signup of {email} failed with {status}: {content!r}")
+        link = urlsplit(json.loads(content)["link"])
+        await self.call("PATCH", link.path + "?" + link.query)
+        status, _, content = await self.call(
+            "POST", "/api/auth/login", json_body={"email": email, "password": PASSWORD}
+        )
+        if status != 200:
+            raise RuntimeError(f"Login of {email} failed with {status}: {content!r}")
+        return json.loads(content)["token"]
+
+    async def upload(self, token: str, name: str):
+        return await self.call(
+            "POST",
+            "/api/file/upload",
+            token,
+            form={"file_name": name},
+            files={"file": (name + ".bin", self.payload + name.encode())},
+        )
+
+    async def owned_files(self, token: str) -> dict:
+        """``{file_name: guid}`` of everything the user can list."""
+        files, after = {}, ""
+        while after is not None:
+            _, _, content = await self.call(
+                "GET", f"/api/file/list?size=500&after={after}", token
+            )
+            page = json.loads(content)
+            files.update((row["file_name"], row["guid"]) for row in page["data"])
+            after = page["next_cursor"]
+        return files
+
+    async def setup(self) -> None:
+        run = uuid.uuid4().hex[:8]
+        weights = dict(self.args.mix)
+        deletes = self.args.requests * weights.get("delete", 0) / sum(weights.values())
+        disposable_per_user = int(deletes * 1.5 / self.args.users) + 1
+        for index in range(self.args.users):
+            email = f"load-{run}-{index}@example.com"
+            token = await self.create_user(email)
+            for number in range(self.args.files_per_user):
+                await self.upload(token, f"load-{index}-{number}")
+            for number in range(disposable_per_user):
+                await self.upload(token, f"disposable-{index}-{number}")
+            files = await self.owned_files(token)
+            self.users.append(
+                (
+                    email,
+                    token,
+                    [guid for name, guid in files.items() if name.startswith("load-")],
+                )
+            )
+            self.disposable += [
+                (token, guid)
+                for name, guid in files.items()
+                if name.startswith("disposable-")
+            ]
+        self.rng.shuffle(self.disposable)
+
+    # Operations. Each returns (method, url, token, keyword arguments for call).
+
+    def pick(self):
+        return self.users[self.rng.randrange(len(self.users))]
+
+    def op_list(self):
+        _, token, _ = self.pick()
+        return "GET", "/api/file/list?size=30", token, {}
+
+    def op_details(self):
+        _, token, guids = self.pick()
+        return (
+            "GET",
+            "/api/file/details?file_guid=" + self.rng.choice(guids),
+            token,
+            {},
+        )
+
+    def op_check(self):
+        _, token, guids = self.pick()
+        other = self.pick()[2]
+        sample = self.rng.sample(guids, min(len(guids), 20)) + other[:5]
+        return "POST", "/api/access/check", token, {"json_body": {"file_guids": sample}}
+
+    def op_upload(self):
+        _, token, _ = self.pick()
+        name = self.unique("upload")
+        return (
+            "POST",
+            "/api/file/upload",
+            token,
+            {
+                "form": {"file_name": name},
+                "files": {"file": (name + ".bin", self.payload + name.encode())},
+            },
+        )
+
+    def op_update(self):
+        _, token, guids = self.pick()
+        name = self.unique("update")
+        return (
+            "PUT",
+            "/api/file/update",
+            token,
+            {
+                "form": {"file_guid": self.rng.choice(guids), "file_name": name},
+                "files": {"file": (name + ".bin", self.payload + name.encode())},
+            },
+        )
+
+    def access(self, action: str):
+        caller = self.pick()
+        _, token, guids = caller
+        # Never the owner, whose own rights a revoke would strip.
+        others = [user for user in self.users if user is not caller] or [caller]
+        email = self.rng.choice(others)[0]
+        perm = self.rng.choice(ACCESS_PERMS)
+        return (
+            "POST",
+            f"/api/access/{perm}/{action}",
+            token,
+            {"json_body": {"user_email": email, "file_guid": self.rng.choice(guids)}},
+        )
+
+    def op_grant(self):
+        return self.access("create")
+
+    def op_revoke(self):
+        return self.access("remove")
+
+    def op_delete(self):
+        if not self.disposable:
+            return None
+        token, guid = self.disposable.pop()
+        return "DELETE", "/api/file/delete?file_guid=" + guid, token, {}
+
+    def op_login(self):
+        email, _, _ = self.pick()
+        return (
+            "POST",
+            "/api/auth/login",
+            None,
+            {"json_body": {"email": email, "password": PASSWORD}},
+        )
+
+    def op_signup(self):
+        email = self.unique("signup-" + uuid.uuid4().hex[:8]) + "@example.com"
+        return (
+            "POST",
+            "/api/auth/signup",
+            None,
+            {
+                "json_body": {
+                    "email": email,
+                    "name": email.split("@")[0],
+                    "password": PASSWORD,
+                }
+            },
+        )
+
+    # Measurement.
+
+    async def run(self) -> dict:
+        names, weights = zip(*self.args.mix)
+        plan = self.rng.choices(names, weights=weights, k=self.args.requests)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def one(operation):
+            request = getattr(self, "op_" + operation)()
+            if request is None:
+                return
+            method, url, token, kwargs = request
+            async with semaphore:
+                started = time.perf_counter()
+                status, headers, _ = await self.call(method, url, token, **kwargs)
+                latency = time.perf_counter() - started
+            queries = QUERIES.search(headers.get("server-timing", ""))
+            result = self.results.setdefault(
+                operation, {"latencies": [], "statuses": {}, "queries": []}
+            )
+            result["latencies"].append(latency)
+            result["statuses"][status] = result["statuses"].get(status, 0) + 1
+            if queries:
+                result["queries"].append(int(queries.group(1)))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(operation) for operation in plan))
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        total = 0
+        for operation, result in sorted(self.results.items()):
+            count = len(result["latencies"])
+            total += count
+            queries = result["queries"]
+            operations[operation] = {
+                "requests": count,
+                "throughput_rps": round(count / elapsed, 2),
+                "statuses": result["statuses"],
+                "latency": summarize(result["latencies"]),
+                "queries_per_request": (
+                    {
+                        "mean": round(sum(queries) / len(queries), 2),
+                        "max": max(queries),
+                    }
+                    if queries
+                    else None
+                ),
+            }
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "latency": summarize(
+                [
+                    latency
+                    for result in self.results.values()
+                    for latency in result["latencies"]
+                ]
+            ),
+            "operations": operations,
+        }
+
+
+def parse_mix(value: str) -> list:
+    mix = []
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(LoadTest, "op_" + name):
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}")
+        try:
+            mix.append((name, float(weight or 1)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for {name!r}")
+    return mix
+
+
+async def run_load(transport, args) -> dict:
+    load = LoadTest(transport, args)
+    started = time.perf_counter()
+    await load.setup()
+    setup_s = time.perf_counter() - started
+    result = await load.run()
+    result["setup_s"] = round(setup_s, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--transport", choices=["asgi", "http"], default="asgi")
+    parser.add_argument(
+        "--url",
+        default="http://127.0.0.1:8000",
+        help="server to load with --transport http",
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix(DEFAULT_MIX),
+        help=f"operation=weight pairs (default: {DEFAULT_MIX})",
+    )
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--files-per-user", type=int, default=20)
+    parser.add_argument("--payload-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    if args.users < 1 or args.files_per_user < 1:
+        parser.error("--users and --files-per-user must be at least 1")
+
+    # Django encodes the multipart bodies, so it is set up for both transports.
+    setup_django()
+    if args.transport == "http":
+        result = asyncio.run(run_load(HttpTransport(args.url, args.concurrency), args))
+    else:
+        from django.core.asgi import get_asgi_application
+
+        with scratch_environment():
+            transport = AsgiTransport(get_asgi_application())
+            result = asyncio.run(run_load(transport, args))
+    config = dict(vars(args), mix=dict(args.mix))
+    write_json({"config": config, "result": result}, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure file API latency while a burst of logins is hashing passwords.
+
+A probe requests ``--probe`` one at a time while ``--logins`` concurrent
+logins hit either the sync /api/auth/login or the async /api/async/auth/login
+endpoint. Sync views share one thread under ASGI, so PBKDF2 on that thread
+holds up every other sync view; the async endpoint hashes on the bounded
+pool instead and answers 503 once its queue is full.
+
+    python -m benchmarks.login_storm --logins 40 --probe /api/file/list?size=30
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import (
+    asgi_request,
+    create_user,
+    scratch_environment,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+PASSWORD = "Bench-Password-1"
+
+ROUTES = {
+    "baseline": None,
+    "sync_login": "/api/auth/login",
+    "async_login": "/api/async/auth/login",
+}
+
+
+async def run_variant(app, args, login_url, token):
+    body = json.dumps({"email": "bench@example.com", "password": PASSWORD}).encode()
+    statuses = {}
+    storm_done = asyncio.Event()
+
+    async def one_login(semaphore):
+        async with semaphore:
+            status, _, _ = await asgi_request(
+                app,
+                "POST",
+                login_url,
+                body=body,
+                content_type="application/json",
+            )
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def storm():
+        semaphore = asyncio.Semaphore(args.login_concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login(semaphore) for _ in range(args.logins)))
+        storm_done.set()
+        return time.perf_counter() - started
+
+    async def probe():
+        latencies = []
+        while len(latencies) < args.probes or (login_url and not storm_done.is_set()):
+            started = time.perf_counter()
+            await asgi_request(app, "GET", args.probe, token=token)
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(args.probe_interval_ms / 1000)
+        return latencies
+
+    result = {}
+    if login_url:
+        elapsed, latencies = await asyncio.gather(storm(), probe())
+        result["logins"] = {
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(args.logins / elapsed, 2),
+            "statuses": statuses,
+        }
+    else:
+        latencies = await probe()
+    result["probe_latency"] = summarize(latencies)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--login-concurrency", type=int, default=40)
+    parser.add_argument("--probe", default="/api/file/list?size=30")
+    parser.add_argument(
+        "--probes",
+        type=int,
+        default=50,
+        help="minimum number of probe requests per variant",
+    )
+    parser.add_argument("--probe-interval-ms", type=float, default=10)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.asgi import get_asgi_application
+
+    with scratch_environment():
+        app = get_asgi_application()
+        _, token = create_user("bench@example.com", PASSWORD)
+        # The first request pays for URL resolution and imports.
+        asyncio.run(asgi_request(app, "GET", args.probe, token=token))
+        results = {"config": vars(args), "variants": {}}
+        for variant, login_url in ROUTES.items():
+            results["variants"][variant] = asyncio.run(
+                run_variant(app, args, login_url, token)
+            )
+    write_json(results, args.json)
+
+
+if __name__ == "__main__":
+    main()
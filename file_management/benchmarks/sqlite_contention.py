@@ -0,0 +1,172 @@
+"""
+Measure concurrent upload and grant throughput on SQLite, stock backend vs WAL.
+
+Each of ``--threads`` threads uploads a file and then grants another user
+read access to it, ``--operations`` times, through the sync views on its own
+database connection like the threads of a WSGI server. Under the stock
+backend writers fail with "database is locked" (HTTP 500) once they wait out
+the default 5 second timeout or hit a deferred transaction upgrade; the WAL
+backend (``SQLITE_MODE=wal``) should finish without them. ``--mode both``
+runs each SQLITE_MODE in a fresh process, since the backend is fixed once
+Django is set up.
+
+    python -m benchmarks.sqlite_contention --threads 8 --operations 25
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (
+    create_user,
+    multipart,
+    scratch_environment,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+MODES = ("default", "wal")
+OPERATIONS = ("upload", "grant")
+
+
+def worker(index, args, token, barrier, results):
+    from django.db import connections
+    from django.test import Client
+
+    from file.models import File
+
+    client = Client(raise_request_exception=False)
+    payload = b"x" * args.payload_bytes
+    barrier.wait()
+    try:
+        for operation in range(args.operations):
+            name = f"bench-{index}-{operation}"
+            body, content_type = multipart(
+                {"file_name": name}, {"file": (name, payload + name.encode())}
+            )
+            started = time.perf_counter()
+            response = client.generic(
+                "POST",
+                "/api/file/upload",
+                body,
+                content_type,
+                HTTP_AUTHORIZATION="Bearer " + token,
+            )
+            results.append(
+                ("upload", response.status_code, time.perf_counter() - started)
+            )
+            guid = (
+                File.objects.filter(file_name=name)
+                .values_list("guid", flat=True)
+                .first()
+            )
+            if guid is None:
+                continue
+            body = {"user_email": "grantee@example.com", "file_guid": str(guid)}
+            started = time.perf_counter()
+            response = client.post(
+                "/api/access/read/create",
+                json.dumps(body),
+                content_type="application/json",
+            )
+            results.append(
+                ("grant", response.status_code, time.perf_counter() - started)
+            )
+    finally:
+        connections.close_all()
+
+
+def run_mode(args) -> dict:
+    os.environ["SQLITE_MODE"] = args.mode
+    setup_django()
+    from django.db import connection
+
+    with scratch_environment():
+        create_user("grantee@example.com")
+        tokens = [
+            create_user(f"owner{index}@example.com")[1] for index in range(args.threads)
+        ]
+        # Every thread opens its own connection to the scratch database.
+        connection.close()
+        barrier = threading.Barrier(args.threads)
+        results = []
+        threads = [
+            threading.Thread(
+                target=worker, args=(index, args, tokens[index], barrier, results)
+            )
+            for index in range(args.threads)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        engine = connection.settings_dict["ENGINE"]
+
+    result = {"engine": engine, "elapsed_s": round(elapsed, 3)}
+    for operation in OPERATIONS:
+        statuses = {}
+        latencies = []
+        for kind, status, latency in results:
+            if kind != operation:
+                continue
+            statuses[status] = statuses.get(status, 0) + 1
+            latencies.append(latency)
+        succeeded = sum(count for status, count in statuses.items() if status < 300)
+        result[operation] = {
+            "statuses": statuses,
+            "succeeded": succeeded,
+            "throughput_rps": round(succeeded / elapsed, 2),
+            "latency": summarize(latencies),
+        }
+    return result
+
+
+def run_each_mode(args) -> dict:
+    results = {}
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as workdir:
+            output = os.path.join(workdir, "result.json")
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.sqlite_contention",
+                    f"--mode={mode}",
+                    f"--threads={args.threads}",
+                    f"--operations={args.operations}",
+                    f"--payload-bytes={args.payload_bytes}",
+                    f"--json={output}",
+                ],
+                check=True,
+            )
+            with open(output) as result:
+                results[mode] = json.load(result)["modes"][mode]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=25)
+    parser.add_argument("--payload-bytes", type=int, default=16 * 1024)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.mode == "both":
+        modes = run_each_mode(args)
+    else:
+        modes = {args.mode: run_mode(args)}
+    write_json({"config": vars(args), "modes": modes}, args.json)
+
+
+if __name__ == "__main__":
+    main()
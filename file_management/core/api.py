@@ -1,5 +1,33 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from ninja.constants import NOT_SET
 from ninja_jwt.controller import NinjaJWTDefaultController
-from ninja_extra import NinjaExtraAPI
+from ninja_extra import NinjaExtraAPI, api_controller, http_get
+
+from core.metrics import registry
 
 api = NinjaExtraAPI()
 api.register_controllers(NinjaJWTDefaultController)
+
+
+@api_controller("/metrics", tags=["Metrics"], auth=NOT_SET, permissions=[])
+class MetricsController:
+    @http_get("")
+    def metrics(self, request):
+        """
+        Request, SQL, storage and cache metrics of this process for Prometheus.
+        Requires METRICS_TOKEN as a bearer token, or DEBUG when none is set.
+        """
+        if not settings.METRICS_TOKEN:
+            if not settings.DEBUG:
+                return HttpResponse(status=403)
+        elif not hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            ("Bearer " + settings.METRICS_TOKEN).encode(),
+        ):
+            return HttpResponse(status=401)
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
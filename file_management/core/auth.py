@@ -1,12 +1,150 @@
-from ninja_jwt.tokens import RefreshToken
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.utils.functional import cached_property
+from ninja_extra.security import AsyncHttpBearer
+from ninja_jwt.authentication import JWTAuth
 from ninja_jwt.controller import NinjaJWTDefaultController
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.models import TokenUser
+from ninja_jwt.settings import api_settings
+from ninja_jwt.tokens import RefreshToken
+
+from core.cache import cache_stats
+from core.revocation import revocations
 
 jwt_controller = NinjaJWTDefaultController()
 
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
+    # Copied into the access token, so FastJWTAuth can build the user from them.
+    refresh['guid'] = str(user.guid)
+    refresh['is_verified'] = user.is_verified
 
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
     }
+
+
+class ClaimsUser(TokenUser):
+    """A TokenUser that also carries the ``guid`` and ``is_verified`` claims."""
+
+    @cached_property
+    def guid(self):
+        return uuid.UUID(self.token['guid'])
+
+    @cached_property
+    def is_verified(self) -> bool:
+        return self.token.get('is_verified', False)
+
+
+class UserCache:
+    """
+    Least recently used User rows, each trusted for ``ttl`` seconds. Writes
+    to a user evict their entry through ``invalidate_user``; the TTL bounds
+    how long other processes keep serving the old row.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.stats = cache_stats('auth-users')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self.stats.miss()
+                return None
+            self._entries.move_to_end(user_id)
+        self.stats.hit()
+        return entry[1]
+
+    def set(self, user_id, user) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_cache = UserCache(settings.JWT_USER_CACHE_SIZE, settings.JWT_USER_CACHE_TTL)
+
+
+def invalidate_user(user_id) -> None:
+    """Drop the cached row of ``user_id`` once the current transaction commits."""
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+class FastJWTAuth(JWTAuth):
+    """
+    JWTAuth without the per-request User query. In ``claims`` mode the user is
+    a ClaimsUser built from the token; tokens without a ``guid`` claim, and
+    every token in ``cached`` mode, resolve to a User row from ``user_cache``.
+    The mode defaults to ``settings.JWT_AUTH_MODE``.
+    """
+
+    def __init__(self, mode: str = None):
+        super().__init__()
+        self.mode = mode or settings.JWT_AUTH_MODE
+
+    def token_user(self, validated_token):
+        """The user ``validated_token`` stands for, if known without the DB."""
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if self.mode == 'claims' and 'guid' in validated_token:
+            return ClaimsUser(validated_token)
+        return user_cache.get(validated_token[api_settings.USER_ID_CLAIM])
+
+    def jwt_authenticate(self, request, token):
+        request.user = AnonymousUser()
+        validated_token = self.get_validated_token(token)
+        # Kept so logout can revoke the token the request was made with.
+        request.jwt_token = validated_token
+        user = self.get_user(validated_token)
+        request.user = user
+        return user
+
+    def get_user(self, validated_token):
+        if revocations.is_revoked(validated_token):
+            raise AuthenticationFailed('Token has been revoked')
+        user = self.token_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user.id, user)
+        return user
+
+
+class AsyncFastJWTAuth(FastJWTAuth, AsyncHttpBearer):
+    """
+    FastJWTAuth that only leaves the event loop on a user cache miss or when
+    the revocation list has to be read.
+    """
+
+    async def authenticate(self, request, token):
+        request.user = AnonymousUser()
+        validated_token = self.get_validated_token(token)
+        request.jwt_token = validated_token
+        user = None
+        if not revocations.needs_check(validated_token):
+            user = self.token_user(validated_token)
+        if user is None:
+            user = await sync_to_async(self.get_user)(validated_token)
+        request.user = user
+        return user
@@ -0,0 +1,97 @@
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for one named cache."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self, count: int = 1) -> None:
+        with self._lock:
+            self.hits += count
+
+    def miss(self, count: int = 1) -> None:
+        with self._lock:
+            self.misses += count
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+_stats = {}
+
+
+def cache_stats(name: str) -> CacheStats:
+    """Return the counters registered under ``name``, creating them if needed."""
+    if name not in _stats:
+        _stats.setdefault(name, CacheStats(name))
+    return _stats[name]
+
+
+def all_cache_stats() -> list:
+    return list(_stats.values())
+
+
+# Generations let a shared cache be invalidated without racing its readers.
+# Values are keyed by the generation of the object they were loaded for, and
+# a reader takes that generation before it reads the database. Invalidating
+# replaces the generation once the change commits, so a value loaded before
+# the commit lands under a generation nobody looks up any more instead of
+# being re-cached.
+
+
+def generation_key(kind: str, object_id) -> str:
+    return f"{kind}-generation:{object_id}"
+
+
+def _new_generations(keys) -> dict:
+    return {key: uuid.uuid4().hex[:12] for key in keys}
+
+
+def generations(alias: str, kind: str, object_ids, timeout=None) -> dict:
+    """
+    ``{object_id: generation}`` from cache ``alias``, starting one for objects
+    that have none. A generation that expires is replaced by a new one, which
+    only orphans the values stored under it.
+    """
+    cache = caches[alias]
+    keys = {generation_key(kind, object_id): object_id for object_id in object_ids}
+    found = cache.get_many(list(keys))
+    missing = _new_generations(key for key in keys if key not in found)
+    if missing:
+        cache.set_many(missing, timeout=timeout)
+        found.update(missing)
+    return {keys[key]: generation for key, generation in found.items()}
+
+
+async def agenerations(alias: str, kind: str, object_ids, timeout=None) -> dict:
+    cache = caches[alias]
+    keys = {generation_key(kind, object_id): object_id for object_id in object_ids}
+    found = await cache.aget_many(list(keys))
+    missing = _new_generations(key for key in keys if key not in found)
+    if missing:
+        await cache.aset_many(missing, timeout=timeout)
+        found.update(missing)
+    return {keys[key]: generation for key, generation in found.items()}
+
+
+def rotate_generations(alias: str, kind: str, object_ids, timeout=None) -> None:
+    """Replace the generations of ``object_ids`` once the transaction commits."""
+    keys = [generation_key(kind, object_id) for object_id in object_ids]
+    transaction.on_commit(
+        lambda: caches[alias].set_many(_new_generations(keys), timeout=timeout)
+    )
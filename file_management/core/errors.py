@@ -11,4 +11,10 @@ class NotFoundError(Exception):
 class UserError(Exception):
     def __init__(self, message):
         self.message = message
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+
+class BusyError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(message)
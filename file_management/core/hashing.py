@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from core.errors import BusyError
+
+
+class BoundedExecutor:
+    """
+    A thread pool that refuses work instead of queueing without limit: at most
+    ``workers`` jobs run and ``queue`` more wait, anything beyond raises
+    BusyError so the caller can shed load.
+    """
+
+    def __init__(self, workers: int, queue: int, name: str):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=name
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise BusyError("Too many requests are waiting, try again shortly")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+# PBKDF2 runs inside OpenSSL with the GIL released, so threads hash in
+# parallel while the event loop keeps serving other requests.
+hashing = BoundedExecutor(
+    settings.PASSWORD_HASHING_WORKERS,
+    settings.PASSWORD_HASHING_QUEUE,
+    "password-hashing",
+)
+
+
+def verify_password(user, password: str) -> bool:
+    """
+    Check ``password`` against ``user`` without touching the database. If the
+    stored hash is outdated it is replaced in memory; save the user after.
+    """
+    return check_password(password, user.password, setter=user.set_password)
+
+
+async def ahash_password(user, password: str) -> None:
+    """Set the password of an unsaved ``user`` on the hashing pool."""
+    await hashing.run(user.set_password, password)
+
+
+async def averify_password(user, password: str) -> bool:
+    """
+    ``verify_password`` on the hashing pool. Without a user, a password is
+    still hashed so unknown emails take as long as wrong passwords.
+    """
+    if user is None:
+        await hashing.run(make_password, password)
+        return False
+    return await hashing.run(verify_password, user, password)
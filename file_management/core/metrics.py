@@ -0,0 +1,273 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from ninja.renderers import JSONRenderer
+
+from core.cache import all_cache_stats
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """Time one request spent in SQL, storage I/O and response serialization."""
+
+    __slots__ = (
+        "queries",
+        "db_time",
+        "storage_bytes",
+        "storage_time",
+        "serialize_time",
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.storage_bytes = 0
+        self.storage_time = 0.0
+        self.serialize_time = 0.0
+
+
+_timings = ContextVar("request_timings", default=None)
+
+
+def begin():
+    """Start timing a request; pass the returned token to ``end``."""
+    timings = RequestTimings()
+    return timings, _timings.set(timings)
+
+
+def end(token) -> None:
+    _timings.reset(token)
+
+
+def time_queries(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request."""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs) -> None:
+    """connection_created receiver; the wrapper outlives reconnects."""
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class StorageIO:
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+@contextmanager
+def storage_io():
+    """
+    Time the storage work in the block; add the bytes it moves to the
+    yielded object's ``bytes``.
+    """
+    io = StorageIO()
+    started = time.perf_counter()
+    try:
+        yield io
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            timings.storage_time += time.perf_counter() - started
+            timings.storage_bytes += io.bytes
+
+
+@contextmanager
+def serializing():
+    """Count the block as response serialization of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            timings.serialize_time += time.perf_counter() - started
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """Counts encoding every ninja response body as serialization."""
+
+    def render(self, request, data, *, response_status):
+        with serializing():
+            return super().render(request, data, response_status=response_status)
+
+
+class RouteMetrics:
+    __slots__ = (
+        "buckets",
+        "count",
+        "seconds",
+        "statuses",
+        "queries",
+        "db_time",
+        "storage_bytes",
+        "storage_time",
+        "serialize_time",
+    )
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.statuses = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.storage_bytes = 0
+        self.storage_time = 0.0
+        self.serialize_time = 0.0
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+def _number(value) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+# Per-route counters: metric name, RouteMetrics attribute, help text.
+ROUTE_COUNTERS = (
+    ("db_queries_total", "queries", "SQL queries run by route."),
+    ("db_query_seconds_total", "db_time", "Time spent in SQL by route."),
+    (
+        "storage_io_bytes_total",
+        "storage_bytes",
+        "Storage bytes read or written by route.",
+    ),
+    ("storage_io_seconds_total", "storage_time", "Time spent in storage I/O by route."),
+    (
+        "serialization_seconds_total",
+        "serialize_time",
+        "Time spent encoding responses by route.",
+    ),
+)
+CACHE_COUNTERS = (
+    ("cache_hits_total", "hits", "Lookup cache hits."),
+    ("cache_misses_total", "misses", "Lookup cache misses."),
+)
+
+
+class MetricsRegistry:
+    """
+    Per-route request counts, latency histograms and the SQL, storage and
+    serialization totals of this process. Routes are URL patterns, so the
+    number of series stays bounded whatever the request paths are.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, method, route, status, seconds, timings) -> None:
+        # Buckets are stored non-cumulatively and summed when rendered.
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            if bucket < len(BUCKETS):
+                metrics.buckets[bucket] += 1
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.queries += timings.queries
+            metrics.db_time += timings.db_time
+            metrics.storage_bytes += timings.storage_bytes
+            metrics.storage_time += timings.storage_time
+            metrics.serialize_time += timings.serialize_time
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes = {}
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP http_request_duration_seconds Request latency by route.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), metrics in routes:
+                labels = _labels(method=method, route=route)
+                total = 0
+                for bound, count in zip(BUCKETS, metrics.buckets):
+                    total += count
+                    lines.append(
+                        'http_request_duration_seconds_bucket{%s,le="%s"} %d'
+                        % (labels, bound, total)
+                    )
+                lines += [
+                    'http_request_duration_seconds_bucket{%s,le="+Inf"} %d'
+                    % (labels, metrics.count),
+                    "http_request_duration_seconds_sum{%s} %s"
+                    % (labels, _number(metrics.seconds)),
+                    "http_request_duration_seconds_count{%s} %d"
+                    % (labels, metrics.count),
+                ]
+            lines += [
+                "# HELP http_responses_total Responses by route and status.",
+                "# TYPE http_responses_total counter",
+            ]
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        "http_responses_total{%s} %d"
+                        % (_labels(method=method, route=route, status=status), count)
+                    )
+            for name, attribute, description in ROUTE_COUNTERS:
+                lines += [
+                    f"# HELP {name} {description}",
+                    f"# TYPE {name} counter",
+                ]
+                for (method, route), metrics in routes:
+                    lines.append(
+                        "%s{%s} %s"
+                        % (
+                            name,
+                            _labels(method=method, route=route),
+                            _number(getattr(metrics, attribute)),
+                        )
+                    )
+        for name, attribute, description in CACHE_COUNTERS:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for stats in all_cache_stats():
+                lines.append(
+                    "%s{%s} %d"
+                    % (name, _labels(cache=stats.name), getattr(stats, attribute))
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    """The Server-Timing header value for one request; durations in ms."""
+    return ", ".join(
+        (
+            'db;dur=%.2f;desc="%d queries"' % (timings.db_time * 1000, timings.queries),
+            'storage;dur=%.2f;desc="%d bytes"'
+            % (timings.storage_time * 1000, timings.storage_bytes),
+            "serialize;dur=%.2f" % (timings.serialize_time * 1000),
+            "total;dur=%.2f" % (total * 1000),
+        )
+    )
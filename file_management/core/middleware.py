@@ -0,0 +1,143 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core import metrics, routers
+
+
+class MultipartPutMiddleware:
+    """
+    Django only parses multipart bodies for POST. Parse them for PUT and PATCH
+    too so form and file parameters work on update endpoints.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.parse_multipart(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.parse_multipart(request)
+        return await self.get_response(request)
+
+    def parse_multipart(self, request):
+        if request.method in ("PUT", "PATCH") and request.content_type == (
+            "multipart/form-data"
+        ):
+            method = request.method
+            request.method = "POST"
+            request._load_post_and_files()
+            request.method = method
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let safe (GET, HEAD) requests read from replicas through ReplicaRouter. A
+    request that writes sets a cookie keeping the client's reads on the
+    primary for ``REPLICA_STICKY_SECONDS``, so it sees its own writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = "db_pin"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = routers.begin(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state, token = routers.begin(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end(token)
+        return self.pin(state, response)
+
+    def use_replica(self, request) -> bool:
+        return (
+            request.method in ("GET", "HEAD")
+            and self.cookie_name not in request.COOKIES
+        )
+
+    def pin(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request and record it under its URL pattern in
+    ``metrics.registry``, with the SQL, storage and serialization time it
+    used. Adds a Server-Timing header when ``METRICS_SERVER_TIMING`` is set.
+    Streamed response bodies are sent after this returns and are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        timings, token = metrics.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end(token)
+        return self.record(request, response, timings, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings, token = metrics.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end(token)
+        return self.record(request, response, timings, started)
+
+    def record(self, request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        metrics.registry.observe(
+            request.method,
+            match.route if match else "unmatched",
+            response.status_code,
+            elapsed,
+            timings,
+        )
+        if settings.METRICS_SERVER_TIMING:
+            response["Server-Timing"] = metrics.server_timing(timings, elapsed)
+        return response
@@ -0,0 +1,165 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ninja_jwt.settings import api_settings
+
+from core.cache import cache_stats
+from user.models import RevokedToken
+
+
+class BloomFilter:
+    """Set membership with false positives at about ``error_rate``, never negatives."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationList:
+    """
+    Revoked tokens, fronted by a Bloom filter of their ``jti``. A token whose
+    ``jti`` misses the filter is accepted without I/O; only filter hits are
+    confirmed against RevokedToken. Blanket revocations of a user are few, so
+    their cut-off times are kept exactly.
+
+    Revocations made in this process are added at commit. Those made by other
+    processes are picked up at most every ``JWT_REVOCATION_REFRESH`` seconds
+    by reading the rows created since the last refresh, minus
+    ``JWT_REVOCATION_OVERLAP`` seconds: a row becomes visible when its
+    transaction commits, which can be well after its ``created_at`` and after
+    rows created later.
+    """
+
+    def __init__(self):
+        self.stats = cache_stats("token-revocation")
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._filter = BloomFilter(
+            settings.JWT_REVOCATION_CAPACITY, settings.JWT_REVOCATION_ERROR_RATE
+        )
+        self._revoked_before = {}
+        self._count = 0
+        # Ids of rows already added that the overlap window still returns.
+        self._seen = {}
+        self._since = None
+        self._next_refresh = 0.0
+
+    def _add(self, jti, user_id=None, issued_before=None) -> None:
+        with self._lock:
+            if jti:
+                self._filter.add(jti)
+                self._count += 1
+                return
+            cutoff = issued_before.timestamp()
+            self._revoked_before[user_id] = max(
+                cutoff, self._revoked_before.get(user_id, cutoff)
+            )
+
+    def due(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+
+    def refresh(self) -> None:
+        """Add the rows created since the last refresh to the filter."""
+        with self._lock:
+            # Expired rows are never removed from the filter, so it is rebuilt
+            # from the live rows once it holds more keys than it was sized for.
+            if self._count > settings.JWT_REVOCATION_CAPACITY:
+                self._reset()
+            now = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=now)
+            if self._since is not None:
+                overlap = timedelta(seconds=settings.JWT_REVOCATION_OVERLAP)
+                window = self._since - overlap
+                rows = rows.filter(created_at__gte=window)
+                self._seen = {
+                    row_id: created_at
+                    for row_id, created_at in self._seen.items()
+                    if created_at >= window
+                }
+            for row_id, jti, user_id, issued_before, created_at in rows.values_list(
+                "id", "jti", "user_id", "issued_before", "created_at"
+            ):
+                if row_id not in self._seen:
+                    self._seen[row_id] = created_at
+                    self._add(jti, user_id, issued_before)
+            self._since = now
+            self._next_refresh = time.monotonic() + settings.JWT_REVOCATION_REFRESH
+
+    def needs_check(self, validated_token) -> bool:
+        """Whether ``is_revoked`` has more to do than a Bloom filter miss."""
+        return (
+            self.due()
+            or validated_token.get(api_settings.USER_ID_CLAIM) in self._revoked_before
+            or validated_token.get(api_settings.JTI_CLAIM) in self._filter
+        )
+
+    def is_revoked(self, validated_token) -> bool:
+        if self.due():
+            self.refresh()
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if validated_token.get("iat", 0) < self._revoked_before.get(user_id, 0):
+            return True
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti not in self._filter:
+            self.stats.hit()
+            return False
+        self.stats.miss()
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke_token(self, validated_token) -> None:
+        """Revoke one token, e.g. the one a client logs out with."""
+        jti = validated_token[api_settings.JTI_CLAIM]
+        RevokedToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "user_id": validated_token[api_settings.USER_ID_CLAIM],
+                "expires_at": datetime.fromtimestamp(
+                    validated_token["exp"], dt_timezone.utc
+                ),
+            },
+        )
+        transaction.on_commit(lambda: self._add(jti))
+
+    def revoke_user(self, user_id) -> None:
+        """
+        Revoke every token issued to the user before now. ``iat`` has second
+        precision, so tokens issued earlier in the current second survive.
+        """
+        now = timezone.now().replace(microsecond=0)
+        lifetime = max(
+            api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME
+        )
+        RevokedToken.objects.create(
+            user_id=user_id, issued_before=now, expires_at=now + lifetime
+        )
+        transaction.on_commit(lambda: self._add(None, user_id, now))
+
+
+revocations = RevocationList()
@@ -0,0 +1,56 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class RoutingState:
+    """Per-request routing flags, shared by every thread the request runs on."""
+
+    def __init__(self, use_replica: bool):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+_state = ContextVar("db_routing", default=None)
+
+
+def begin(use_replica: bool):
+    """Start routing a request; pass the returned token to ``end``."""
+    state = RoutingState(use_replica)
+    return state, _state.set(state)
+
+
+def end(token) -> None:
+    _state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads to a random ``REPLICA_DATABASES`` alias while the current
+    request allows it (see ReplicaRoutingMiddleware), and everything else to
+    the primary. Reads inside a transaction, and every read after the request
+    has written, stay on the primary so they see its writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
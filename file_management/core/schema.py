@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 from pydantic import UUID4, BaseModel
 
 
@@ -21,7 +22,15 @@ class BaseSchema(BaseModel):
 class CustomPaginationSchema(BaseModel):
     page: int  # Current page number
     size: int  # Number of items per page
-    total_items: int  # Total number of items
-    total_pages: int  # Total number of pages
+    total_items: Optional[int] = None  # Total number of items, if counted
+    total_pages: Optional[int] = None  # Total number of pages, if counted
     has_next: bool  # Whether there is a next page
-    has_prev: bool  # Whether there is a previous page
\ No newline at end of file
+    has_prev: bool  # Whether there is a previous page
+    next_cursor: Optional[str] = None  # Pass as ``after`` to fetch the next page
+
+
+class CacheStatsSchema(BaseModel):
+    name: str
+    hits: int
+    misses: int
+    hit_rate: float
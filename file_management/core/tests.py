@@ -1,3 +1,211 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+
+from core import routers
+from core.auth import get_tokens_for_user
+from core.errors import BusyError
+from core.hashing import BoundedExecutor
+from core.middleware import ReplicaRoutingMiddleware
+from user.models import User
+
+
+class BoundedExecutorTests(SimpleTestCase):
+    def test_refuses_work_beyond_the_queue(self):
+        executor = BoundedExecutor(workers=1, queue=1, name="test")
+        release = threading.Event()
+        running = [executor.submit(release.wait) for _ in range(2)]
+        with self.assertRaises(BusyError):
+            executor.submit(release.wait)
+        release.set()
+        for future in running:
+            future.result()
+        self.assertTrue(executor.submit(lambda: True).result())
+
+
+class AsyncLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="async@example.com", name="async", password="pw-123456!"
+        )
+        User.objects.filter(pk=cls.user.pk).update(is_verified=True)
+
+    async def login(self):
+        return await self.async_client.post(
+            "/api/async/auth/login",
+            json.dumps({"email": self.user.email, "password": "pw-123456!"}),
+            content_type="application/json",
+        )
+
+    async def test_login(self):
+        response = await self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["token"])
+
+    async def test_saturated_hashing_pool_sheds_logins(self):
+        pool = BoundedExecutor(workers=1, queue=0, name="test-hashing")
+        release = threading.Event()
+        busy = pool.submit(release.wait)
+        self.addCleanup(busy.result)
+        self.addCleanup(release.set)
+        with mock.patch("core.hashing.hashing", pool):
+            response = await self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(
+            response.json()["message"],
+            "Too many requests are waiting, try again shortly",
+        )
+
+
+class MetricsExposureTests(SimpleTestCase):
+    def scrape(self, token=None):
+        headers = {"HTTP_AUTHORIZATION": "Bearer " + token} if token else {}
+        return self.client.get("/api/metrics", **headers)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_refused_without_a_token_outside_debug(self):
+        self.assertEqual(self.scrape().status_code, 403)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_open_under_debug_without_a_token(self):
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN="scrape", DEBUG=True)
+    def test_token_is_required_once_set(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape("wrong").status_code, 401)
+        self.assertEqual(self.scrape("scrape").status_code, 200)
+
+    @override_settings(METRICS_SERVER_TIMING=False, METRICS_TOKEN="scrape")
+    def test_no_server_timing_unless_enabled(self):
+        self.assertNotIn("Server-Timing", self.scrape("scrape"))
+
+
+@override_settings(REPLICA_DATABASES=["replica"])
+class ReplicaRouterTests(SimpleTestCase):
+    router = routers.ReplicaRouter()
+
+    def route(self, use_replica=True, wrote=False):
+        state, token = routers.begin(use_replica)
+        self.addCleanup(routers.end, token)
+        if wrote:
+            self.router.db_for_write(User)
+        return self.router.db_for_read(User)
+
+    def test_reads_outside_a_request_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.route(), "replica")
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        self.assertEqual(self.route(wrote=True), DEFAULT_DB_ALIAS)
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.route(use_replica=False), DEFAULT_DB_ALIAS)
+
+    def test_reads_in_a_transaction_use_the_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", True):
+            self.assertEqual(self.route(), DEFAULT_DB_ALIAS)
+
+
+@override_settings(REPLICA_DATABASES=["replica"], REPLICA_STICKY_SECONDS=7)
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    router = routers.ReplicaRouter()
+
+    def call(self, request, write=False):
+        """Run ``request`` through the middleware; return (read alias, response)."""
+        routed = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(User)
+            routed.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return routed[0], response
+
+    def test_get_reads_from_the_replica_without_pinning(self):
+        alias, response = self.call(RequestFactory().get("/"))
+        self.assertEqual(alias, "replica")
+        self.assertNotIn("db_pin", response.cookies)
+
+    def test_write_pins_the_client_to_the_primary(self):
+        alias, response = self.call(RequestFactory().post("/"), write=True)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+        cookie = response.cookies["db_pin"]
+        self.assertEqual(cookie["max-age"], 7)
+        self.assertTrue(cookie["httponly"])
+
+    def test_pinned_client_reads_from_the_primary(self):
+        request = RequestFactory().get("/")
+        request.COOKIES["db_pin"] = "1"
+        alias, _ = self.call(request)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+
+@skipUnless(
+    "replica" in settings.DATABASES, "needs DB_ENGINE=sqlite-replica or replica hosts"
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    End to end on the replica profile, whose replica mirrors the test
+    database. Reads inside a transaction never go to a replica, so this
+    cannot run in TestCase's per-test transaction.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = User.objects.create_user(
+            email="replica@example.com", name="replica", password="pw-123456!"
+        )
+        token = get_tokens_for_user(self.user)["access"]
+        self.headers = {"HTTP_AUTHORIZATION": "Bearer " + token}
+
+    def replica_queries(self, method, path, **extra):
+        replica = connections[settings.REPLICA_DATABASES[0]]
+        with CaptureQueriesContext(replica) as queries:
+            response = getattr(self.client, method)(path, **self.headers, **extra)
+        return response, len(queries)
+
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        response, queries = self.replica_queries("get", "/api/file/list")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+        self.assertNotIn("db_pin", self.client.cookies)
+
+        response, _ = self.replica_queries(
+            "post",
+            "/api/file/upload/session",
+            data={"file_name": "a.bin", "total_size": 0},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("db_pin", response.cookies)
+
+        # The test client sends the cookie back, keeping reads on the primary.
+        response, queries = self.replica_queries("get", "/api/file/list")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
@@ -0,0 +1,536 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.cache import agenerations, cache_stats, generations, rotate_generations
+from file.models import File, FileAccess, FileChange, UserFileIndex
+from user.models import TeamMembership
+
+PERMISSION_LABELS = {
+    FileAccess.READ: "read",
+    FileAccess.WRITE: "write",
+    FileAccess.DELETE: "delete",
+}
+
+# Resolved masks are memoized on the request and shared across requests
+# through the "permissions" cache. Every write to FileAccess goes through this
+# module and invalidates the affected files once its transaction commits. The
+# same writes keep the UserFileIndex listing table and FileChange journal in
+# step.
+#
+# A user's effective mask on a file is the OR of their own grant and those of
+# their teams, read in one query on FileAccess. Keys carry a generation of the
+# user (for their team ids) and of the file (see core.cache.generations):
+# invalidating replaces the generation instead of deleting keys, so a value
+# loaded before a change commits is never re-cached. Those loads always read
+# the primary: a lagging replica would hand back the rows from before a
+# change, to be cached under the generation it started.
+PERMISSION_CACHE = "permissions"
+stats = cache_stats(PERMISSION_CACHE)
+
+
+def _principals_key(user_id, generation) -> str:
+    return f"principals:{user_id}:{generation}"
+
+
+def _cache_key(user_id, user_generation, file_id, file_generation) -> str:
+    return f"file-perms:{user_id}:{user_generation}:{file_id}:{file_generation}"
+
+
+_generations = partial(generations, PERMISSION_CACHE)
+_agenerations = partial(agenerations, PERMISSION_CACHE)
+_rotate = partial(rotate_generations, PERMISSION_CACHE)
+
+
+def _request_memo(request) -> dict:
+    if request is None:
+        return {}
+    if not hasattr(request, "_file_perms"):
+        request._file_perms = {}
+    return request._file_perms
+
+
+def _load_team_ids(user_id) -> list:
+    return list(
+        TeamMembership.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .values_list("team_id", flat=True)
+    )
+
+
+def principals(user_id, request=None):
+    """
+    ``(generation, team_ids)`` for ``user_id``, cached until membership
+    changes.
+    """
+    memo = _request_memo(request)
+    if "principals" in memo:
+        return memo["principals"]
+    generation = _generations("user", [user_id])[user_id]
+    cache = caches[PERMISSION_CACHE]
+    teams = cache.get(_principals_key(user_id, generation))
+    if teams is None:
+        teams = _load_team_ids(user_id)
+        cache.set(_principals_key(user_id, generation), teams)
+    memo["principals"] = (generation, teams)
+    return memo["principals"]
+
+
+def team_ids(user_id, request=None) -> list:
+    return principals(user_id, request)[1]
+
+
+def _grants_of(user_id, teams, file_ids):
+    access = FileAccess.objects.using(DEFAULT_DB_ALIAS).filter(file_id__in=file_ids)
+    if teams:
+        return access.filter(Q(user_id=user_id) | Q(team_id__in=teams))
+    return access.filter(user_id=user_id)
+
+
+def _load_perms(user_id, teams, file_id) -> int:
+    perms = 0
+    for mask in _grants_of(user_id, teams, [file_id]).values_list("perms", flat=True):
+        perms |= mask
+    return perms
+
+
+def get_perms(user_id, file_id, request=None) -> int:
+    """The permission bitmask ``user_id`` holds on ``file_id``, via any team."""
+    memo = _request_memo(request)
+    if (user_id, file_id) in memo:
+        return memo[(user_id, file_id)]
+    token, teams = principals(user_id, request)
+    generation = _generations("file", [file_id])[file_id]
+    key = _cache_key(user_id, token, file_id, generation)
+    cache = caches[PERMISSION_CACHE]
+    perms = cache.get(key)
+    if perms is None:
+        stats.miss()
+        perms = _load_perms(user_id, teams, file_id)
+        cache.set(key, perms)
+    else:
+        stats.hit()
+    memo[(user_id, file_id)] = perms
+    return perms
+
+
+def get_perms_many(user_id, file_ids, request=None) -> dict:
+    """
+    ``{file_id: mask}`` for many files, from the cache where possible and one
+    FileAccess query for the rest.
+    """
+    memo = _request_memo(request)
+    token, teams = principals(user_id, request)
+    generations = _generations(
+        "file", [file_id for file_id in file_ids if (user_id, file_id) not in memo]
+    )
+    cache = caches[PERMISSION_CACHE]
+    keys = {
+        _cache_key(user_id, token, file_id, generation): file_id
+        for file_id, generation in generations.items()
+    }
+    cached = cache.get_many(list(keys))
+    loaded = {file_id: 0 for key, file_id in keys.items() if key not in cached}
+    stats.hit(len(cached))
+    stats.miss(len(loaded))
+    if loaded:
+        for file_id, mask in _grants_of(user_id, teams, list(loaded)).values_list(
+            "file_id", "perms"
+        ):
+            loaded[file_id] |= mask
+        cache.set_many(
+            {
+                _cache_key(user_id, token, file_id, generations[file_id]): mask
+                for file_id, mask in loaded.items()
+            }
+        )
+    for key, mask in cached.items():
+        memo[(user_id, keys[key])] = mask
+    for file_id, mask in loaded.items():
+        memo[(user_id, file_id)] = mask
+    return {file_id: memo[(user_id, file_id)] for file_id in file_ids}
+
+
+def has_perm(user_id, file_id, perm: int, request=None) -> bool:
+    return get_perms(user_id, file_id, request) & perm == perm
+
+
+def invalidate(file_ids) -> None:
+    """Drop every cached mask on ``file_ids`` after commit."""
+    _rotate("file", file_ids)
+
+
+def invalidate_file(file_id) -> None:
+    """Drop every cached mask on ``file_id``, whoever it was resolved for."""
+    invalidate([file_id])
+
+
+def invalidate_principals(user_id) -> None:
+    """Forget ``user_id``'s teams and with them every mask cached for the user."""
+    _rotate("user", [user_id])
+
+
+def index_rows(file_ids, user_ids=None, team_ids=None) -> list:
+    """
+    The UserFileIndex rows ``file_ids`` should have, computed from File and
+    FileAccess: owners always see their files, other users and teams need
+    READ. Given ``user_ids`` or ``team_ids``, only those principals' rows.
+    """
+    scoped = user_ids is not None or team_ids is not None
+    access = FileAccess.objects.filter(file_id__in=file_ids)
+    if scoped:
+        access = access.filter(
+            Q(user_id__in=user_ids or []) | Q(team_id__in=team_ids or [])
+        )
+    perms = {}
+    for file_id, user_id, team_id, mask in access.values_list(
+        "file_id", "user_id", "team_id", "perms"
+    ):
+        if user_id is not None or team_id is not None:
+            perms.setdefault(file_id, {})[(user_id, team_id)] = mask
+    rows = []
+    for file_id, owner_id, created_at, file_name in File.objects.filter(
+        id__in=file_ids, is_deleted=False
+    ).values_list("id", "file_owner_id", "created_at", "file_name"):
+        granted = perms.get(file_id, {})
+        visible = {
+            principal: mask
+            for principal, mask in granted.items()
+            if mask & FileAccess.READ
+        }
+        if owner_id is not None and (not scoped or owner_id in (user_ids or [])):
+            visible[(owner_id, None)] = granted.get((owner_id, None), 0)
+        rows.extend(
+            UserFileIndex(
+                user_id=user_id,
+                team_id=team_id,
+                file_id=file_id,
+                perms=mask,
+                created_at=created_at,
+                file_name=file_name,
+            )
+            for (user_id, team_id), mask in visible.items()
+        )
+    return rows
+
+
+def _upsert_index(rows) -> None:
+    for principal in ("user", "team"):
+        UserFileIndex.objects.bulk_create(
+            [row for row in rows if getattr(row, principal + "_id") is not None],
+            update_conflicts=True,
+            unique_fields=[principal, "file"],
+            update_fields=["perms", "created_at", "file_name"],
+        )
+
+
+def _principal_order(principal) -> tuple:
+    user_id, team_id = principal
+    return (user_id or 0, team_id or 0)
+
+
+def refresh_index(file_id, user_ids=None, action: str = None, team_ids=None) -> None:
+    """
+    Bring the UserFileIndex rows of ``file_id`` (only those of ``user_ids``
+    and ``team_ids`` when either is given) in line with File and FileAccess.
+    Call it in the transaction that changed them, after the change. With
+    ``action``, the event is journaled for every user or team that could see
+    the file before or after it.
+    """
+    current = UserFileIndex.objects.filter(file_id=file_id)
+    if user_ids is not None or team_ids is not None:
+        current = current.filter(
+            Q(user_id__in=user_ids or []) | Q(team_id__in=team_ids or [])
+        )
+    before = {
+        (user_id, team_id): row_id
+        for row_id, user_id, team_id in current.values_list("id", "user_id", "team_id")
+    }
+    rows = index_rows([file_id], user_ids, team_ids)
+    after = {(row.user_id, row.team_id) for row in rows}
+    stale = [row_id for principal, row_id in before.items() if principal not in after]
+    if stale:
+        UserFileIndex.objects.filter(id__in=stale).delete()
+    _upsert_index(rows)
+    if action:
+        FileChange.objects.bulk_create(
+            FileChange(
+                user_id=user_id,
+                team_id=team_id,
+                file_id=file_id,
+                action=action,
+                visible=(user_id, team_id) in after,
+            )
+            for user_id, team_id in sorted(before.keys() | after, key=_principal_order)
+        )
+
+
+def refresh_index_pairs(actions: dict) -> None:
+    """
+    ``refresh_index`` for many ``(file_id, user_id)`` pairs at once, each
+    journaled with its own action from ``actions``.
+    """
+    file_ids = {file_id for file_id, _ in actions}
+    user_ids = {user_id for _, user_id in actions}
+    current = {
+        (file_id, user_id): row_id
+        for row_id, file_id, user_id in UserFileIndex.objects.filter(
+            file_id__in=file_ids, user_id__in=user_ids
+        ).values_list("id", "file_id", "user_id")
+        if (file_id, user_id) in actions
+    }
+    rows = [
+        row
+        for row in index_rows(file_ids, user_ids)
+        if (row.file_id, row.user_id) in actions
+    ]
+    after = {(row.file_id, row.user_id) for row in rows}
+    UserFileIndex.objects.filter(
+        id__in=[row_id for key, row_id in current.items() if key not in after]
+    ).delete()
+    _upsert_index(rows)
+    FileChange.objects.bulk_create(
+        FileChange(
+            user_id=user_id,
+            file_id=file_id,
+            action=actions[(file_id, user_id)],
+            visible=(file_id, user_id) in after,
+        )
+        for file_id, user_id in sorted(current.keys() | after)
+    )
+
+
+def bump_acl_version(file_id) -> None:
+    """Move the file's ACL validators so cached details revalidate."""
+    File.objects.filter(id=file_id).update(
+        acl_version=F("acl_version") + 1, acl_updated_at=timezone.now()
+    )
+
+
+def _change(file_id, perms: int, is_grant: bool, user_id=None, team_id=None):
+    principal = {"user_id": user_id} if team_id is None else {"team_id": team_id}
+    with transaction.atomic():
+        if is_grant:
+            access, created = FileAccess.objects.select_for_update().get_or_create(
+                file_id=file_id, **principal, defaults={"perms": perms}
+            )
+            if not created:
+                if access.perms & perms == perms:
+                    return False
+                access.perms |= perms
+                access.save(update_fields=["perms"])
+        else:
+            access = (
+                FileAccess.objects.select_for_update()
+                .filter(file_id=file_id, **principal)
+                .first()
+            )
+            if access is None or not access.perms & perms:
+                return False
+            access.perms &= ~perms
+            access.save(update_fields=["perms"])
+        action = FileChange.GRANTED if is_grant else FileChange.REVOKED
+        bump_acl_version(file_id)
+        invalidate_file(file_id)
+        if team_id is None:
+            refresh_index(file_id, [user_id], action)
+        else:
+            refresh_index(file_id, action=action, team_ids=[team_id])
+    return True
+
+
+def grant(file_id, user_id, perms: int) -> bool:
+    """Add ``perms`` for the user. Returns False if they were already held."""
+    return _change(file_id, perms, True, user_id=user_id)
+
+
+def revoke(file_id, user_id, perms: int) -> bool:
+    """Remove ``perms`` from the user. Returns False if none were held."""
+    return _change(file_id, perms, False, user_id=user_id)
+
+
+def grant_team(file_id, team_id, perms: int) -> bool:
+    """Add ``perms`` for every member of the team, as one FileAccess row."""
+    return _change(file_id, perms, True, team_id=team_id)
+
+
+def revoke_team(file_id, team_id, perms: int) -> bool:
+    return _change(file_id, perms, False, team_id=team_id)
+
+
+def _journal_membership(team_id, user_id, action: str) -> None:
+    """
+    Journal ``action`` for the user on every file the team can see. The
+    team's own journal rows reach members only while they belong to it, so
+    without these a new member would never hear of files shared before they
+    joined, nor a leaving one that those files went away.
+    """
+    file_ids = sorted(
+        UserFileIndex.objects.filter(team_id=team_id).values_list("file_id", flat=True)
+    )
+    if not file_ids:
+        return
+    teams = _load_team_ids(user_id)
+    visible = set(
+        UserFileIndex.objects.filter(file_id__in=file_ids)
+        .filter(Q(user_id=user_id) | Q(team_id__in=teams))
+        .values_list("file_id", flat=True)
+    )
+    FileChange.objects.bulk_create(
+        FileChange(
+            user_id=user_id, file_id=file_id, action=action, visible=file_id in visible
+        )
+        for file_id in file_ids
+    )
+
+
+def add_member(team_id, user_id) -> bool:
+    """
+    Add the user to the team. Their cached team ids are dropped and the
+    team's files are journaled to them as granted. Returns False if they were
+    already a member.
+    """
+    with transaction.atomic():
+        _, created = TeamMembership.objects.get_or_create(
+            team_id=team_id, user_id=user_id
+        )
+        if created:
+            invalidate_principals(user_id)
+            _journal_membership(team_id, user_id, FileChange.GRANTED)
+    return created
+
+
+def remove_member(team_id, user_id) -> bool:
+    """
+    Remove the user from the team; the team's files are journaled to them as
+    revoked, visible if they can still see one some other way.
+    """
+    with transaction.atomic():
+        deleted, _ = TeamMembership.objects.filter(
+            team_id=team_id, user_id=user_id
+        ).delete()
+        if deleted:
+            invalidate_principals(user_id)
+            _journal_membership(team_id, user_id, FileChange.REVOKED)
+    return bool(deleted)
+
+
+def bulk_change(changes) -> list:
+    """
+    Apply ``(file_id, user_id, perms, is_grant)`` changes in order, in one
+    transaction, with one bulk insert and one bulk update. Returns whether
+    each change did anything, like ``grant`` and ``revoke`` do.
+    """
+    if not changes:
+        return []
+    with transaction.atomic():
+        accesses = {
+            (access.file_id, access.user_id): access
+            for access in FileAccess.objects.select_for_update().filter(
+                file_id__in={change[0] for change in changes},
+                user_id__in={change[1] for change in changes},
+            )
+        }
+        before = {key: access.perms for key, access in accesses.items()}
+        results = []
+        for file_id, user_id, perms, is_grant in changes:
+            access = accesses.get((file_id, user_id))
+            if access is None:
+                if not is_grant:
+                    results.append(False)
+                    continue
+                access = FileAccess(file_id=file_id, user_id=user_id, perms=0)
+                accesses[(file_id, user_id)] = access
+            held = access.perms
+            access.perms = held | perms if is_grant else held & ~perms
+            results.append(access.perms != held)
+
+        FileAccess.objects.bulk_create(
+            [
+                access
+                for key, access in accesses.items()
+                if key not in before and access.perms
+            ]
+        )
+        FileAccess.objects.bulk_update(
+            [
+                access
+                for key, access in accesses.items()
+                if key in before and access.perms != before[key]
+            ],
+            ["perms"],
+        )
+        actions = {
+            key: (
+                FileChange.GRANTED
+                if access.perms & ~before.get(key, 0)
+                else FileChange.REVOKED
+            )
+            for key, access in accesses.items()
+            if access.perms != before.get(key, 0)
+        }
+        if actions:
+            file_ids = {file_id for file_id, _ in actions}
+            invalidate(file_ids)
+            File.objects.filter(id__in=file_ids).update(
+                acl_version=F("acl_version") + 1, acl_updated_at=timezone.now()
+            )
+            refresh_index_pairs(actions)
+    return results
+
+
+async def aprincipals(user_id, request=None):
+    memo = _request_memo(request)
+    if "principals" in memo:
+        return memo["principals"]
+    generation = (await _agenerations("user", [user_id]))[user_id]
+    cache = caches[PERMISSION_CACHE]
+    teams = await cache.aget(_principals_key(user_id, generation))
+    if teams is None:
+        teams = [
+            team_id
+            async for team_id in TeamMembership.objects.using(DEFAULT_DB_ALIAS)
+            .filter(user_id=user_id)
+            .values_list("team_id", flat=True)
+        ]
+        await cache.aset(_principals_key(user_id, generation), teams)
+    memo["principals"] = (generation, teams)
+    return memo["principals"]
+
+
+async def aget_perms(user_id, file_id, request=None) -> int:
+    memo = _request_memo(request)
+    if (user_id, file_id) in memo:
+        return memo[(user_id, file_id)]
+    token, teams = await aprincipals(user_id, request)
+    generation = (await _agenerations("file", [file_id]))[file_id]
+    key = _cache_key(user_id, token, file_id, generation)
+    cache = caches[PERMISSION_CACHE]
+    perms = await cache.aget(key)
+    if perms is None:
+        stats.miss()
+        perms = 0
+        async for mask in _grants_of(user_id, teams, [file_id]).values_list(
+            "perms", flat=True
+        ):
+            perms |= mask
+        await cache.aset(key, perms)
+    else:
+        stats.hit()
+    memo[(user_id, file_id)] = perms
+    return perms
+
+
+async def ahas_perm(user_id, file_id, perm: int, request=None) -> bool:
+    return await aget_perms(user_id, file_id, request) & perm == perm
+
+
+agrant = sync_to_async(grant)
+arevoke = sync_to_async(revoke)
+abulk_change = sync_to_async(bulk_change)
+agrant_team = sync_to_async(grant_team)
+arevoke_team = sync_to_async(revoke_team)
@@ -1,17 +1,33 @@
 from django.contrib import admin
+from django.utils import timezone
 
-from file.models import DeleteAccess, File, ReadAccess, WriteAccess
+from file.access import bump_acl_version, invalidate_file, refresh_index
+from file.models import Blob, File, FileAccess, FileChange
+from file.search import queue_index
 
-class ReadAccessInline(admin.TabularInline):
-    model = ReadAccess
-
-class WriteAccessInline(admin.TabularInline):
-    model = WriteAccess
-
-class DeleteAccessInline(admin.TabularInline):
-    model = DeleteAccess
+class FileAccessInline(admin.TabularInline):
+    model = FileAccess
+    fields = ('user', 'perms')
 
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
     list_display = ('file_name', 'file', 'updated_at', 'file_owner')
-    inlines = [ReadAccessInline, WriteAccessInline, DeleteAccessInline]
\ No newline at end of file
+    inlines = [FileAccessInline]
+
+    def save_model(self, request, obj, form, change):
+        obj.updated_at = timezone.now()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Drops the masks of every user, including those whose inline access
+        # rows were just deleted.
+        invalidate_file(form.instance.id)
+        bump_acl_version(form.instance.id)
+        refresh_index(form.instance.id, action=FileChange.UPDATED)
+        queue_index(form.instance)
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size', 'ref_count', 'created_at')
+    search_fields = ('digest',)
\ No newline at end of file
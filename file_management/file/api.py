@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List
 from ninja_extra import (
     api_controller,
     http_get,
@@ -9,37 +10,266 @@ from ninja_extra import (
     NinjaExtraAPI,
 )
 from ninja.constants import NOT_SET
-from ninja_jwt.authentication import JWTAuth
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Q
-from core.schema import MessageSchema, NotFoundSchema
-from file.models import DeleteAccess, File, ReadAccess, WriteAccess
+from django.utils import timezone
+from core.auth import FastJWTAuth
+from core.cache import all_cache_stats
+from core.schema import CacheStatsSchema, MessageSchema, NotFoundSchema
+from file.changes import (
+    changes_response,
+    decode_token,
+    head_change,
+    head_id,
+    page_changes,
+)
+from file.conditional import (
+    file_validators,
+    list_validators,
+    not_modified,
+    set_validators,
+)
+from file.download import serve_file
+from file.errors import FileError
+from file.listing import (
+    SEARCH_MAX_SIZE,
+    file_rows,
+    list_response,
+    page_bounds,
+    page_rows,
+    rows_response,
+    seek,
+    visible_files,
+)
+from file.access import (
+    PERMISSION_LABELS,
+    bulk_change,
+    get_perms_many,
+    grant,
+    grant_team,
+    has_perm,
+    invalidate_file,
+    principals,
+    refresh_index,
+    revoke,
+    revoke_team,
+)
+from file.lookups import (
+    forget_file,
+    guid_key,
+    resolve_file,
+    resolve_files,
+    resolve_user,
+    resolve_users,
+)
+from file.models import File, FileAccess, FileChange, UploadChunk, UploadSession
+from file.search import queue_index, search_file_ids
 from file.schema import (
+    AccessCheckResponseSchema,
+    AccessCheckResultSchema,
+    AccessCheckSchema,
+    BulkAccessResponseSchema,
+    BulkAccessResultSchema,
+    BulkAccessSchema,
+    FileChangeListSchema,
     FileCreateSchema,
     FileDetailsSchema,
     FileProvideAccessSchema,
     FileSchema,
+    FileTeamAccessSchema,
     FileUpdateSchema,
     PaginatedFileListSchema,
+    UploadSessionCreateSchema,
+    UploadSessionSchema,
+)
+from file.storage import (
+    acquire_blob,
+    adopt_blob,
+    discard,
+    file_digest,
+    lock_file,
+    merge_ranges,
+    release_blob,
+    reserve_upload,
+    stage_chunk,
+    write_chunk,
 )
-from django.core.paginator import Paginator
 from ninja import Form as NinjaForm, File as NinjaFile
 from ninja.files import UploadedFile
-from django.db.models import Prefetch
+from django.db.models import Prefetch, Q
 
 
 import logging
 
-from user.models import User
+from user.models import Team
 from user.schema import UserSchema
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
+def upload_session_schema(session: UploadSession) -> UploadSessionSchema:
+    chunks = list(session.chunks.values_list("index", "offset", "size"))
+    received = {index for index, _, _ in chunks}
+    return UploadSessionSchema(
+        guid=session.guid,
+        created_at=session.created_at,
+        file_name=session.file_name,
+        total_size=session.total_size,
+        chunk_size=session.chunk_size,
+        chunk_count=session.chunk_count,
+        received_ranges=merge_ranges((offset, size) for _, offset, size in chunks),
+        missing_chunks=[i for i in range(session.chunk_count) if i not in received],
+        is_complete=session.completed_at is not None,
+    )
+
+
+def create_upload_session(request, data: UploadSessionCreateSchema):
+    """Reserve storage for a chunked upload; shared by the sync and async APIs."""
+    chunk_size = data.chunk_size or settings.FILE_UPLOAD_SESSION_CHUNK_SIZE
+    if not 0 <= data.total_size <= settings.FILE_UPLOAD_SESSION_MAX_TOTAL_SIZE:
+        return 400, MessageSchema(
+            message="total_size must be between 0 and "
+            + str(settings.FILE_UPLOAD_SESSION_MAX_TOTAL_SIZE)
+        )
+    if not 0 < chunk_size <= settings.FILE_UPLOAD_SESSION_MAX_CHUNK_SIZE:
+        return 400, MessageSchema(
+            message="chunk_size must be between 1 and "
+            + str(settings.FILE_UPLOAD_SESSION_MAX_CHUNK_SIZE)
+        )
+    storage_name = reserve_upload(data.file_name, data.total_size)
+    session = UploadSession.objects.create(
+        file_name=data.file_name,
+        storage_name=storage_name,
+        total_size=data.total_size,
+        chunk_size=chunk_size,
+        owner_id=request.user.id,
+    )
+    return 201, upload_session_schema(session)
+
+
+def upload_session_status(request, session_guid: str):
+    try:
+        session = UploadSession.objects.get(
+            guid=session_guid, owner_id=request.user.id, is_deleted=False
+        )
+    except (UploadSession.DoesNotExist, DjangoValidationError):
+        return 404, NotFoundSchema(message="Upload session not found")
+    return 200, upload_session_schema(session)
+
+
+def upload_session_chunk(request, session_guid: str, index: int, offset: int):
+    """
+    Store one chunk sent as the raw request body. Re-sending a chunk
+    overwrites it, so clients can retry anything not listed as received.
+
+    The body is staged first and copied into the session's file only with the
+    session row locked. Finalize takes that lock before hashing, so a chunk
+    can never land in a file already digested into a blob.
+    """
+    try:
+        session = UploadSession.objects.get(
+            guid=session_guid, owner_id=request.user.id, is_deleted=False
+        )
+    except (UploadSession.DoesNotExist, DjangoValidationError):
+        return 404, NotFoundSchema(message="Upload session not found")
+    if session.completed_at:
+        return 409, MessageSchema(message="Upload session is already finalized")
+    if not 0 <= index < session.chunk_count:
+        return 400, MessageSchema(message="Chunk index out of range")
+    if offset != index * session.chunk_size:
+        return 400, MessageSchema(message="Chunk offset must be index * chunk_size")
+    length = session.chunk_length(index)
+    if int(request.META.get("CONTENT_LENGTH") or 0) != length:
+        return 400, MessageSchema(
+            message="Chunk " + str(index) + " must be " + str(length) + " bytes"
+        )
+    try:
+        staged = stage_chunk(request, length)
+    except FileError as e:
+        return 400, MessageSchema(message=e.message)
+    with staged, transaction.atomic():
+        # Re-checked under the lock: finalize or abort may have run meanwhile.
+        session = (
+            UploadSession.objects.select_for_update()
+            .filter(pk=session.pk, is_deleted=False)
+            .first()
+        )
+        if session is None:
+            return 404, NotFoundSchema(message="Upload session not found")
+        if session.completed_at:
+            return 409, MessageSchema(message="Upload session is already finalized")
+        # Purging expires sessions by their last chunk, not their creation.
+        session.last_chunk_at = timezone.now()
+        session.save(update_fields=["last_chunk_at"])
+        write_chunk(session.storage_name, offset, staged, length)
+        UploadChunk.objects.update_or_create(
+            session=session, index=index, defaults={"offset": offset, "size": length}
+        )
+    return 200, upload_session_schema(session)
+
+
+def finalize_upload_session(request, session_guid: str):
+    """Turn a session with every chunk received into a file."""
+    with transaction.atomic():
+        try:
+            session = UploadSession.objects.select_for_update().get(
+                guid=session_guid, owner_id=request.user.id, is_deleted=False
+            )
+        except (UploadSession.DoesNotExist, DjangoValidationError):
+            return 404, NotFoundSchema(message="Upload session not found")
+        if session.completed_at:
+            return 409, MessageSchema(message="Upload session is already finalized")
+        if session.chunks.count() != session.chunk_count:
+            return 409, MessageSchema(
+                message="Upload is incomplete. Query the session for missing chunks"
+            )
+        blob = adopt_blob(session.storage_name)
+        file = File.objects.create(
+            file_name=session.file_name,
+            file=blob.file.name,
+            blob=blob,
+            file_owner_id=request.user.id,
+            updated_at=timezone.now(),
+        )
+        FileAccess.objects.create(
+            file_id=file.id, user_id=request.user.id, perms=FileAccess.ALL
+        )
+        refresh_index(file.id, action=FileChange.CREATED)
+        queue_index(file)
+        session.completed_at = timezone.now()
+        session.save()
+        return 201, FileSchema(
+            guid=file.guid,
+            created_at=file.created_at,
+            file_name=file.file_name,
+            file_owner_guid=str(request.user.guid),
+            file=file.file.url,
+        )
+
+
+def abort_upload_session(request, session_guid: str):
+    """Drop an unfinished session and the storage reserved for it."""
+    try:
+        session = UploadSession.objects.get(
+            guid=session_guid, owner_id=request.user.id, is_deleted=False
+        )
+    except (UploadSession.DoesNotExist, DjangoValidationError):
+        return 404, NotFoundSchema(message="Upload session not found")
+    if session.completed_at:
+        return 409, MessageSchema(message="Upload session is already finalized")
+    with transaction.atomic():
+        session.is_deleted = True
+        session.deleted_at = timezone.now()
+        session.save()
+        transaction.on_commit(lambda: discard(session.storage_name))
+        return 204, MessageSchema(message="Upload session aborted")
+
+
 @api_controller("/file", tags=["File APIs"], auth=NOT_SET, permissions=[])
 class FileController:
-    @http_post("/upload", auth=JWTAuth(), response=[(201, MessageSchema)])
+    @http_post("/upload", auth=FastJWTAuth(), response=[(201, MessageSchema)])
     def file_upload(
         self,
         request,
@@ -47,74 +277,172 @@ class FileController:
         file: UploadedFile = NinjaFile(...),
     ):
         with transaction.atomic():
+            blob = acquire_blob(file)
             file = File.objects.create(
                 file_name=data.file_name,
-                file=file,
+                file=blob.file.name,
+                blob=blob,
                 file_owner_id=request.user.id,
                 updated_at=datetime.now(),
             )
-            read_access = ReadAccess.objects.create(
-                file_id=file.id, user_id=request.user.id
-            )
-            write_access = WriteAccess.objects.create(
-                file_id=file.id, user_id=request.user.id
-            )
-            delete_access = DeleteAccess.objects.create(
-                file_id=file.id, user_id=request.user.id
+            FileAccess.objects.create(
+                file_id=file.id, user_id=request.user.id, perms=FileAccess.ALL
             )
+            refresh_index(file.id, action=FileChange.CREATED)
+            queue_index(file)
 
             return 201, MessageSchema(message="File uploaded successfully")
 
+    @http_post(
+        "/upload/session",
+        auth=FastJWTAuth(),
+        response=[(201, UploadSessionSchema), (400, MessageSchema)],
+    )
+    def create_upload_session(self, request, data: UploadSessionCreateSchema):
+        return create_upload_session(request, data)
+
+    @http_get(
+        "/upload/session",
+        auth=FastJWTAuth(),
+        response=[(200, UploadSessionSchema), (404, NotFoundSchema)],
+    )
+    def upload_session_status(self, request, session_guid: str = None):
+        return upload_session_status(request, session_guid)
+
+    @http_put(
+        "/upload/session/chunk",
+        auth=FastJWTAuth(),
+        response=[
+            (200, UploadSessionSchema),
+            (400, MessageSchema),
+            (404, NotFoundSchema),
+            (409, MessageSchema),
+        ],
+    )
+    def upload_session_chunk(
+        self, request, session_guid: str = None, index: int = 0, offset: int = 0
+    ):
+        return upload_session_chunk(request, session_guid, index, offset)
+
+    @http_post(
+        "/upload/session/finalize",
+        auth=FastJWTAuth(),
+        response=[
+            (201, FileSchema),
+            (404, NotFoundSchema),
+            (409, MessageSchema),
+        ],
+    )
+    def finalize_upload_session(self, request, session_guid: str = None):
+        return finalize_upload_session(request, session_guid)
+
+    @http_delete(
+        "/upload/session",
+        auth=FastJWTAuth(),
+        response=[(204, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+    )
+    def abort_upload_session(self, request, session_guid: str = None):
+        return abort_upload_session(request, session_guid)
+
     @http_get(
         "/list",
-        response=[(200, PaginatedFileListSchema), (500, MessageSchema)],
-        auth=JWTAuth(),
+        response=[
+            (200, PaginatedFileListSchema),
+            (400, MessageSchema),
+            (500, MessageSchema),
+        ],
+        auth=FastJWTAuth(),
     )
-    def file_list(self, request, size: int = 30, page: int = 0):
+    def file_list(
+        self,
+        request,
+        size: int = 30,
+        page: int = 0,
+        after: str = None,
+        include_total: bool = True,
+    ):
+        """
+        Pass ``after`` (empty for the first page, then ``next_cursor``) to page
+        with an index seek on ``(created_at, id)`` instead of an OFFSET scan.
+        Cursor pages skip the count; ``include_total=false`` does the same
+        for numbered pages.
+        """
+        size, page = page_bounds(size, page)
         try:
-            owned_files = File.objects.filter(
-                file_owner_id=request.user.id, is_deleted=False
-            ).values("id")
-            read_access_files = ReadAccess.objects.filter(
-                user=request.user.id, is_deleted=False
-            ).values("file_id")
-            files_query_set = File.objects.filter(
-                Q(id__in=owned_files) | Q(id__in=read_access_files)
-            ).distinct()
-
-            combined_files = Paginator(files_query_set, per_page=size)
-
-            file_data = [
-                FileSchema(
-                    guid=obj.guid,
-                    created_at=obj.created_at,
-                    file_name=obj.file_name,
-                    file_owner_guid=str(obj.file_owner.guid),
-                    file=obj.file.url,
-                )
-                for obj in combined_files.page(page + 1)
-            ]
-
-            total_items = files_query_set.count()
-            total_pages = (total_items + size - 1) // size
-            has_next = (page + 1) < total_pages
-            has_prev = page > 1
-
-            paginated_data = PaginatedFileListSchema(
-                page=page,
-                size=size,
-                total_items=total_items,
-                total_pages=total_pages,
-                has_next=has_next,
-                has_prev=has_prev,
-                data=file_data,
+            _, teams = principals(request.user.id, request)
+            etag, last_modified = list_validators(
+                request.user.id, teams, head_change(request.user.id, teams)
             )
-
-            return 200, paginated_data
+            response = not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+            files_query_set = visible_files(request.user.id, teams)
+            offset = 0
+            if after is not None:
+                try:
+                    rows = seek(files_query_set, after)
+                except ValueError:
+                    return 400, MessageSchema(message="Invalid cursor")
+            else:
+                rows, offset = files_query_set, page * size
+            rows = list(page_rows(rows, offset, size))
+            total_items = None
+            if after is None and include_total:
+                total_items = files_query_set.count()
+            response = list_response(rows, size, page, after, total_items)
+            set_validators(response, etag, last_modified)
+            return response
         except Exception as e:
             logger.error(f"Error at file list: {e}")
             return 500, MessageSchema(message="Internal Server Error")
 
+    @http_get(
+        "/search",
+        response=[(200, List[FileSchema]), (500, MessageSchema)],
+        auth=FastJWTAuth(),
+    )
+    def file_search(self, request, q: str = "", size: int = 30):
+        """Files the caller can see whose name or text content matches ``q``."""
+        size = max(1, min(size, SEARCH_MAX_SIZE))
+        try:
+            _, teams = principals(request.user.id, request)
+            file_ids = search_file_ids(request.user.id, teams, q, size)
+            rows = file_rows(request.user.id, teams, file_ids)
+            return rows_response(rows)
+        except Exception as e:
+            logger.error(f"Error at file search: {e}")
+            return 500, MessageSchema(message="Internal Server Error")
+
+    @http_get(
+        "/changes",
+        response=[
+            (200, FileChangeListSchema),
+            (400, MessageSchema),
+            (500, MessageSchema),
+        ],
+        auth=FastJWTAuth(),
+    )
+    def file_changes(self, request, since: str = None, size: int = 100):
+        """
+        Events on files the caller could see, oldest first, for delta sync.
+        Without ``since`` only the current token is returned; fetch it before
+        the initial /list so nothing that happens during the listing is missed.
+        """
+        size = min(size, 1000)
+        try:
+            _, teams = principals(request.user.id, request)
+            if since is None:
+                return changes_response([], size, head_id(request.user.id, teams))
+            try:
+                since_id = decode_token(since)
+            except ValueError:
+                return 400, MessageSchema(message="Invalid sync token")
+            rows = list(page_changes(request.user.id, teams, since_id, size))
+            return changes_response(rows, size, since_id)
+        except Exception as e:
+            logger.error(f"Error at file changes: {e}")
+            return 500, MessageSchema(message="Internal Server Error")
+
     @http_get(
         "/details",
         response=[
@@ -122,84 +450,97 @@ class FileController:
             (404, NotFoundSchema),
             (401, NotFoundSchema),
         ],
-        auth=JWTAuth(),
+        auth=FastJWTAuth(),
     )
     def file_details(self, request, file_guid: str = None):
-        try:
-            file_with_access = (
-                File.objects.prefetch_related(
-                    Prefetch(
-                        "readaccess_set",
-                        queryset=ReadAccess.objects.select_related("user"),
-                    ),
-                    Prefetch(
-                        "writeaccess_set",
-                        queryset=WriteAccess.objects.select_related("user"),
-                    ),
-                    Prefetch(
-                        "deleteaccess_set",
-                        queryset=DeleteAccess.objects.select_related("user"),
-                    ),
-                )
-                .select_related("file_owner")
-                .get(guid=file_guid, is_deleted=False)
-            )
-
-        except File.DoesNotExist:
+        """
+        Answers ``If-None-Match`` / ``If-Modified-Since`` with 304 from one
+        narrow File lookup, before the ACL rows are loaded.
+        """
+        file = (
+            File.objects.filter(guid=file_guid, is_deleted=False)
+            .values_list("id", "updated_at", "acl_version", "acl_updated_at")
+            .first()
+        )
+        if file is None:
             return 404, NotFoundSchema(message="File not found")
-        try:
-            has_read_access = ReadAccess.objects.get(
-                file_id=file_with_access.id, user=request.user.id, is_deleted=False
-            )
-        except ReadAccess.DoesNotExist():
+        if not has_perm(request.user.id, file[0], FileAccess.READ, request):
             return 401, NotFoundSchema(
                 message="Unauthorized. User does not have permission to view this file"
             )
-        return 200, FileDetailsSchema(
-            guid=file_with_access.guid,
-            created_at=file_with_access.created_at,
-            file_name=file_with_access.file_name,
-            updated_at=file_with_access.updated_at,
-            file=file_with_access.file.url,
-            file_owner_guid=str(file_with_access.file_owner.guid),
-            user_read_access=[
-                UserSchema(
-                    guid=obj.user.guid,
-                    created_at=obj.user.created_at,
-                    name=obj.user.name,
-                    email=obj.user.email,
-                )
-                for obj in file_with_access.readaccess_set.all()
-                if file_with_access.readaccess_set
-            ],
-            user_write_access=[
-                UserSchema(
-                    guid=obj.user.guid,
-                    created_at=obj.user.created_at,
-                    name=obj.user.name,
-                    email=obj.user.email,
+        etag, last_modified = file_validators(*file)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        set_validators(self.context.response, etag, last_modified)
+
+        file_with_access = (
+            File.objects.prefetch_related(
+                Prefetch(
+                    "fileaccess_set",
+                    queryset=FileAccess.objects.filter(
+                        perms__gt=0, user__isnull=False
+                    ).select_related("user"),
                 )
-                for obj in file_with_access.writeaccess_set.all()
-                if file_with_access.writeaccess_set
-            ],
-            user_delete_access=[
+            )
+            .select_related("file_owner")
+            .get(id=file[0])
+        )
+        grants = file_with_access.fileaccess_set.all()
+        users_with = {
+            perm: [
                 UserSchema(
                     guid=obj.user.guid,
                     created_at=obj.user.created_at,
                     name=obj.user.name,
                     email=obj.user.email,
                 )
-                for obj in file_with_access.deleteaccess_set.all()
-                if file_with_access.deleteaccess_set
-            ],
+                for obj in grants
+                if obj.perms & perm
+            ]
+            for perm in PERMISSION_LABELS
+        }
+        return 200, FileDetailsSchema(
+            guid=file_with_access.guid,
+            created_at=file_with_access.created_at,
+            file_name=file_with_access.file_name,
+            updated_at=file_with_access.updated_at,
+            file=file_with_access.file.url,
+            file_owner_guid=str(file_with_access.file_owner.guid),
+            user_read_access=users_with[FileAccess.READ],
+            user_write_access=users_with[FileAccess.WRITE],
+            user_delete_access=users_with[FileAccess.DELETE],
         )
 
+    @http_get(
+        "/download",
+        response=[(404, NotFoundSchema), (401, NotFoundSchema)],
+        auth=FastJWTAuth(),
+    )
+    def file_download(self, request, file_guid: str = None):
+        """
+        Stream the file contents. Supports single and multiple byte ranges,
+        strong ETags with If-None-Match/If-Range, and X-Accel-Redirect or
+        X-Sendfile offload through FILE_DOWNLOAD_OFFLOAD.
+        """
+        try:
+            file = File.objects.select_related("blob").get(
+                guid=file_guid, is_deleted=False
+            )
+        except File.DoesNotExist:
+            return 404, NotFoundSchema(message="File not found")
+        if not has_perm(request.user.id, file.id, FileAccess.READ, request):
+            return 401, NotFoundSchema(
+                message="Unauthorized. User does not have permission to view this file"
+            )
+        return serve_file(request, file)
+
     @http_put(
         "/update",
-        auth=JWTAuth(),
+        auth=FastJWTAuth(),
         response=[(200, MessageSchema), (401, NotFoundSchema), (404, NotFoundSchema)],
     )
-    def file_upload(
+    def file_update(
         self,
         request,
         data: NinjaForm[FileUpdateSchema],
@@ -207,201 +548,306 @@ class FileController:
     ):
 
         try:
-            update_file = File.objects.get(guid=data.file_guid, is_deleted=False)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File not found")
-        try:
-            has_read_access = ReadAccess.objects.get(
-                file_id=update_file.id, user_id=request.user.id, is_deleted=False
+            update_file = File.objects.select_related("blob").get(
+                guid=data.file_guid, is_deleted=False
             )
-        except ReadAccess.DoesNotExist():
+        except File.DoesNotExist:
+            return 404, NotFoundSchema(message="File not found")
+        if not has_perm(request.user.id, update_file.id, FileAccess.WRITE, request):
             return 401, NotFoundSchema(
-                message="Unauthorized. User does not have read access to this file"
+                message="Unauthorized. User does not have write access to this file"
             )
         with transaction.atomic():
+            update_file = lock_file(update_file.id)
+            if update_file is None:
+                return 404, NotFoundSchema(message="File not found")
             update_file.file_name = data.file_name
-            update_file.file = file
+            update_file.updated_at = timezone.now()
+            if update_file.blob is None or update_file.blob.digest != file_digest(file):
+                blob = acquire_blob(file)
+                release_blob(update_file.blob_id)
+                update_file.blob = blob
+                update_file.file = blob.file.name
             update_file.save()
+            refresh_index(update_file.id, action=FileChange.UPDATED)
+            queue_index(update_file)
             return 200, MessageSchema(message="File updated successfully")
 
     @http_delete(
         "/delete",
-        response=[(204, MessageSchema), (404, MessageSchema), (401, NotFoundSchema)],
-        auth=JWTAuth(),
+        response=[(204, MessageSchema), (404, NotFoundSchema), (401, NotFoundSchema)],
+        auth=FastJWTAuth(),
     )
     def delete_file(self, request, file_guid: str = None):
         try:
             file = File.objects.get(guid=file_guid, is_deleted=False)
-        except File.DoesNotExist():
+        except File.DoesNotExist:
             return 404, NotFoundSchema(message="File Does not exist")
-        try:
-            delete_access = DeleteAccess.objects.get(
-                user_id=request.user.id, file_id=file.id, is_deleted=False
-            )
-        except DeleteAccess.DoesNotExist():
-            return 401, MessageSchema(
+        if not has_perm(request.user.id, file.id, FileAccess.DELETE, request):
+            return 401, NotFoundSchema(
                 message="Unauthorized. User does not have permission to delete this file"
             )
         with transaction.atomic():
+            file = lock_file(file.id)
+            if file is None:
+                return 404, NotFoundSchema(message="File Does not exist")
+            invalidate_file(file.id)
+            forget_file(file.guid)
+            release_blob(file.blob_id)
+            file.blob = None
             file.is_deleted = True
             file.save()
+            refresh_index(file.id, action=FileChange.DELETED)
+            queue_index(file)
             return 204, MessageSchema(message="File has been deleted successfully.")
 
 
-@api_controller("/access", tags=["Access API"], auth=NOT_SET, permissions=[])
-class AccessController:
-    @http_post(
-        "/read/create",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+def resolve_grant(data: FileProvideAccessSchema):
+    """
+    Look up the user and file id of an access request, or the 404 to return.
+    Both usually come from the lookup cache without a query.
+    """
+    user = resolve_user(data.user_email)
+    if user is None:
+        return None, None, (404, NotFoundSchema(message="User Not Found"))
+    file_id = resolve_file(data.file_guid)
+    if file_id is None:
+        return None, None, (404, NotFoundSchema(message="File Not Found"))
+    return user, file_id, None
+
+
+def grant_access(perm: int, data: FileProvideAccessSchema):
+    user, file_id, error = resolve_grant(data)
+    if error:
+        return error
+    label = PERMISSION_LABELS[perm]
+    if not grant(file_id, user.id, perm):
+        return 409, MessageSchema(message="User already has " + label + " access")
+    return 201, MessageSchema(
+        message="User " + user.name + " has been provided " + label + " access"
     )
-    def create_read_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = ReadAccess.objects.filter(
-            file_id=file.id, user_id=user.id, is_deleted=False
-        ).exists()
-        if prev_access:
-            return 409, MessageSchema(message="User already has read access")
-        with transaction.atomic():
-            read_access = ReadAccess.objects.create(file_id=file.id, user_id=user.id)
-            return 201, MessageSchema(
-                message="User" + user.name + " has been provided read access"
-            )
 
-    @http_post(
-        "/update/create",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+
+def revoke_access(perm: int, data: FileProvideAccessSchema):
+    user, file_id, error = resolve_grant(data)
+    if error:
+        return error
+    label = PERMISSION_LABELS[perm]
+    if not revoke(file_id, user.id, perm):
+        return 409, MessageSchema(
+            message="User does not have " + label + " access for this file"
+        )
+    return 201, MessageSchema(
+        message="User " + user.name + " " + label + " access has been removed"
     )
-    def create_update_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = WriteAccess.objects.filter(
-            file_id=file.id, user_id=user.id, is_deleted=False
-        ).exists()
-        if prev_access:
-            return 409, MessageSchema(message="User already has write access")
-        with transaction.atomic():
-            write_access = WriteAccess.objects.create(file_id=file.id, user_id=user.id)
-            return 201, MessageSchema(
-                message="User" + user.name + " has been provided write access"
-            )
 
-    @http_post(
-        "/delete/create",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+
+ACCESS_RESPONSES = [(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)]
+BULK_ACCESS_MAX_ITEMS = 1000
+ACCESS_CHECK_MAX_FILES = 500
+PERMISSION_BITS = {label: perm for perm, label in PERMISSION_LABELS.items()}
+
+
+def bulk_access(request, data: BulkAccessSchema):
+    """
+    Resolve every email and file guid of a bulk request through the lookup
+    cache, with one ``IN`` query each for the misses, then apply all grants
+    and revokes in one transaction. Only the owner of a file may change who
+    can access it; items on anyone else's files are reported as forbidden.
+    """
+    if len(data.items) > BULK_ACCESS_MAX_ITEMS:
+        return 400, MessageSchema(
+            message=f"At most {BULK_ACCESS_MAX_ITEMS} items per request"
+        )
+    users = resolve_users(item.user_email for item in data.items)
+    files = resolve_files(item.file_guid for item in data.items)
+
+    with transaction.atomic():
+        # Checked in the transaction that applies the changes, so ownership
+        # cannot move between the check and the writes.
+        owned = set(
+            File.objects.select_for_update()
+            .filter(
+                id__in=set(files.values()),
+                file_owner_id=request.user.id,
+                is_deleted=False,
+            )
+            .values_list("id", flat=True)
+        )
+        statuses, changes, pending = [], [], []
+        for item in data.items:
+            user = users.get(item.user_email)
+            file_id = files.get(guid_key(item.file_guid))
+            if user is None:
+                statuses.append("user_not_found")
+            elif file_id is None:
+                statuses.append("file_not_found")
+            elif file_id not in owned:
+                statuses.append("forbidden")
+            else:
+                pending.append(len(statuses))
+                statuses.append(None)
+                changes.append(
+                    (
+                        file_id,
+                        user.id,
+                        PERMISSION_BITS[item.perm],
+                        item.action == "grant",
+                    )
+                )
+        for index, changed in zip(pending, bulk_change(changes)):
+            if not changed:
+                statuses[index] = "unchanged"
+            elif data.items[index].action == "grant":
+                statuses[index] = "granted"
+            else:
+                statuses[index] = "revoked"
+    return 200, BulkAccessResponseSchema(
+        results=[
+            BulkAccessResultSchema(**item.model_dump(), status=status)
+            for item, status in zip(data.items, statuses)
+        ]
     )
-    def create_delete_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = DeleteAccess.objects.filter(
-            file_id=file.id, user_id=user.id, is_deleted=False
-        ).exists()
-        if prev_access:
-            return 409, MessageSchema(message="User already has delete access")
-        with transaction.atomic():
-            del_access = DeleteAccess.objects.create(file_id=file.id, user_id=user.id)
-            return 201, MessageSchema(
-                message="User" + user.name + " has been provided delete access"
+
+
+def access_check(request, data: AccessCheckSchema):
+    """
+    The caller's read/write/delete rights on each requested file: guids come
+    from the lookup cache, one query loads every mask not already cached.
+    """
+    if len(data.file_guids) > ACCESS_CHECK_MAX_FILES:
+        return 400, MessageSchema(
+            message=f"At most {ACCESS_CHECK_MAX_FILES} files per request"
+        )
+    files = resolve_files(data.file_guids)
+    perms = get_perms_many(request.user.id, list(files.values()), request)
+    results = []
+    for guid in data.file_guids:
+        file_id = files.get(guid_key(guid))
+        if file_id is None:
+            results.append(AccessCheckResultSchema(file_guid=guid, found=False))
+            continue
+        mask = perms[file_id]
+        results.append(
+            AccessCheckResultSchema(
+                file_guid=guid,
+                found=True,
+                **{
+                    label: mask & perm == perm
+                    for perm, label in PERMISSION_LABELS.items()
+                },
             )
+        )
+    return 200, AccessCheckResponseSchema(results=results)
 
-    @http_post(
-        "/read/remove",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+
+def team_access(request, data: FileTeamAccessSchema):
+    """
+    Grant or revoke one permission for every member of a team at once. The
+    caller must own the file and own or belong to the team; anything else is
+    reported as not found.
+    """
+    team = Team.objects.filter(
+        Q(owner_id=request.user.id) | Q(memberships__user_id=request.user.id),
+        guid=guid_key(data.team_guid),
+        is_deleted=False,
+    ).distinct()
+    file = File.objects.filter(
+        guid=guid_key(data.file_guid), file_owner_id=request.user.id, is_deleted=False
     )
-    def remove_read_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = ReadAccess.objects.filter(
-            file_id=file.id, user_id=user.id
-        ).exists()
-        if not prev_access:
+    team, file = team.first(), file.first()
+    if team is None:
+        return 404, NotFoundSchema(message="Team Not Found")
+    if file is None:
+        return 404, NotFoundSchema(message="File Not Found")
+    perm = PERMISSION_BITS[data.perm]
+    if data.action == "grant":
+        if not grant_team(file.id, team.id, perm):
             return 409, MessageSchema(
-                message="User does not have read access for this file"
-            )
-        with transaction.atomic():
-            read_access = ReadAccess.objects.get(file_id=file.id, user_id=user.id)
-            read_access.is_deleted = True
-            read_access.save()
-            return 201, MessageSchema(
-                message="User:" + user.name + "read access has been removed"
+                message="Team already has " + data.perm + " access"
             )
+        return 201, MessageSchema(
+            message="Team " + team.name + " has been provided " + data.perm + " access"
+        )
+    if not revoke_team(file.id, team.id, perm):
+        return 409, MessageSchema(
+            message="Team does not have " + data.perm + " access for this file"
+        )
+    return 201, MessageSchema(
+        message="Team " + team.name + " " + data.perm + " access has been removed"
+    )
+
+
+@api_controller("/access", tags=["Access API"], auth=NOT_SET, permissions=[])
+class AccessController:
+    @http_post("/read/create", response=ACCESS_RESPONSES)
+    def create_read_access(self, request, data: FileProvideAccessSchema):
+        return grant_access(FileAccess.READ, data)
+
+    @http_post("/update/create", response=ACCESS_RESPONSES)
+    def create_update_access(self, request, data: FileProvideAccessSchema):
+        return grant_access(FileAccess.WRITE, data)
+
+    @http_post("/delete/create", response=ACCESS_RESPONSES)
+    def create_delete_access(self, request, data: FileProvideAccessSchema):
+        return grant_access(FileAccess.DELETE, data)
+
+    @http_post("/read/remove", response=ACCESS_RESPONSES)
+    def remove_read_access(self, request, data: FileProvideAccessSchema):
+        return revoke_access(FileAccess.READ, data)
+
+    @http_post("/update/remove", response=ACCESS_RESPONSES)
+    def remove_update_access(self, request, data: FileProvideAccessSchema):
+        return revoke_access(FileAccess.WRITE, data)
+
+    @http_post("/delete/remove", response=ACCESS_RESPONSES)
+    def remove_delete_access(self, request, data: FileProvideAccessSchema):
+        return revoke_access(FileAccess.DELETE, data)
 
     @http_post(
-        "/update/remove",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+        "/bulk",
+        response=[(200, BulkAccessResponseSchema), (400, MessageSchema)],
+        auth=FastJWTAuth(),
     )
-    def remove_update_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = WriteAccess.objects.filter(
-            file_id=file.id, user_id=user.id
-        ).exists()
-        if not prev_access:
-            return 409, MessageSchema(
-                message="User does not have write access for this file"
-            )
-        with transaction.atomic():
-            write_access = WriteAccess.objects.get(file_id=file.id, user_id=user.id)
-            write_access.is_deleted = True
-            write_access.save()
-            return 201, MessageSchema(
-                message="User" + user.name + "write access has been removed"
-            )
+    def bulk_access(self, request, data: BulkAccessSchema):
+        """
+        Grant and revoke read/write/delete for many users on files the caller
+        owns.
+        """
+        return bulk_access(request, data)
 
     @http_post(
-        "/delete/remove",
-        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+        "/check",
+        response=[(200, AccessCheckResponseSchema), (400, MessageSchema)],
+        auth=FastJWTAuth(),
     )
-    def remove_delete_access(self, request, data: FileProvideAccessSchema):
-        try:
-            user = User.objects.get(email=data.user_email)
-        except User.DoesNotExist():
-            return 404, NotFoundSchema(message="User Not Found")
-        try:
-            file = File.objects.get(guid=data.file_guid)
-        except File.DoesNotExist():
-            return 404, NotFoundSchema(message="File Not Found")
-        prev_access = DeleteAccess.objects.filter(
-            file_id=file.id, user_id=user.id
-        ).exists()
-        if not prev_access:
-            return 409, MessageSchema(
-                message="User does not have delete access for this file"
-            )
-        with transaction.atomic():
-            del_access = DeleteAccess.objects.get(file_id=file.id, user_id=user.id)
-            del_access.is_deleted = True
-            del_access.save()
-            return 201, MessageSchema(
-                message="User" + user.name + "delete access has been removed"
+    def access_check(self, request, data: AccessCheckSchema):
+        """
+        The caller's effective rights on up to 500 files in one round trip,
+        e.g. to enable or disable actions in a file grid.
+        """
+        return access_check(request, data)
+
+    @http_post("/team", response=ACCESS_RESPONSES, auth=FastJWTAuth())
+    def team_access(self, request, data: FileTeamAccessSchema):
+        """
+        Grant or revoke a permission for a team on a file the caller owns.
+        Members gain or lose it through their membership; nothing is written
+        per member.
+        """
+        return team_access(request, data)
+
+    @http_get(
+        "/cache/stats", response=[(200, List[CacheStatsSchema])], auth=FastJWTAuth()
+    )
+    def cache_stats(self, request):
+        """Hit and miss counters of the shared lookup caches in this process."""
+        return 200, [
+            CacheStatsSchema(
+                name=stats.name,
+                hits=stats.hits,
+                misses=stats.misses,
+                hit_rate=stats.hit_rate,
             )
+            for stats in all_cache_stats()
+        ]
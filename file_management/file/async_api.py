@@ -0,0 +1,518 @@
+import functools
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from ninja import File as NinjaFile, Form as NinjaForm
+from ninja.constants import NOT_SET
+from ninja.files import UploadedFile
+from ninja_extra import api_controller, http_delete, http_get, http_post, http_put
+
+from core.auth import AsyncFastJWTAuth
+from core.schema import MessageSchema, NotFoundSchema
+from file.api import (
+    abort_upload_session,
+    access_check,
+    bulk_access,
+    create_upload_session,
+    finalize_upload_session,
+    team_access,
+    upload_session_chunk,
+    upload_session_status,
+)
+from file.changes import (
+    changes_response,
+    decode_token,
+    head_change,
+    head_id,
+    page_changes,
+)
+from file.conditional import (
+    file_validators,
+    list_validators,
+    not_modified,
+    set_validators,
+)
+from file.download import serve_file
+from file.listing import (
+    SEARCH_MAX_SIZE,
+    file_rows,
+    list_response,
+    page_bounds,
+    page_rows,
+    rows_response,
+    seek,
+    visible_files,
+)
+from file.access import (
+    PERMISSION_LABELS,
+    agrant,
+    ahas_perm,
+    aprincipals,
+    arevoke,
+    invalidate_file,
+    refresh_index,
+)
+from file.lookups import aresolve_file, aresolve_user, forget_file
+from file.models import File, FileAccess, FileChange
+from file.search import queue_index, search_file_ids
+from file.schema import (
+    AccessCheckResponseSchema,
+    AccessCheckSchema,
+    BulkAccessResponseSchema,
+    BulkAccessSchema,
+    FileChangeListSchema,
+    FileCreateSchema,
+    FileDetailsSchema,
+    FileProvideAccessSchema,
+    FileSchema,
+    FileTeamAccessSchema,
+    FileUpdateSchema,
+    PaginatedFileListSchema,
+    UploadSessionCreateSchema,
+    UploadSessionSchema,
+)
+from file.storage import (
+    acquire_blob,
+    file_digest,
+    lock_file,
+    release_blob,
+)
+from user.schema import UserSchema
+
+# Storage work runs outside the thread that serializes sync ORM calls, so a
+# slow disk write does not queue every other request behind it.
+run_blocking = sync_to_async(thread_sensitive=False)
+
+
+def run_db(func):
+    """
+    ``run_blocking`` for functions that also use the database. Django closes
+    stale connections only on the request thread, so it is done here around
+    each call on the worker threads.
+    """
+
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return run_blocking(call)
+
+
+@run_db
+def create_file(user_id, file_name, uploaded_file) -> File:
+    with transaction.atomic():
+        blob = acquire_blob(uploaded_file)
+        file = File.objects.create(
+            file_name=file_name,
+            file=blob.file.name,
+            blob=blob,
+            file_owner_id=user_id,
+            updated_at=timezone.now(),
+        )
+        FileAccess.objects.create(
+            file_id=file.id, user_id=user_id, perms=FileAccess.ALL
+        )
+        refresh_index(file.id, action=FileChange.CREATED)
+        queue_index(file)
+    return file
+
+
+@run_db
+def replace_file_content(file: File, file_name, uploaded_file) -> bool:
+    """False if the file was deleted in the meantime."""
+    with transaction.atomic():
+        file = lock_file(file.id)
+        if file is None:
+            return False
+        file.file_name = file_name
+        file.updated_at = timezone.now()
+        if file.blob is None or file.blob.digest != file_digest(uploaded_file):
+            blob = acquire_blob(uploaded_file)
+            release_blob(file.blob_id)
+            file.blob = blob
+            file.file = blob.file.name
+        file.save()
+        refresh_index(file.id, action=FileChange.UPDATED)
+        queue_index(file)
+    return True
+
+
+@run_db
+def soft_delete_file(file: File) -> bool:
+    """False if the file was deleted in the meantime."""
+    with transaction.atomic():
+        file = lock_file(file.id)
+        if file is None:
+            return False
+        invalidate_file(file.id)
+        forget_file(file.guid)
+        release_blob(file.blob_id)
+        file.blob = None
+        file.is_deleted = True
+        file.save()
+        refresh_index(file.id, action=FileChange.DELETED)
+        queue_index(file)
+    return True
+
+
+def user_schema(user) -> UserSchema:
+    return UserSchema(
+        guid=user.guid, created_at=user.created_at, name=user.name, email=user.email
+    )
+
+
+@api_controller("/async/file", tags=["Async File APIs"], auth=NOT_SET, permissions=[])
+class AsyncFileController:
+    """
+    ASGI-native counterparts of FileController. Queries use the async ORM and
+    storage I/O runs on worker threads, so a single process can keep many
+    slow clients in flight.
+    """
+
+    @http_post("/upload", auth=AsyncFastJWTAuth(), response=[(201, MessageSchema)])
+    async def file_upload(
+        self,
+        request,
+        data: NinjaForm[FileCreateSchema],
+        file: UploadedFile = NinjaFile(...),
+    ):
+        await create_file(request.user.id, data.file_name, file)
+        return 201, MessageSchema(message="File uploaded successfully")
+
+    @http_post(
+        "/upload/session",
+        auth=AsyncFastJWTAuth(),
+        response=[(201, UploadSessionSchema), (400, MessageSchema)],
+    )
+    async def create_upload_session(self, request, data: UploadSessionCreateSchema):
+        return await run_db(create_upload_session)(request, data)
+
+    @http_get(
+        "/upload/session",
+        auth=AsyncFastJWTAuth(),
+        response=[(200, UploadSessionSchema), (404, NotFoundSchema)],
+    )
+    async def upload_session_status(self, request, session_guid: str = None):
+        return await sync_to_async(upload_session_status)(request, session_guid)
+
+    @http_put(
+        "/upload/session/chunk",
+        auth=AsyncFastJWTAuth(),
+        response=[
+            (200, UploadSessionSchema),
+            (400, MessageSchema),
+            (404, NotFoundSchema),
+            (409, MessageSchema),
+        ],
+    )
+    async def upload_session_chunk(
+        self, request, session_guid: str = None, index: int = 0, offset: int = 0
+    ):
+        # Reads the body and writes to disk, so it runs off the ORM thread.
+        return await run_db(upload_session_chunk)(request, session_guid, index, offset)
+
+    @http_post(
+        "/upload/session/finalize",
+        auth=AsyncFastJWTAuth(),
+        response=[(201, FileSchema), (404, NotFoundSchema), (409, MessageSchema)],
+    )
+    async def finalize_upload_session(self, request, session_guid: str = None):
+        # Hashes the assembled upload, so it runs off the ORM thread.
+        return await run_db(finalize_upload_session)(request, session_guid)
+
+    @http_delete(
+        "/upload/session",
+        auth=AsyncFastJWTAuth(),
+        response=[(204, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+    )
+    async def abort_upload_session(self, request, session_guid: str = None):
+        return await sync_to_async(abort_upload_session)(request, session_guid)
+
+    @http_get(
+        "/list",
+        response=[(200, PaginatedFileListSchema), (400, MessageSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def file_list(
+        self,
+        request,
+        size: int = 30,
+        page: int = 0,
+        after: str = None,
+        include_total: bool = True,
+    ):
+        size, page = page_bounds(size, page)
+        _, teams = await aprincipals(request.user.id, request)
+        etag, last_modified = list_validators(
+            request.user.id,
+            teams,
+            await sync_to_async(head_change)(request.user.id, teams),
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        files_query_set = visible_files(request.user.id, teams)
+        offset = 0
+        if after is not None:
+            try:
+                rows = seek(files_query_set, after)
+            except ValueError:
+                return 400, MessageSchema(message="Invalid cursor")
+        else:
+            rows, offset = files_query_set, page * size
+        rows = [row async for row in page_rows(rows, offset, size)]
+        total_items = None
+        if after is None and include_total:
+            total_items = await files_query_set.acount()
+        response = list_response(rows, size, page, after, total_items)
+        set_validators(response, etag, last_modified)
+        return response
+
+    @http_get(
+        "/search",
+        response=[(200, List[FileSchema])],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def file_search(self, request, q: str = "", size: int = 30):
+        size = max(1, min(size, SEARCH_MAX_SIZE))
+        _, teams = await aprincipals(request.user.id, request)
+        file_ids = await sync_to_async(search_file_ids)(request.user.id, teams, q, size)
+        rows = await sync_to_async(file_rows)(request.user.id, teams, file_ids)
+        return rows_response(rows)
+
+    @http_get(
+        "/changes",
+        response=[(200, FileChangeListSchema), (400, MessageSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def file_changes(self, request, since: str = None, size: int = 100):
+        size = min(size, 1000)
+        _, teams = await aprincipals(request.user.id, request)
+        if since is None:
+            head = await sync_to_async(head_id)(request.user.id, teams)
+            return changes_response([], size, head)
+        try:
+            since_id = decode_token(since)
+        except ValueError:
+            return 400, MessageSchema(message="Invalid sync token")
+        rows = [
+            row async for row in page_changes(request.user.id, teams, since_id, size)
+        ]
+        return changes_response(rows, size, since_id)
+
+    @http_get(
+        "/details",
+        response=[
+            (200, FileDetailsSchema),
+            (404, NotFoundSchema),
+            (401, NotFoundSchema),
+        ],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def file_details(self, request, file_guid: str = None):
+        file = await (
+            File.objects.filter(guid=file_guid, is_deleted=False)
+            .values_list("id", "updated_at", "acl_version", "acl_updated_at")
+            .afirst()
+        )
+        if file is None:
+            return 404, NotFoundSchema(message="File not found")
+        if not await ahas_perm(request.user.id, file[0], FileAccess.READ, request):
+            return 401, NotFoundSchema(
+                message="Unauthorized. User does not have permission to view this file"
+            )
+        etag, last_modified = file_validators(*file)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        set_validators(self.context.response, etag, last_modified)
+
+        file = await (
+            File.objects.prefetch_related(
+                Prefetch(
+                    "fileaccess_set",
+                    queryset=FileAccess.objects.filter(
+                        perms__gt=0, user__isnull=False
+                    ).select_related("user"),
+                )
+            )
+            .select_related("file_owner")
+            .aget(id=file[0])
+        )
+        grants = file.fileaccess_set.all()
+        users_with = {
+            perm: [user_schema(obj.user) for obj in grants if obj.perms & perm]
+            for perm in PERMISSION_LABELS
+        }
+        return 200, FileDetailsSchema(
+            guid=file.guid,
+            created_at=file.created_at,
+            file_name=file.file_name,
+            updated_at=file.updated_at,
+            file=file.file.url,
+            file_owner_guid=str(file.file_owner.guid),
+            user_read_access=users_with[FileAccess.READ],
+            user_write_access=users_with[FileAccess.WRITE],
+            user_delete_access=users_with[FileAccess.DELETE],
+        )
+
+    @http_get(
+        "/download",
+        response=[(404, NotFoundSchema), (401, NotFoundSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def file_download(self, request, file_guid: str = None):
+        try:
+            file = await File.objects.select_related("blob").aget(
+                guid=file_guid, is_deleted=False
+            )
+        except File.DoesNotExist:
+            return 404, NotFoundSchema(message="File not found")
+        if not await ahas_perm(request.user.id, file.id, FileAccess.READ, request):
+            return 401, NotFoundSchema(
+                message="Unauthorized. User does not have permission to view this file"
+            )
+        return await run_blocking(serve_file)(request, file)
+
+    @http_put(
+        "/update",
+        auth=AsyncFastJWTAuth(),
+        response=[(200, MessageSchema), (401, NotFoundSchema), (404, NotFoundSchema)],
+    )
+    async def file_update(
+        self,
+        request,
+        data: NinjaForm[FileUpdateSchema],
+        file: UploadedFile = NinjaFile(...),
+    ):
+        try:
+            update_file = await File.objects.select_related("blob").aget(
+                guid=data.file_guid, is_deleted=False
+            )
+        except File.DoesNotExist:
+            return 404, NotFoundSchema(message="File not found")
+        if not await ahas_perm(
+            request.user.id, update_file.id, FileAccess.WRITE, request
+        ):
+            return 401, NotFoundSchema(
+                message="Unauthorized. User does not have write access to this file"
+            )
+        if not await replace_file_content(update_file, data.file_name, file):
+            return 404, NotFoundSchema(message="File not found")
+        return 200, MessageSchema(message="File updated successfully")
+
+    @http_delete(
+        "/delete",
+        response=[(204, MessageSchema), (404, NotFoundSchema), (401, NotFoundSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def delete_file(self, request, file_guid: str = None):
+        try:
+            file = await File.objects.aget(guid=file_guid, is_deleted=False)
+        except File.DoesNotExist:
+            return 404, NotFoundSchema(message="File Does not exist")
+        if not await ahas_perm(request.user.id, file.id, FileAccess.DELETE, request):
+            return 401, NotFoundSchema(
+                message="Unauthorized. User does not have permission to delete this file"
+            )
+        if not await soft_delete_file(file):
+            return 404, NotFoundSchema(message="File Does not exist")
+        return 204, MessageSchema(message="File has been deleted successfully.")
+
+
+async def resolve_grant(data: FileProvideAccessSchema):
+    """Look up the user and file id of an access request, or the 404 to return."""
+    user = await aresolve_user(data.user_email)
+    if user is None:
+        return None, None, (404, NotFoundSchema(message="User Not Found"))
+    file_id = await aresolve_file(data.file_guid)
+    if file_id is None:
+        return None, None, (404, NotFoundSchema(message="File Not Found"))
+    return user, file_id, None
+
+
+async def grant_access(perm: int, data: FileProvideAccessSchema):
+    user, file_id, error = await resolve_grant(data)
+    if error:
+        return error
+    label = PERMISSION_LABELS[perm]
+    if not await agrant(file_id, user.id, perm):
+        return 409, MessageSchema(message="User already has " + label + " access")
+    return 201, MessageSchema(
+        message="User " + user.name + " has been provided " + label + " access"
+    )
+
+
+async def revoke_access(perm: int, data: FileProvideAccessSchema):
+    user, file_id, error = await resolve_grant(data)
+    if error:
+        return error
+    label = PERMISSION_LABELS[perm]
+    if not await arevoke(file_id, user.id, perm):
+        return 409, MessageSchema(
+            message="User does not have " + label + " access for this file"
+        )
+    return 201, MessageSchema(
+        message="User " + user.name + " " + label + " access has been removed"
+    )
+
+
+ACCESS_RESPONSES = [(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)]
+
+
+@api_controller(
+    "/async/access", tags=["Async Access API"], auth=NOT_SET, permissions=[]
+)
+class AsyncAccessController:
+    """ASGI-native counterparts of AccessController."""
+
+    @http_post(
+        "/bulk",
+        response=[(200, BulkAccessResponseSchema), (400, MessageSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def bulk_access(self, request, data: BulkAccessSchema):
+        return await sync_to_async(bulk_access)(request, data)
+
+    @http_post(
+        "/check",
+        response=[(200, AccessCheckResponseSchema), (400, MessageSchema)],
+        auth=AsyncFastJWTAuth(),
+    )
+    async def access_check(self, request, data: AccessCheckSchema):
+        return await sync_to_async(access_check)(request, data)
+
+    @http_post("/team", response=ACCESS_RESPONSES, auth=AsyncFastJWTAuth())
+    async def team_access(self, request, data: FileTeamAccessSchema):
+        return await sync_to_async(team_access)(request, data)
+
+    @http_post("/read/create", response=ACCESS_RESPONSES)
+    async def create_read_access(self, request, data: FileProvideAccessSchema):
+        return await grant_access(FileAccess.READ, data)
+
+    @http_post("/update/create", response=ACCESS_RESPONSES)
+    async def create_update_access(self, request, data: FileProvideAccessSchema):
+        return await grant_access(FileAccess.WRITE, data)
+
+    @http_post("/delete/create", response=ACCESS_RESPONSES)
+    async def create_delete_access(self, request, data: FileProvideAccessSchema):
+        return await grant_access(FileAccess.DELETE, data)
+
+    @http_post("/read/remove", response=ACCESS_RESPONSES)
+    async def remove_read_access(self, request, data: FileProvideAccessSchema):
+        return await revoke_access(FileAccess.READ, data)
+
+    @http_post("/update/remove", response=ACCESS_RESPONSES)
+    async def remove_update_access(self, request, data: FileProvideAccessSchema):
+        return await revoke_access(FileAccess.WRITE, data)
+
+    @http_post("/delete/remove", response=ACCESS_RESPONSES)
+    async def remove_delete_access(self, request, data: FileProvideAccessSchema):
+        return await revoke_access(FileAccess.DELETE, data)
@@ -0,0 +1,85 @@
+from django.db.models import Q
+from django.http import JsonResponse
+
+from core.metrics import serializing
+from core.pagination import decode_cursor, encode_cursor
+from file.listing import serialize_row
+from file.models import FileChange
+
+CHANGE_COLUMNS = (
+    "id",
+    "action",
+    "visible",
+    "created_at",
+    "file_id",
+    "file__created_at",
+    "file__guid",
+    "file__file_name",
+    "file__file_owner__guid",
+    "file__file",
+)
+
+
+def decode_token(token: str) -> int:
+    """Journal id a sync token points at. Raises ValueError for a bad token."""
+    try:
+        (change_id,) = decode_cursor(token)
+        return int(change_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid sync token") from e
+
+
+def journal(user_id, teams=()):
+    """Changes addressed to the user or to one of ``teams``."""
+    if teams:
+        return FileChange.objects.filter(Q(user_id=user_id) | Q(team_id__in=teams))
+    return FileChange.objects.filter(user_id=user_id)
+
+
+def head_id(user_id, teams=()) -> int:
+    return (
+        journal(user_id, teams).order_by("-id").values_list("id", flat=True).first()
+        or 0
+    )
+
+
+def head_change(user_id, teams=()):
+    """``(id, created_at)`` of the newest change the user can see, or None."""
+    return (
+        journal(user_id, teams).order_by("-id").values_list("id", "created_at").first()
+    )
+
+
+def page_changes(user_id, teams, since_id: int, size: int):
+    """One query for the next ``size`` changes plus one to detect more."""
+    return (
+        journal(user_id, teams)
+        .filter(id__gt=since_id)
+        .order_by("id")
+        .values_list(*CHANGE_COLUMNS)[: size + 1]
+    )
+
+
+def changes_response(rows, size: int, since_id: int) -> JsonResponse:
+    """Render a FileChangeListSchema body straight from ``page_changes`` rows."""
+    with serializing():
+        has_more = len(rows) > size
+        rows = rows[:size]
+        changes = []
+        for change_id, action, visible, changed_at, *file_row in rows:
+            changes.append(
+                {
+                    "action": action,
+                    "visible": visible,
+                    "changed_at": changed_at,
+                    "file_guid": file_row[2],
+                    "file": serialize_row(file_row) if visible else None,
+                }
+            )
+        return JsonResponse(
+            {
+                "changes": changes,
+                "next_token": encode_cursor(rows[-1][0] if rows else since_id),
+                "has_more": has_more,
+            }
+        )
@@ -0,0 +1,44 @@
+import zlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Validators are weak: they say the representation has not changed in meaning,
+# which is all a polling client needs, and stay cheap to compute.
+
+
+def file_validators(file_id, updated_at, acl_version: int, acl_updated_at):
+    """ETag and Last-Modified timestamp of a file's details."""
+    stamp = int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+    etag = f'W/"file-{file_id}-{stamp:x}-{acl_version}"'
+    changed = [moment for moment in (updated_at, acl_updated_at) if moment]
+    return etag, int(max(changed).timestamp()) if changed else None
+
+
+def list_validators(user_id, teams, head):
+    """
+    ETag and Last-Modified timestamp of a user's file list, from the newest
+    FileChange journaled for them or their ``teams`` as ``(id, created_at)``.
+    Every event that can alter their list is journaled, so the head moves
+    whenever it does; joining or leaving a team changes the team part.
+    """
+    change_id, changed_at = head or (0, None)
+    team_hash = zlib.crc32(",".join(map(str, sorted(teams))).encode())
+    etag = f'W/"files-{user_id}-{change_id}-{team_hash:x}"'
+    return etag, int(changed_at.timestamp()) if changed_at else None
+
+
+def not_modified(request, etag: str, last_modified):
+    """A 304 response when the request's validators match, otherwise None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag: str, last_modified) -> None:
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Responses differ per user; let clients store them but always revalidate.
+    response["Cache-Control"] = "private, no-cache"
@@ -0,0 +1,187 @@
+import mimetypes
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import (
+    content_disposition_header,
+    http_date,
+    parse_etags,
+    quote_etag,
+)
+
+from file.models import File
+from file.storage import STREAM_BLOCK_SIZE
+
+MAX_RANGES = 16
+
+
+class FileRange:
+    """
+    File-like view of ``length`` bytes starting at ``offset``. It keeps
+    ``fileno()`` so WSGI servers that implement ``wsgi.file_wrapper`` with
+    ``os.sendfile`` can still send the range without copying it through Python.
+    """
+
+    def __init__(self, file, offset: int, length: int):
+        file.seek(offset)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def file_etag(file: File) -> str:
+    """Strong validator: the content digest, or size and mtime for legacy files."""
+    if file.blob_id:
+        return quote_etag(file.blob.digest)
+    stat = os.stat(default_storage.path(file.file.name))
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a ``bytes=`` Range header into sorted, coalesced ``(start, end)``
+    pairs with inclusive ends. Returns ``None`` when the header should be
+    ignored and an empty list when no range is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                # Only a range the client wrote backwards is invalid; one
+                # starting past the end is unsatisfiable (416).
+                if last and end < start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _multipart_body(path: str, ranges, parts):
+    with open(path, "rb") as stored:
+        for (start, end), part_header in zip(ranges, parts[:-1]):
+            yield part_header
+            body = FileRange(stored, start, end - start + 1)
+            for block in iter(lambda: body.read(STREAM_BLOCK_SIZE), b""):
+                yield block
+        yield parts[-1]
+
+
+def _offload_response(file: File) -> HttpResponse:
+    response = HttpResponse()
+    name = file.file.name
+    if settings.FILE_DOWNLOAD_OFFLOAD == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + name
+    else:
+        response["X-Sendfile"] = default_storage.path(name)
+    # Let the front-end server pick the type from the file it serves.
+    del response["Content-Type"]
+    return response
+
+
+def serve_file(request, file: File):
+    """
+    Build the download response for ``file``: 304 for a matching
+    ``If-None-Match``, 206 for satisfiable ranges (honouring ``If-Range``),
+    416 for unsatisfiable ones and 200 otherwise.
+    """
+    etag = file_etag(file)
+    last_modified = http_date(file.updated_at.timestamp()) if file.updated_at else None
+    filename = file.file_name or os.path.basename(file.file.name)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (
+        if_none_match.strip() == "*" or etag in parse_etags(if_none_match)
+    ):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    if settings.FILE_DOWNLOAD_OFFLOAD:
+        response = _offload_response(file)
+    else:
+        path = default_storage.path(file.file.name)
+        size = os.path.getsize(path)
+        ranges = None
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        if range_header and (not if_range or if_range.strip() == etag):
+            ranges = parse_range(range_header, size)
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        elif ranges and len(ranges) == 1:
+            start, end = ranges[0]
+            response = FileResponse(
+                FileRange(open(path, "rb"), start, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Length"] = end - start + 1
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        elif ranges:
+            boundary = uuid.uuid4().hex
+            parts = [
+                (
+                    f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode()
+                for start, end in ranges
+            ]
+            parts.append(f"\r\n--{boundary}--\r\n".encode())
+            response = StreamingHttpResponse(
+                _multipart_body(path, ranges, parts),
+                status=206,
+                content_type=f"multipart/byteranges; boundary={boundary}",
+            )
+            response["Content-Length"] = sum(map(len, parts)) + sum(
+                end - start + 1 for start, end in ranges
+            )
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        response.block_size = STREAM_BLOCK_SIZE
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = last_modified
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
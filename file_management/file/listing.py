@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import JsonResponse
+
+from core.metrics import serializing
+from core.pagination import decode_cursor, encode_cursor
+from file.models import UserFileIndex
+
+LIST_ORDERING = ("created_at", "file_id")
+LIST_COLUMNS = (
+    "file_id",
+    "created_at",
+    "file__guid",
+    "file_name",
+    "file__file_owner__guid",
+    "file__file",
+)
+LIST_MAX_SIZE = 1000
+SEARCH_MAX_SIZE = 100
+
+
+def _visible_to(user_id, teams):
+    if teams:
+        return UserFileIndex.objects.filter(Q(user_id=user_id) | Q(team_id__in=teams))
+    return UserFileIndex.objects.filter(user_id=user_id)
+
+
+def visible_file_ids(user_id, teams=()):
+    """Subquery of the ids of files the user or one of ``teams`` can see."""
+    return _visible_to(user_id, teams).values("file_id")
+
+
+def visible_files(user_id, teams=()):
+    """
+    List rows of the files the user owns or can read, directly or through one
+    of ``teams``, in keyset order. Each principal's rows are a range on its
+    ``*_file_index_seek_idx``; a file reachable several ways is listed once.
+    """
+    rows = (
+        _visible_to(user_id, teams).values_list(*LIST_COLUMNS).order_by(*LIST_ORDERING)
+    )
+    return rows.distinct() if teams else rows
+
+
+def seek(queryset, cursor: str):
+    """Rows strictly after ``cursor``. Raises ValueError for a bad cursor."""
+    if not cursor:
+        return queryset
+    try:
+        created_at, file_id = decode_cursor(cursor)
+        created_at = datetime.fromisoformat(created_at)
+        file_id = int(file_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, file_id__gt=file_id)
+    )
+
+
+def page_bounds(size: int, page: int):
+    """``size`` clamped to 1..LIST_MAX_SIZE and ``page`` to 0 or more."""
+    return max(1, min(size, LIST_MAX_SIZE)), max(page, 0)
+
+
+def page_rows(queryset, offset: int, size: int):
+    """
+    One query for a page of list rows as plain tuples, plus one extra row that
+    tells the caller whether another page exists.
+    """
+    return queryset[offset : offset + size + 1]
+
+
+def file_rows(user_id, teams, file_ids) -> list:
+    """List rows of the visible files among ``file_ids``, in that order."""
+    rows = {
+        row[0]: row
+        for row in visible_files(user_id, teams).filter(file_id__in=file_ids)
+    }
+    return [rows[file_id] for file_id in file_ids if file_id in rows]
+
+
+def serialize_row(row) -> dict:
+    file_id, created_at, guid, file_name, owner_guid, storage_name = row
+    return {
+        "guid": guid,
+        "created_at": created_at,
+        "file_name": file_name,
+        "file_owner_guid": str(owner_guid),
+        "file": default_storage.url(storage_name),
+    }
+
+
+def rows_response(rows) -> JsonResponse:
+    """Render a list of FileSchema bodies straight from ``file_rows`` tuples."""
+    with serializing():
+        return JsonResponse([serialize_row(row) for row in rows], safe=False)
+
+
+def list_response(rows, size: int, page: int, after: str, total_items) -> JsonResponse:
+    """
+    Render a PaginatedFileListSchema body straight from ``page_rows`` tuples,
+    skipping per-row model and schema instances.
+    """
+    with serializing():
+        has_next = len(rows) > size
+        rows = rows[:size]
+        total_pages = None
+        if total_items is not None:
+            total_pages = (total_items + size - 1) // size
+        return JsonResponse(
+            {
+                "page": page if after is None else 0,
+                "size": size,
+                "total_items": total_items,
+                "total_pages": total_pages,
+                "has_next": has_next,
+                "has_prev": bool(after) if after is not None else page > 0,
+                "next_cursor": (
+                    encode_cursor(rows[-1][1].isoformat(), rows[-1][0])
+                    if has_next
+                    else None
+                ),
+                "data": [serialize_row(row) for row in rows],
+            }
+        )
@@ -0,0 +1,181 @@
+import hashlib
+import uuid
+from functools import partial
+from typing import NamedTuple
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import DEFAULT_DB_ALIAS
+
+from core.cache import agenerations, cache_stats, generations, rotate_generations
+from file.models import File
+from user.models import User
+
+# Email -> user and guid -> file id, shared across requests through the
+# "lookups" cache. Only hits are cached, so a user who signs up or a file that
+# is uploaded later resolves at once. Keys carry a generation of the email or
+# guid (see core.cache.generations) that email or name changes and file
+# deletes replace at commit, so a mapping read before the change is never
+# re-cached. Loads read the primary, so a lagging replica cannot bring one
+# back either. The cache timeout bounds any other staleness, e.g. edits made
+# in the admin, and with a per-process cache also how long other processes
+# keep a mapping that was invalidated elsewhere.
+LOOKUP_CACHE = "lookups"
+user_stats = cache_stats("user-lookups")
+file_stats = cache_stats("file-lookups")
+
+
+class UserRef(NamedTuple):
+    id: int
+    name: str
+
+
+def guid_key(guid: str):
+    """The canonical form of ``guid``, or None if it is not a UUID."""
+    try:
+        return str(uuid.UUID(str(guid)))
+    except ValueError:
+        return None
+
+
+def _email_id(email: str) -> str:
+    # Hashed so any email is a valid key for every cache backend.
+    return hashlib.sha1(email.encode()).hexdigest()
+
+
+def _user_key(email_id: str, generation) -> str:
+    return f"user-email:{email_id}:{generation}"
+
+
+def _file_key(guid: str, generation) -> str:
+    return f"file-guid:{guid}:{generation}"
+
+
+# Unlike permission generations these expire: most names looked up never
+# resolve, and a lost generation only orphans the mappings stored under it.
+_generations = partial(generations, LOOKUP_CACHE, timeout=DEFAULT_TIMEOUT)
+_agenerations = partial(agenerations, LOOKUP_CACHE, timeout=DEFAULT_TIMEOUT)
+_rotate = partial(rotate_generations, LOOKUP_CACHE, timeout=DEFAULT_TIMEOUT)
+
+
+def _load_users(emails) -> dict:
+    return {
+        email: (user_id, name)
+        for email, user_id, name in User.objects.using(DEFAULT_DB_ALIAS)
+        .filter(email__in=emails)
+        .values_list("email", "id", "name")
+    }
+
+
+def _load_files(guids) -> dict:
+    return {
+        str(guid): file_id
+        for guid, file_id in File.objects.using(DEFAULT_DB_ALIAS)
+        .filter(guid__in=guids, is_deleted=False)
+        .values_list("guid", "id")
+    }
+
+
+def _split(keys: dict, cached: dict, stats):
+    found = {value: cached[key] for key, value in keys.items() if key in cached}
+    missing = [value for key, value in keys.items() if key not in cached]
+    stats.hit(len(found))
+    stats.miss(len(missing))
+    return found, missing
+
+
+def resolve_users(emails) -> dict:
+    """``{email: UserRef}`` of the given emails that belong to a user."""
+    cache = caches[LOOKUP_CACHE]
+    ids = {_email_id(email): email for email in set(emails)}
+    keys = {
+        _user_key(email_id, generation): ids[email_id]
+        for email_id, generation in _generations("user-email", ids).items()
+    }
+    found, missing = _split(keys, cache.get_many(list(keys)), user_stats)
+    if missing:
+        loaded = _load_users(missing)
+        cache.set_many(
+            {key: loaded[email] for key, email in keys.items() if email in loaded}
+        )
+        found.update(loaded)
+    return {email: UserRef(*user) for email, user in found.items()}
+
+
+def resolve_files(guids) -> dict:
+    """``{guid: file_id}`` of the given guids that name a live file."""
+    cache = caches[LOOKUP_CACHE]
+    guids = {guid_key(guid) for guid in guids} - {None}
+    keys = {
+        _file_key(guid, generation): guid
+        for guid, generation in _generations("file-guid", guids).items()
+    }
+    found, missing = _split(keys, cache.get_many(list(keys)), file_stats)
+    if missing:
+        loaded = _load_files(missing)
+        cache.set_many(
+            {key: loaded[guid] for key, guid in keys.items() if guid in loaded}
+        )
+        found.update(loaded)
+    return found
+
+
+def resolve_user(email: str):
+    return resolve_users([email]).get(email)
+
+
+def resolve_file(guid: str):
+    return resolve_files([guid]).get(guid_key(guid))
+
+
+async def aresolve_user(email: str):
+    cache = caches[LOOKUP_CACHE]
+    email_id = _email_id(email)
+    generation = (await _agenerations("user-email", [email_id]))[email_id]
+    user = await cache.aget(_user_key(email_id, generation))
+    if user is None:
+        user_stats.miss()
+        user = (
+            await User.objects.using(DEFAULT_DB_ALIAS)
+            .filter(email=email)
+            .values_list("id", "name")
+            .afirst()
+        )
+        if user is None:
+            return None
+        await cache.aset(_user_key(email_id, generation), user)
+    else:
+        user_stats.hit()
+    return UserRef(*user)
+
+
+async def aresolve_file(guid: str):
+    guid = guid_key(guid)
+    if guid is None:
+        return None
+    cache = caches[LOOKUP_CACHE]
+    generation = (await _agenerations("file-guid", [guid]))[guid]
+    file_id = await cache.aget(_file_key(guid, generation))
+    if file_id is None:
+        file_stats.miss()
+        file_id = (
+            await File.objects.using(DEFAULT_DB_ALIAS)
+            .filter(guid=guid, is_deleted=False)
+            .values_list("id", flat=True)
+            .afirst()
+        )
+        if file_id is None:
+            return None
+        await cache.aset(_file_key(guid, generation), file_id)
+    else:
+        file_stats.hit()
+    return file_id
+
+
+def forget_user(email: str) -> None:
+    """Invalidate ``email`` once the current transaction commits."""
+    _rotate("user-email", [_email_id(email)])
+
+
+def forget_file(guid) -> None:
+    _rotate("file-guid", [guid_key(guid)])
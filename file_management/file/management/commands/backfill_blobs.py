@@ -0,0 +1,59 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from file.models import Blob, File
+from file.storage import discard, lock_file, stored_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Attach files uploaded before content deduplication to blobs. A file "
+        "whose content is already stored is pointed at that blob and its own "
+        "copy deleted; otherwise its bytes become a new blob where they are."
+    )
+
+    def handle(self, *args, **options):
+        file_ids = File.objects.filter(blob__isnull=True, is_deleted=False)
+        linked = shared = missing = 0
+        for file_id in file_ids.values_list("id", flat=True).iterator():
+            result = self.backfill(file_id)
+            if result == "missing":
+                missing += 1
+            elif result == "shared":
+                shared += 1
+            elif result == "linked":
+                linked += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Attached {linked + shared} files to blobs, {shared} of them "
+                f"to content already stored; {missing} files have no content"
+            )
+        )
+
+    def backfill(self, file_id):
+        file = File.objects.filter(pk=file_id).first()
+        if file is None or not file.file or not default_storage.exists(file.file.name):
+            return "missing"
+        digest = stored_digest(file.file.name)
+        with transaction.atomic():
+            file = lock_file(file_id)
+            if file is None or file.blob_id:
+                return None
+            name = file.file.name
+            blob, created = Blob.objects.select_for_update().get_or_create(
+                digest=digest, defaults={"size": default_storage.size(name)}
+            )
+            if created or not default_storage.exists(blob.file.name):
+                blob.file = name
+                result = "linked"
+            else:
+                file.file = blob.file.name
+                if name != blob.file.name:
+                    transaction.on_commit(lambda: discard(name))
+                result = "shared"
+            blob.ref_count += 1
+            blob.save()
+            file.blob = blob
+            file.save(update_fields=["blob", "file"])
+        return result
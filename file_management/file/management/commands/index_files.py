@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from file.models import FileText
+from file.search import index_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract search text for files still waiting to be indexed, e.g. after "
+        "a restart dropped queued jobs or after migrating existing files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Re-extract text for every file."
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            FileText.objects.update(indexed_at=None)
+        file_ids = FileText.objects.filter(indexed_at__isnull=True).values_list(
+            "file_id", flat=True
+        )
+        count = 0
+        for file_id in file_ids.iterator():
+            index_file(file_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} files"))
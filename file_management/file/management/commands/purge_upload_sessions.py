@@ -0,0 +1,50 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from file.models import UploadSession
+from file.storage import discard
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete unfinished upload sessions that received no chunk for longer "
+        "than FILE_UPLOAD_SESSION_EXPIRY and free the storage reserved for them. "
+        "Run it periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=settings.FILE_UPLOAD_SESSION_EXPIRY,
+            help="Idle time in seconds after which an unfinished session is stale.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options["older_than"])
+        # Idle since the last chunk, or since creation if none arrived.
+        stale = UploadSession.objects.filter(
+            Q(last_chunk_at__lt=cutoff)
+            | Q(last_chunk_at__isnull=True, created_at__lt=cutoff),
+            completed_at__isnull=True,
+            is_deleted=False,
+        )
+        count = 0
+        for session_id in stale.values_list("id", flat=True).iterator():
+            with transaction.atomic():
+                # Locked and re-checked: it may have been finalized meanwhile.
+                session = stale.select_for_update().filter(pk=session_id).first()
+                if session is None:
+                    continue
+                session.is_deleted = True
+                session.deleted_at = timezone.now()
+                session.save()
+                transaction.on_commit(partial(discard, session.storage_name))
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} upload sessions"))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from file.access import index_rows
+from file.models import File, UserFileIndex
+
+INDEX_COLUMNS = ("user_id", "team_id", "file_id", "perms", "created_at", "file_name")
+
+
+def row_key(row) -> tuple:
+    return tuple(getattr(row, column) for column in INDEX_COLUMNS)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the UserFileIndex listing table from File and FileAccess."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report rows that are missing, stale or extra; exit non-zero "
+            "if any are found.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, verify=False, batch_size=1000, **options):
+        file_ids = File.objects.order_by("id").values_list("id", flat=True)
+        missing = extra = files = 0
+        last_id = 0
+        while True:
+            batch = list(file_ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            files += len(batch)
+            with transaction.atomic():
+                expected = index_rows(batch)
+                current = UserFileIndex.objects.filter(file_id__in=batch)
+                if verify:
+                    wanted = {row_key(row) for row in expected}
+                    found = set(current.values_list(*INDEX_COLUMNS))
+                    missing += len(wanted - found)
+                    extra += len(found - wanted)
+                else:
+                    current.delete()
+                    UserFileIndex.objects.bulk_create(expected)
+
+        if not verify:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt index for {files} files"))
+            return
+        if missing or extra:
+            raise CommandError(
+                f"Index is out of date: {missing} rows missing or stale, "
+                f"{extra} rows extra or stale across {files} files"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Index matches {files} files"))
@@ -0,0 +1,286 @@
+import bisect
+import hashlib
+import itertools
+import math
+import random
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from file.access import index_rows
+from file.models import Blob, File, FileAccess, FileText, UserFileIndex
+from file.storage import blob_name
+from user.models import User
+
+# Grant masks and their relative weights: most shares are read-only.
+GRANT_MASKS = (
+    (FileAccess.READ, 60),
+    (FileAccess.READ | FileAccess.WRITE, 25),
+    (FileAccess.ALL, 10),
+    (FileAccess.WRITE, 3),
+    (FileAccess.DELETE, 2),
+)
+# Shape of the grants-per-file distribution; lower is more skewed.
+PARETO_ALPHA = 1.5
+WORDS = (
+    "report invoice draft budget roadmap notes minutes contract design review "
+    "summary plan forecast backlog release audit policy memo schedule proposal "
+    "analysis survey research outline handbook checklist agenda estimate ledger"
+).split()
+TEXT_BLOCK_SIZE = 64 * 1024
+
+
+def zipf_weights(count: int, skew: float) -> list:
+    """Cumulative weights where rank ``r`` is drawn in proportion to 1/(r+1)^skew."""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def seeded_uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible scale-testing dataset: users, files backed by "
+        "real blobs of log-normally distributed sizes, and read/write/delete "
+        "grants whose number per file and recipients are heavily skewed. Rows "
+        "are written with bulk_create in batches; the same --seed gives the "
+        "same data. For over a million ACL rows: --users 10000 --files 120000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--files", type=int, default=10000)
+        parser.add_argument(
+            "--grants-per-file",
+            type=float,
+            default=10,
+            help="Mean number of users each file is shared with.",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent for picking owners, grantees and blob contents.",
+        )
+        parser.add_argument(
+            "--blobs",
+            type=int,
+            default=1000,
+            help="Distinct contents written to storage; files share them.",
+        )
+        parser.add_argument(
+            "--median-size", type=int, default=16 * 1024, help="In bytes."
+        )
+        parser.add_argument(
+            "--size-sigma",
+            type=float,
+            default=1.0,
+            help="Spread of the log-normal blob size distribution.",
+        )
+        parser.add_argument("--max-size", type=int, default=8 * 1024 * 1024)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--prefix",
+            default="seed",
+            help="Seeded users are <prefix><n>@example.com.",
+        )
+        parser.add_argument("--password", default="Seed-Password-1")
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["files"] < 0 or options["blobs"] < 1:
+            raise CommandError("Need at least one user and one blob")
+        prefix = options["prefix"]
+        if User.objects.filter(email=f"{prefix}0@example.com").exists():
+            raise CommandError(
+                f"Users with the {prefix!r} prefix already exist, pass another --prefix"
+            )
+
+        self.rng = random.Random(options["seed"])
+        self.started = time.perf_counter()
+        user_ids = self.create_users(options)
+        blobs = self.create_blobs(options)
+        self.create_files(options, user_ids, blobs)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(user_ids)} users, {options['files']} files on "
+                f"{len(blobs)} blobs and {self.acl_rows} ACL rows in {elapsed:.1f}s. "
+                "Run index_files to extract their search text."
+            )
+        )
+
+    def progress(self, message: str) -> None:
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f"{message} ({elapsed:.1f}s)")
+
+    def create_users(self, options) -> list:
+        # Every seeded user shares one hash; hashing per user would dominate.
+        password = make_password(options["password"])
+        user_ids = []
+        for start in range(0, options["users"], options["batch_size"]):
+            stop = min(start + options["batch_size"], options["users"])
+            users = []
+            for index in range(start, stop):
+                user = User.objects.build_user(
+                    email=f"{options['prefix']}{index}@example.com",
+                    name=f"{options['prefix']} {index}",
+                    is_verified=True,
+                    guid=seeded_uuid(self.rng),
+                )
+                user.password = password
+                users.append(user)
+            with transaction.atomic():
+                user_ids += [user.pk for user in self.insert(User, users)]
+            self.progress(f"{len(user_ids)} users")
+        return user_ids
+
+    def blob_content(self, size: int) -> bytes:
+        """``size`` bytes of text, so the search indexer has words to extract."""
+        block = " ".join(
+            self.rng.choices(WORDS, k=min(size, TEXT_BLOCK_SIZE) // 6 + 1)
+        ).encode()
+        return (block * (size // len(block) + 1))[:size]
+
+    def create_blobs(self, options) -> list:
+        mu = math.log(options["median_size"])
+        blobs = []
+        for _ in range(options["blobs"]):
+            size = int(self.rng.lognormvariate(mu, options["size_sigma"]))
+            size = max(1, min(size, options["max_size"]))
+            content = self.blob_content(size)
+            # A unique header keeps contents distinct, as a blob per digest requires.
+            content = f"{seeded_uuid(self.rng)}\n".encode() + content[37:]
+            blob = Blob(size=len(content))
+            blob.digest = hashlib.sha256(content).hexdigest()
+            name = blob_name(blob.digest)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(content))
+            blob.file = name
+            blobs.append(blob)
+        existing = dict(
+            Blob.objects.filter(digest__in=[blob.digest for blob in blobs]).values_list(
+                "digest", "id"
+            )
+        )
+        with transaction.atomic():
+            self.insert(Blob, [blob for blob in blobs if blob.digest not in existing])
+        for blob in blobs:
+            if blob.digest in existing:
+                blob.pk = existing[blob.digest]
+        self.progress(f"{len(blobs)} blobs")
+        return blobs
+
+    def create_files(self, options, user_ids: list, blobs: list) -> None:
+        rng = self.rng
+        users = len(user_ids)
+        # Independent popularity orders for owning and for receiving shares.
+        owners = rng.sample(user_ids, users)
+        grantees = rng.sample(user_ids, users)
+        user_weights = zipf_weights(users, options["skew"])
+        blob_weights = zipf_weights(len(blobs), options["skew"])
+        masks, mask_weights = zip(*GRANT_MASKS)
+        mask_weights = list(itertools.accumulate(mask_weights))
+        mean = options["grants_per_file"]
+        scale = mean * (PARETO_ALPHA - 1) / PARETO_ALPHA
+        now = timezone.now()
+        references = Counter()
+        self.acl_rows = 0
+
+        for start in range(0, options["files"], options["batch_size"]):
+            stop = min(start + options["batch_size"], options["files"])
+            files = []
+            for index in range(start, stop):
+                blob = blobs[_pick(rng, blob_weights)]
+                references[blob.pk] += 1
+                files.append(
+                    File(
+                        guid=seeded_uuid(rng),
+                        file_name=f"{rng.choice(WORDS)}-{index}.txt",
+                        file=blob.file.name,
+                        blob_id=blob.pk,
+                        file_owner_id=owners[_pick(rng, user_weights)],
+                        updated_at=now,
+                    )
+                )
+            access = []
+            for file in files:
+                access.append(
+                    FileAccess(
+                        guid=seeded_uuid(rng),
+                        file=file,
+                        user_id=file.file_owner_id,
+                        perms=FileAccess.ALL,
+                    )
+                )
+                shares = 0
+                if mean > 0:
+                    shares = min(
+                        int(rng.paretovariate(PARETO_ALPHA) * scale), users - 1
+                    )
+                shared_with = {file.file_owner_id}
+                while len(shared_with) <= shares:
+                    user_id = grantees[_pick(rng, user_weights)]
+                    if user_id in shared_with:
+                        continue
+                    shared_with.add(user_id)
+                    access.append(
+                        FileAccess(
+                            guid=seeded_uuid(rng),
+                            file=file,
+                            user_id=user_id,
+                            perms=masks[_pick(rng, mask_weights)],
+                        )
+                    )
+            with transaction.atomic():
+                self.insert(File, files)
+                for row in access:
+                    row.file_id = row.file.pk
+                FileAccess.objects.bulk_create(access, batch_size=options["batch_size"])
+                UserFileIndex.objects.bulk_create(
+                    index_rows([file.pk for file in files]),
+                    batch_size=options["batch_size"],
+                )
+                FileText.objects.bulk_create(
+                    FileText(file_id=file.pk, file_name=file.file_name or "")
+                    for file in files
+                )
+            self.acl_rows += len(access)
+            self.progress(f"{stop} files, {self.acl_rows} ACL rows")
+
+        # Blobs may already be referenced by files outside the seed.
+        with transaction.atomic():
+            for blob_id, count in references.items():
+                Blob.objects.filter(pk=blob_id).update(ref_count=F("ref_count") + count)
+
+    def insert(self, model, objects: list) -> list:
+        """
+        bulk_create ``objects`` and make sure each has its primary key, looking
+        them up by guid or digest on databases that do not return them.
+        """
+        model.objects.bulk_create(objects)
+        missing = [obj for obj in objects if obj.pk is None]
+        if missing:
+            key = "digest" if model is Blob else "guid"
+            ids = dict(
+                model.objects.filter(
+                    **{key + "__in": [getattr(obj, key) for obj in missing]}
+                ).values_list(key, "id")
+            )
+            for obj in missing:
+                obj.pk = ids[getattr(obj, key)]
+        return objects
+
+
+def _pick(rng: random.Random, cum_weights: list) -> int:
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
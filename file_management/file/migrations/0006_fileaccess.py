@@ -0,0 +1,113 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:08
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+LEGACY_ACCESS_MODELS = (("ReadAccess", 1), ("WriteAccess", 2), ("DeleteAccess", 4))
+
+
+def merge_legacy_access(apps, schema_editor):
+    FileAccess = apps.get_model("file", "FileAccess")
+    perms = {}
+    for model_name, bit in LEGACY_ACCESS_MODELS:
+        rows = (
+            apps.get_model("file", model_name)
+            .objects.filter(is_deleted=False, file__isnull=False, user__isnull=False)
+            .values_list("file_id", "user_id")
+        )
+        for key in rows.iterator():
+            perms[key] = perms.get(key, 0) | bit
+    FileAccess.objects.bulk_create(
+        [
+            FileAccess(file_id=file_id, user_id=user_id, perms=mask)
+            for (file_id, user_id), mask in perms.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def split_file_access(apps, schema_editor):
+    rows = list(
+        apps.get_model("file", "FileAccess")
+        .objects.filter(perms__gt=0)
+        .values_list("file_id", "user_id", "perms")
+    )
+    for model_name, bit in LEGACY_ACCESS_MODELS:
+        model = apps.get_model("file", model_name)
+        model.objects.bulk_create(
+            [
+                model(file_id=file_id, user_id=user_id)
+                for file_id, user_id, mask in rows
+                if mask & bit
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0005_blob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileAccess",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now=True)),
+                ("deleted_at", models.DateTimeField(blank=True, null=True)),
+                ("is_deleted", models.BooleanField(default=False)),
+                (
+                    "guid",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                ("perms", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "file",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="file.file",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="fileaccess",
+            constraint=models.UniqueConstraint(
+                fields=("file", "user"), name="unique_file_access_user"
+            ),
+        ),
+        migrations.RunPython(merge_legacy_access, split_file_access),
+        migrations.DeleteModel(
+            name="DeleteAccess",
+        ),
+        migrations.DeleteModel(
+            name="ReadAccess",
+        ),
+        migrations.DeleteModel(
+            name="WriteAccess",
+        ),
+    ]
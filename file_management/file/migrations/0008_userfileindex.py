@@ -0,0 +1,103 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+READ = 1
+
+
+def populate_index(apps, schema_editor):
+    File = apps.get_model("file", "File")
+    FileAccess = apps.get_model("file", "FileAccess")
+    UserFileIndex = apps.get_model("file", "UserFileIndex")
+    perms = {}
+    for file_id, user_id, mask in (
+        FileAccess.objects.filter(user__isnull=False)
+        .values_list("file_id", "user_id", "perms")
+        .iterator()
+    ):
+        perms.setdefault(file_id, {})[user_id] = mask
+    rows = []
+    for file_id, owner_id, created_at, file_name in (
+        File.objects.filter(is_deleted=False)
+        .values_list("id", "file_owner_id", "created_at", "file_name")
+        .iterator()
+    ):
+        granted = perms.get(file_id, {})
+        visible = {user_id: mask for user_id, mask in granted.items() if mask & READ}
+        if owner_id is not None:
+            visible[owner_id] = granted.get(owner_id, 0)
+        rows.extend(
+            UserFileIndex(
+                user_id=user_id,
+                file_id=file_id,
+                perms=mask,
+                created_at=created_at,
+                file_name=file_name,
+            )
+            for user_id, mask in visible.items()
+        )
+        if len(rows) >= 1000:
+            UserFileIndex.objects.bulk_create(rows)
+            rows = []
+    UserFileIndex.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0007_file_created_id_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserFileIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("perms", models.PositiveSmallIntegerField(default=0)),
+                ("created_at", models.DateTimeField()),
+                ("file_name", models.CharField(blank=True, max_length=30, null=True)),
+                (
+                    "file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="file.file",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at", "file"],
+                        name="user_file_index_seek_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="userfileindex",
+            constraint=models.UniqueConstraint(
+                fields=("user", "file"), name="unique_user_file_index"
+            ),
+        ),
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
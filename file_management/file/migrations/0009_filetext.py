@@ -0,0 +1,86 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE file_filetext_fts USING fts5("
+    "file_name, content, content='file_filetext', content_rowid='file_id')",
+    "CREATE TRIGGER file_filetext_ai AFTER INSERT ON file_filetext BEGIN "
+    "INSERT INTO file_filetext_fts(rowid, file_name, content) "
+    "VALUES (new.file_id, new.file_name, new.content); END",
+    "CREATE TRIGGER file_filetext_ad AFTER DELETE ON file_filetext BEGIN "
+    "INSERT INTO file_filetext_fts(file_filetext_fts, rowid, file_name, content) "
+    "VALUES ('delete', old.file_id, old.file_name, old.content); END",
+    "CREATE TRIGGER file_filetext_au AFTER UPDATE ON file_filetext BEGIN "
+    "INSERT INTO file_filetext_fts(file_filetext_fts, rowid, file_name, content) "
+    "VALUES ('delete', old.file_id, old.file_name, old.content); "
+    "INSERT INTO file_filetext_fts(rowid, file_name, content) "
+    "VALUES (new.file_id, new.file_name, new.content); END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS file_filetext_ai",
+    "DROP TRIGGER IF EXISTS file_filetext_ad",
+    "DROP TRIGGER IF EXISTS file_filetext_au",
+    "DROP TABLE IF EXISTS file_filetext_fts",
+]
+MYSQL_CREATE = [
+    "ALTER TABLE file_filetext "
+    "ADD FULLTEXT INDEX file_filetext_fulltext (file_name, content)",
+]
+MYSQL_DROP = ["ALTER TABLE file_filetext DROP INDEX file_filetext_fulltext"]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+def queue_existing_files(apps, schema_editor):
+    File = apps.get_model("file", "File")
+    FileText = apps.get_model("file", "FileText")
+    FileText.objects.bulk_create(
+        (
+            FileText(file_id=file_id, file_name=file_name or "")
+            for file_id, file_name in File.objects.filter(is_deleted=False).values_list(
+                "id", "file_name"
+            )
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0008_userfileindex"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileText",
+            fields=[
+                (
+                    "file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="text",
+                        serialize=False,
+                        to="file.file",
+                    ),
+                ),
+                ("file_name", models.CharField(blank=True, default="", max_length=30)),
+                ("content", models.TextField(blank=True, default="")),
+                ("indexed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(
+            run_vendor_sql({"sqlite": SQLITE_CREATE, "mysql": MYSQL_CREATE}),
+            run_vendor_sql({"sqlite": SQLITE_DROP, "mysql": MYSQL_DROP}),
+        ),
+        migrations.RunPython(queue_existing_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0010_filechange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="file",
+            name="acl_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="file",
+            name="acl_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0011_file_acl_version"),
+        ("user", "0004_team"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fileaccess",
+            name="team",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                to="user.team",
+            ),
+        ),
+        migrations.AddField(
+            model_name="filechange",
+            name="team",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="user.team",
+            ),
+        ),
+        migrations.AddField(
+            model_name="userfileindex",
+            name="team",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="user.team",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="filechange",
+            name="user",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="userfileindex",
+            name="user",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="filechange",
+            index=models.Index(fields=["team", "id"], name="file_change_team_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="userfileindex",
+            index=models.Index(
+                fields=["team", "created_at", "file"], name="team_file_index_seek_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="fileaccess",
+            constraint=models.UniqueConstraint(
+                fields=("file", "team"), name="unique_file_access_team"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="userfileindex",
+            constraint=models.UniqueConstraint(
+                fields=("team", "file"), name="unique_team_file_index"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file", "0012_team_principals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="last_chunk_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
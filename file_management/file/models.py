@@ -4,13 +4,40 @@ from core.models import BaseModel
 
 
 # Create your models here.
+class Blob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="uploads/blob", max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.digest
+
+
 class File(BaseModel):
     file_name = models.CharField(max_length=30, blank=True, null=True)
-    file = models.FileField(upload_to="uploads/file")
+    file = models.FileField(upload_to="uploads/file", max_length=255)
+    blob = models.ForeignKey(
+        "file.Blob",
+        blank=True,
+        null=True,
+        related_name="files",
+        on_delete=models.SET_NULL,
+    )
     updated_at = models.DateTimeField(blank=True, null=True)
     file_owner = models.ForeignKey(
         "user.User", blank=True, null=True, on_delete=models.DO_NOTHING
     )
+    # Bumped by file.access on every ACL change; part of the details ETag.
+    acl_version = models.PositiveIntegerField(default=0)
+    acl_updated_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of /file/list seeks on this pair.
+            models.Index(fields=["created_at", "id"], name="file_created_id_idx"),
+        ]
 
     def __str__(self) -> str:
         if self.file_name:
@@ -19,37 +46,185 @@ class File(BaseModel):
             return "Untitled"
 
 
-class ReadAccess(BaseModel):
+class FileAccess(BaseModel):
+    """
+    A user's permissions on a file, stored as a bitmask so a grant is one row
+    write and a check is one lookup on the unique ``(file, user)`` index.
+    """
+
+    READ = 1
+    WRITE = 2
+    DELETE = 4
+    ALL = READ | WRITE | DELETE
+
     file = models.ForeignKey(
         "file.File", blank=True, null=True, on_delete=models.DO_NOTHING
     )
     user = models.ForeignKey(
         "user.User", blank=True, null=True, on_delete=models.DO_NOTHING
     )
+    # Set instead of ``user`` for a grant to every member of a team.
+    team = models.ForeignKey(
+        "user.Team", blank=True, null=True, on_delete=models.DO_NOTHING
+    )
+    perms = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file", "user"], name="unique_file_access_user"
+            ),
+            models.UniqueConstraint(
+                fields=["file", "team"], name="unique_file_access_team"
+            ),
+        ]
+
+    @classmethod
+    def masks_with(cls, perm: int) -> list:
+        """Every mask value that includes ``perm``, for ``perms__in`` filters."""
+        return [mask for mask in range(cls.ALL + 1) if mask & perm == perm]
 
     def __str__(self) -> str:
-        return self.file.file_name
+        return f"{self.file.file_name}: {self.user or self.team} ({self.perms})"
 
 
-class WriteAccess(BaseModel):
-    file = models.ForeignKey(
-        "file.File", blank=True, null=True, on_delete=models.DO_NOTHING
+class UserFileIndex(models.Model):
+    """
+    Denormalized copy of "files a principal can see": one row per live file
+    a user owns or can read, or a team can read. ``file.access`` keeps it in
+    step with File and FileAccess, so listing is a range scan on
+    ``(user, created_at, file)`` plus one on ``(team, created_at, file)`` per
+    team the user belongs to.
+    """
+
+    user = models.ForeignKey(
+        "user.User", null=True, related_name="+", on_delete=models.CASCADE
+    )
+    team = models.ForeignKey(
+        "user.Team", null=True, related_name="+", on_delete=models.CASCADE
     )
+    file = models.ForeignKey("file.File", related_name="+", on_delete=models.CASCADE)
+    perms = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField()
+    file_name = models.CharField(max_length=30, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "file"], name="unique_user_file_index"
+            ),
+            models.UniqueConstraint(
+                fields=["team", "file"], name="unique_team_file_index"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "created_at", "file"], name="user_file_index_seek_idx"
+            ),
+            models.Index(
+                fields=["team", "created_at", "file"], name="team_file_index_seek_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id or 'team ' + str(self.team_id)}:{self.file_id}"
+
+
+class FileChange(models.Model):
+    """
+    Append-only journal of file events, fanned out to one row per user or
+    team that could see the file before or after the event. The id is the
+    sync token. ``visible`` says whether the recipient can still see the file.
+    """
+
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    GRANTED = "granted"
+    REVOKED = "revoked"
+    ACTIONS = [
+        (CREATED, "Created"),
+        (UPDATED, "Updated"),
+        (DELETED, "Deleted"),
+        (GRANTED, "Access granted"),
+        (REVOKED, "Access revoked"),
+    ]
+
     user = models.ForeignKey(
-        "user.User", blank=True, null=True, on_delete=models.DO_NOTHING
+        "user.User", null=True, related_name="+", on_delete=models.CASCADE
     )
+    team = models.ForeignKey(
+        "user.Team", null=True, related_name="+", on_delete=models.CASCADE
+    )
+    file = models.ForeignKey("file.File", related_name="+", on_delete=models.CASCADE)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    visible = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="file_change_user_id_idx"),
+            models.Index(fields=["team", "id"], name="file_change_team_id_idx"),
+        ]
 
     def __str__(self) -> str:
-        return self.file.file_name
+        return f"{self.id}: {self.action} {self.file_id}"
 
 
-class DeleteAccess(BaseModel):
-    file = models.ForeignKey(
-        "file.File", blank=True, null=True, on_delete=models.DO_NOTHING
+class FileText(models.Model):
+    """
+    Searchable text of a file. The SQLite FTS5 table or MySQL FULLTEXT index
+    created by migration 0009 is built over ``file_name`` and ``content``.
+    ``indexed_at`` is empty while content extraction is pending.
+    """
+
+    file = models.OneToOneField(
+        "file.File", primary_key=True, related_name="text", on_delete=models.CASCADE
     )
-    user = models.ForeignKey(
+    file_name = models.CharField(max_length=30, blank=True, default="")
+    content = models.TextField(blank=True, default="")
+    indexed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return self.file_name
+
+
+class UploadSession(BaseModel):
+    file_name = models.CharField(max_length=30, blank=True, null=True)
+    storage_name = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    owner = models.ForeignKey(
         "user.User", blank=True, null=True, on_delete=models.DO_NOTHING
     )
+    completed_at = models.DateTimeField(blank=True, null=True)
+    last_chunk_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def chunk_count(self) -> int:
+        return (self.total_size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+    def __str__(self) -> str:
+        return self.storage_name
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(
+        "file.UploadSession", related_name="chunks", on_delete=models.CASCADE
+    )
+    index = models.PositiveIntegerField()
+    offset = models.PositiveBigIntegerField()
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "index"], name="unique_upload_chunk_index"
+            )
+        ]
 
     def __str__(self) -> str:
-        return self.file.file_name
+        return f"{self.session_id}:{self.index}"
@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import List
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import UUID4, BaseModel
 from core.schema import BaseSchema, CustomPaginationSchema
 from user.schema import UserSchema
 
@@ -36,4 +36,65 @@ class PaginatedFileListSchema(CustomPaginationSchema):
 
 class FileProvideAccessSchema(BaseModel):
     user_email: str
-    file_guid: str
\ No newline at end of file
+    file_guid: str
+
+class FileTeamAccessSchema(BaseModel):
+    team_guid: str
+    file_guid: str
+    action: Literal["grant", "revoke"]
+    perm: Literal["read", "write", "delete"]
+
+class BulkAccessItemSchema(BaseModel):
+    action: Literal["grant", "revoke"]
+    perm: Literal["read", "write", "delete"]
+    user_email: str
+    file_guid: str
+
+class BulkAccessSchema(BaseModel):
+    items: List[BulkAccessItemSchema]
+
+class BulkAccessResultSchema(BulkAccessItemSchema):
+    # granted, revoked, unchanged, user_not_found, file_not_found or forbidden
+    status: str
+
+class BulkAccessResponseSchema(BaseModel):
+    results: List[BulkAccessResultSchema]
+
+class AccessCheckSchema(BaseModel):
+    file_guids: List[str]
+
+class AccessCheckResultSchema(BaseModel):
+    file_guid: str
+    found: bool
+    read: bool = False
+    write: bool = False
+    delete: bool = False
+
+class AccessCheckResponseSchema(BaseModel):
+    results: List[AccessCheckResultSchema]
+
+class UploadSessionCreateSchema(BaseModel):
+    file_name: str
+    total_size: int
+    chunk_size: Optional[int] = None
+
+class UploadSessionSchema(BaseSchema):
+    file_name: str
+    total_size: int
+    chunk_size: int
+    chunk_count: int
+    received_ranges: List[List[int]] = []
+    missing_chunks: List[int] = []
+    is_complete: bool
+
+class FileChangeSchema(BaseModel):
+    action: str
+    visible: bool  # False once the caller can no longer see the file
+    changed_at: datetime
+    file_guid: UUID4
+    file: Optional[FileSchema] = None
+
+class FileChangeListSchema(BaseModel):
+    changes: List[FileChangeSchema]
+    next_token: str  # Pass as ``since`` on the next sync
+    has_more: bool
\ No newline at end of file
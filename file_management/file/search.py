@@ -0,0 +1,131 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from file.listing import visible_file_ids
+from file.models import File, FileText
+
+logger = logging.getLogger(__name__)
+
+# A single worker keeps extraction off the request path and applies the jobs
+# of one file in the order they were queued.
+_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-search")
+
+SNIFF_BYTES = 8 * 1024
+
+
+def extract_text(storage_name: str) -> str:
+    """
+    Leading text of a stored file, or an empty string for binary content.
+    Blobs are stored without an extension, so text is recognised by content.
+    """
+    with default_storage.open(storage_name, "rb") as stored:
+        data = stored.read(settings.FILE_SEARCH_MAX_TEXT_BYTES)
+    if b"\x00" in data[:SNIFF_BYTES]:
+        return ""
+    try:
+        data[:SNIFF_BYTES].decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut by the sniff window is still text.
+        if e.start < SNIFF_BYTES - 3:
+            return ""
+    return data.decode("utf-8", errors="ignore")
+
+
+def index_file(file_id) -> None:
+    """Extract and store the text of ``file_id`` if it is waiting to be indexed."""
+    pending = FileText.objects.filter(file_id=file_id, indexed_at__isnull=True)
+    storage_name = (
+        File.objects.filter(id=file_id, is_deleted=False)
+        .values_list("file", flat=True)
+        .first()
+    )
+    if storage_name is None or not pending.exists():
+        return
+    try:
+        content = extract_text(storage_name)
+    except OSError as e:
+        logger.error(f"Error extracting text of file {file_id}: {e}")
+        content = ""
+    pending.update(content=content, indexed_at=timezone.now())
+
+
+def _index_in_background(file_id) -> None:
+    try:
+        index_file(file_id)
+    except Exception as e:
+        logger.error(f"Error indexing file {file_id}: {e}")
+    finally:
+        connections.close_all()
+
+
+def queue_index(file: File) -> None:
+    """
+    Make ``file`` searchable by name now and by content once the background
+    indexer has read it. Call inside the transaction that saved the file.
+    """
+    if file.is_deleted:
+        FileText.objects.filter(file_id=file.id).delete()
+        return
+    FileText.objects.update_or_create(
+        file_id=file.id,
+        defaults={"file_name": file.file_name or "", "indexed_at": None},
+    )
+    transaction.on_commit(lambda: _indexer.submit(_index_in_background, file.id))
+
+
+def _terms(query: str) -> list:
+    return re.findall(r"\w+", query)
+
+
+def search_file_ids(user_id, teams, query: str, limit: int) -> list:
+    """
+    Ids of files the user or one of ``teams`` can see that match ``query``,
+    best match first.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    visible = visible_file_ids(user_id, teams)
+    if connection.vendor == "sqlite":
+        visible_sql, visible_params = visible.query.sql_with_params()
+        sql = (
+            "SELECT rowid FROM file_filetext_fts "
+            f"WHERE file_filetext_fts MATCH %s AND rowid IN ({visible_sql}) "
+            "ORDER BY rank LIMIT %s"
+        )
+        params = [
+            " ".join(f'"{term}"*' for term in terms),
+            *visible_params,
+            limit,
+        ]
+    elif connection.vendor == "mysql":
+        visible_sql, visible_params = visible.query.sql_with_params()
+        match = "MATCH (file_name, content) AGAINST (%s IN BOOLEAN MODE)"
+        sql = (
+            f"SELECT file_id FROM file_filetext "
+            f"WHERE {match} AND file_id IN ({visible_sql}) "
+            f"ORDER BY {match} DESC LIMIT %s"
+        )
+        boolean_query = " ".join(f"+{term}*" for term in terms)
+        params = [boolean_query, *visible_params, boolean_query, limit]
+    else:
+        matches = Q()
+        for term in terms:
+            matches &= Q(text__file_name__icontains=term) | Q(
+                text__content__icontains=term
+            )
+        return list(
+            File.objects.filter(matches, id__in=visible).values_list("id", flat=True)[
+                :limit
+            ]
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
@@ -0,0 +1,239 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+from django.db import transaction
+
+from core.metrics import storage_io
+from file.errors import FileError
+from file.models import Blob, File
+
+SESSION_DIR = "uploads/session"
+BLOB_DIR = "uploads/blob"
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class HashingUploadMixin:
+    """
+    Computes the SHA-256 of an uploaded file while Django parses the request,
+    exposing it as ``uploaded_file.sha256``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            self.sha256.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def reserve_upload(file_name: str, size: int) -> str:
+    """Create an empty file of ``size`` bytes in storage and return its name."""
+    storage_name = default_storage.save(
+        os.path.join(SESSION_DIR, os.path.basename(file_name) or "upload"),
+        ContentFile(b""),
+    )
+    os.truncate(default_storage.path(storage_name), size)
+    return storage_name
+
+
+def stage_chunk(stream, length: int):
+    """
+    Copy exactly ``length`` bytes from ``stream`` to an anonymous temporary
+    file and return it rewound. Lets a request body be received before any
+    lock is taken; the caller closes the file.
+    """
+    staged = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        copied = 0
+        while copied < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - copied))
+            if not block:
+                raise FileError(
+                    f"Chunk is shorter than expected: got {copied} of {length} bytes"
+                )
+            staged.write(block)
+            copied += len(block)
+        if stream.read(1):
+            raise FileError(f"Chunk is longer than expected {length} bytes")
+    except BaseException:
+        staged.close()
+        raise
+    staged.seek(0)
+    return staged
+
+
+def write_chunk(storage_name: str, offset: int, stream, length: int) -> int:
+    """
+    Copy exactly ``length`` bytes from ``stream`` into the stored file at
+    ``offset``. Only one block is held in memory at a time.
+    """
+    fd = os.open(default_storage.path(storage_name), os.O_WRONLY)
+    try:
+        written = 0
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                raise FileError(
+                    f"Chunk is shorter than expected: got {written} of {length} bytes"
+                )
+            with storage_io() as io:
+                io.bytes = os.pwrite(fd, block, offset + written)
+            written += len(block)
+        if stream.read(1):
+            raise FileError(f"Chunk is longer than expected {length} bytes")
+        return written
+    finally:
+        os.close(fd)
+
+
+def merge_ranges(chunks) -> list:
+    """Collapse ``(offset, size)`` pairs into sorted ``[start, end)`` ranges."""
+    ranges = []
+    for offset, size in sorted(chunks):
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], offset + size)
+        else:
+            ranges.append([offset, offset + size])
+    return ranges
+
+
+def discard(storage_name: str) -> None:
+    if storage_name and default_storage.exists(storage_name):
+        default_storage.delete(storage_name)
+
+
+def blob_name(digest: str) -> str:
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], digest)
+
+
+def file_digest(uploaded_file) -> str:
+    """Digest recorded by the hashing upload handlers, or computed if missing."""
+    digest = getattr(uploaded_file, "sha256", None)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in uploaded_file.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        uploaded_file.seek(0)
+    return digest
+
+
+def stored_digest(storage_name: str) -> str:
+    sha256 = hashlib.sha256()
+    with storage_io() as io, default_storage.open(storage_name, "rb") as stored:
+        for chunk in iter(lambda: stored.read(STREAM_BLOCK_SIZE), b""):
+            sha256.update(chunk)
+            io.bytes += len(chunk)
+    return sha256.hexdigest()
+
+
+def acquire_blob(uploaded_file) -> Blob:
+    """
+    Return the blob holding the uploaded bytes with its reference count
+    incremented. Content is only written when no blob has the same digest.
+    """
+    digest = file_digest(uploaded_file)
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            digest=digest, defaults={"size": uploaded_file.size}
+        )
+        if created or not blob.ref_count:
+            name = blob.file.name or blob_name(digest)
+            # Bytes are only unlinked under this row's lock (see discard_blob),
+            # so a file found here is safe to reuse: it was left behind by a
+            # rolled back upload or by a release whose discard has not run.
+            if not default_storage.exists(name):
+                with storage_io() as io:
+                    name = default_storage.save(name, uploaded_file)
+                    io.bytes = uploaded_file.size
+            blob.file = name
+        blob.ref_count += 1
+        blob.save()
+    return blob
+
+
+def adopt_blob(storage_name: str) -> Blob:
+    """
+    Turn a fully assembled upload into a blob by renaming it into place, or
+    drop it when a blob with the same digest is already stored.
+    """
+    digest = stored_digest(storage_name)
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            digest=digest, defaults={"size": default_storage.size(storage_name)}
+        )
+        if created or not blob.ref_count:
+            blob.file = blob.file.name or blob_name(digest)
+            target = default_storage.path(blob.file.name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(default_storage.path(storage_name), target)
+        else:
+            transaction.on_commit(lambda: discard(storage_name))
+        blob.ref_count += 1
+        blob.save()
+    return blob
+
+
+def lock_file(file_id):
+    """
+    Re-read live file ``file_id`` with its row locked, or return None once it
+    is deleted. Call inside the transaction that changes its blob: a copy
+    loaded earlier may point at a blob a concurrent update or delete has
+    already released.
+    """
+    return File.objects.select_for_update().filter(pk=file_id, is_deleted=False).first()
+
+
+def release_blob(blob_id) -> None:
+    """
+    Drop one reference; once nothing points at the blob it is deleted with
+    its bytes after the transaction commits.
+    """
+    if blob_id is None:
+        return
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().get(pk=blob_id)
+        blob.ref_count -= 1
+        blob.save()
+        if not blob.ref_count:
+            transaction.on_commit(lambda: discard_blob(blob_id))
+
+
+def discard_blob(blob_id) -> None:
+    """
+    Delete blob ``blob_id`` and its bytes if it is still unreferenced. The
+    row stays, at zero references, until this runs with it locked again: an
+    upload of the same content in between takes a reference on that row and
+    keeps the file, instead of creating a new row whose file this unlinks.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=blob_id, ref_count=0)
+        blob = blob.first()
+        if blob is not None:
+            discard(blob.file.name)
+            blob.delete()
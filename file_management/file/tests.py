@@ -1,3 +1,1137 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils import timezone
+from ninja_jwt.tokens import AccessToken
+
+from core.auth import get_tokens_for_user, user_cache
+from core.revocation import revocations
+from file import access, api, lookups
+from file.access import (
+    add_member,
+    get_perms,
+    get_perms_many,
+    grant,
+    grant_team,
+    principals,
+    refresh_index,
+    remove_member,
+    revoke,
+)
+from file.download import parse_range
+from file.listing import LIST_MAX_SIZE
+from file.lookups import (
+    forget_file,
+    resolve_file,
+    resolve_files,
+    resolve_user,
+    resolve_users,
+)
+from file.models import (
+    Blob,
+    File,
+    FileAccess,
+    FileChange,
+    FileText,
+    UploadSession,
+    UserFileIndex,
+)
+from file.search import index_file, queue_index
+from file.storage import acquire_blob, release_blob
+from user.models import RevokedToken, Team, TeamMembership, User
+
+
+class FileListQueryCountTests(TestCase):
+    """The list endpoint must not issue per-row queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="reader@example.com", name="reader", password="pw-123456!"
+        )
+        owners = [
+            User.objects.create_user(
+                email=f"owner{i}@example.com", name=f"owner{i}", password="pw-123456!"
+            )
+            for i in range(3)
+        ]
+        for i in range(40):
+            file = File.objects.create(
+                file_name=f"file-{i}",
+                file=f"uploads/file/file-{i}.txt",
+                file_owner=owners[i % len(owners)],
+            )
+            grant(file.id, cls.user.id, FileAccess.READ)
+
+    def setUp(self):
+        token = get_tokens_for_user(self.user)["access"]
+        self.headers = {"HTTP_AUTHORIZATION": "Bearer " + token}
+        # Team ids, users and revoked tokens are cached per process; counts
+        # below are for warm caches.
+        principals(self.user.id)
+        user_cache.set(self.user.id, self.user)
+        revocations.refresh()
+
+    def test_page_mode_query_count_is_constant(self):
+        # List validators, one page of rows, one count; auth reads no rows.
+        for size in (5, 30):
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    f"/api/file/list?size={size}", **self.headers
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["data"]), size)
+
+    def test_cursor_mode_skips_count(self):
+        for size in (5, 30):
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    f"/api/file/list?size={size}&after=", **self.headers
+                )
+            body = response.json()
+            self.assertEqual(len(body["data"]), size)
+            self.assertIsNone(body["total_items"])
+            self.assertTrue(body["next_cursor"])
+
+    def test_out_of_range_size_and_page_are_clamped(self):
+        for query in ("size=0&after=", "size=-5", "size=5&page=-2"):
+            response = self.client.get(f"/api/file/list?{query}", **self.headers)
+            self.assertEqual(response.status_code, 200, query)
+            body = response.json()
+            self.assertGreaterEqual(body["size"], 1)
+            self.assertEqual(body["page"], 0)
+            self.assertEqual(len(body["data"]), body["size"])
+        response = self.client.get("/api/file/list?size=5000", **self.headers)
+        self.assertEqual(response.json()["size"], LIST_MAX_SIZE)
+
+    def test_search_size_is_bounded(self):
+        FileText.objects.bulk_create(
+            FileText(file_id=file_id, file_name=name)
+            for file_id, name in File.objects.values_list("id", "file_name")
+        )
+        response = self.client.get("/api/file/search?q=file&size=-1", **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_rows_include_owner_guid(self):
+        response = self.client.get("/api/file/list?size=3", **self.headers)
+        owners = File.objects.order_by("created_at", "id").values_list(
+            "file_owner__guid", flat=True
+        )[:3]
+        self.assertEqual(
+            [row["file_owner_guid"] for row in response.json()["data"]],
+            [str(guid) for guid in owners],
+        )
+
+    @override_settings(METRICS_SERVER_TIMING=True, METRICS_TOKEN="scrape")
+    def test_server_timing_counts_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/file/list?size=5", **self.headers)
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+        metrics = self.client.get(
+            "/api/metrics", HTTP_AUTHORIZATION="Bearer scrape"
+        ).content.decode()
+        self.assertIn(
+            'http_responses_total{method="GET",route="api/file/list",status="200"}',
+            metrics,
+        )
+
+
+def auth_headers(user) -> dict:
+    token = get_tokens_for_user(user)["access"]
+    return {"HTTP_AUTHORIZATION": "Bearer " + token}
+
+
+class AccessTestCase(TestCase):
+    """Owner, grantee and stranger around one file, with cold caches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.grantee, cls.stranger = (
+            User.objects.create_user(
+                email=f"{name}@example.com", name=name, password="pw-123456!"
+            )
+            for name in ("owner", "grantee", "stranger")
+        )
+        cls.file = File.objects.create(
+            file_name="shared.txt",
+            file="uploads/file/shared.txt",
+            file_owner=cls.owner,
+            updated_at=timezone.now(),
+        )
+        grant(cls.file.id, cls.owner.id, FileAccess.ALL)
+
+    def setUp(self):
+        # Lookups and masks are cached by id, which the test database reuses.
+        caches["lookups"].clear()
+        caches["permissions"].clear()
+        revocations.refresh()
+
+    def post(self, path, body, user=None):
+        headers = auth_headers(user) if user else {}
+        # Cache evictions run on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                path, json.dumps(body), content_type="application/json", **headers
+            )
+
+    def changes(self, user, since=None):
+        """One page of ``user``'s changes feed, or its current token."""
+        path = "/api/file/changes"
+        if since is not None:
+            path += "?since=" + since
+        response = self.client.get(path, **auth_headers(user))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class BulkAccessTests(AccessTestCase):
+    def items(self, action="grant"):
+        return {
+            "items": [
+                {
+                    "action": action,
+                    "perm": "read",
+                    "user_email": self.grantee.email,
+                    "file_guid": str(self.file.guid),
+                }
+            ]
+        }
+
+    def test_requires_authentication(self):
+        response = self.post("/api/access/bulk", self.items())
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(FileAccess.objects.filter(user=self.grantee).exists())
+
+    def test_owner_grants_and_revokes(self):
+        response = self.post("/api/access/bulk", self.items(), self.owner)
+        self.assertEqual(response.json()["results"][0]["status"], "granted")
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), FileAccess.READ)
+        response = self.post("/api/access/bulk", self.items("revoke"), self.owner)
+        self.assertEqual(response.json()["results"][0]["status"], "revoked")
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), 0)
+
+    def test_other_users_files_are_forbidden(self):
+        response = self.post("/api/access/bulk", self.items(), self.stranger)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["status"], "forbidden")
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), 0)
+
+
+class AccessCheckTests(AccessTestCase):
+    def check(self, guids, user=None):
+        return self.post(
+            "/api/access/check", {"file_guids": guids}, user or self.grantee
+        )
+
+    def test_reports_each_files_rights(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ | FileAccess.DELETE)
+        missing = "00000000-0000-0000-0000-000000000000"
+        response = self.check([str(self.file.guid), missing, "not-a-guid"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "file_guid": str(self.file.guid),
+                    "found": True,
+                    "read": True,
+                    "write": False,
+                    "delete": True,
+                },
+                {
+                    "file_guid": missing,
+                    "found": False,
+                    "read": False,
+                    "write": False,
+                    "delete": False,
+                },
+                {
+                    "file_guid": "not-a-guid",
+                    "found": False,
+                    "read": False,
+                    "write": False,
+                    "delete": False,
+                },
+            ],
+        )
+
+    def test_team_rights_count(self):
+        team = Team.objects.create(name="team", owner=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_member(team.id, self.grantee.id)
+            grant_team(self.file.id, team.id, FileAccess.WRITE)
+        (result,) = self.check([str(self.file.guid)]).json()["results"]
+        self.assertEqual((result["read"], result["write"]), (False, True))
+
+    def test_rights_change_with_revokes(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        self.assertTrue(self.check([str(self.file.guid)]).json()["results"][0]["read"])
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke(self.file.id, self.grantee.id, FileAccess.READ)
+        self.assertFalse(self.check([str(self.file.guid)]).json()["results"][0]["read"])
+
+    def test_limits_and_authentication(self):
+        self.assertEqual(
+            self.post("/api/access/check", {"file_guids": []}).status_code, 401
+        )
+        with mock.patch("file.api.ACCESS_CHECK_MAX_FILES", 2):
+            response = self.check([str(self.file.guid)] * 3)
+        self.assertEqual(response.status_code, 400)
+
+
+class TeamAccessTests(AccessTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.team = Team.objects.create(name="team", owner=cls.owner)
+        TeamMembership.objects.create(team=cls.team, user=cls.grantee)
+        cls.other_team = Team.objects.create(name="other", owner=cls.stranger)
+
+    def body(self, team, action="grant"):
+        return {
+            "team_guid": str(team.guid),
+            "file_guid": str(self.file.guid),
+            "action": action,
+            "perm": "read",
+        }
+
+    def test_requires_authentication(self):
+        response = self.post("/api/access/team", self.body(self.team))
+        self.assertEqual(response.status_code, 401)
+
+    def test_members_gain_and_lose_team_grants(self):
+        response = self.post("/api/access/team", self.body(self.team), self.owner)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), FileAccess.READ)
+        response = self.post(
+            "/api/access/team", self.body(self.team, "revoke"), self.owner
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), 0)
+
+    def test_caller_must_own_the_file(self):
+        response = self.post(
+            "/api/access/team", self.body(self.other_team), self.stranger
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(FileAccess.objects.filter(team=self.other_team).exists())
+
+    def test_caller_must_own_or_belong_to_the_team(self):
+        response = self.post("/api/access/team", self.body(self.other_team), self.owner)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(FileAccess.objects.filter(team=self.other_team).exists())
+
+
+class UserFileIndexTests(AccessTestCase):
+    """The listing table follows every change to a file's access."""
+
+    def indexed(self):
+        return set(
+            UserFileIndex.objects.filter(file_id=self.file.id).values_list(
+                "user_id", "team_id", "perms"
+            )
+        )
+
+    def listed(self, user):
+        response = self.client.get("/api/file/list", **auth_headers(user))
+        self.assertEqual(response.status_code, 200)
+        return [row["guid"] for row in response.json()["data"]]
+
+    def test_owner_is_indexed(self):
+        self.assertEqual(self.indexed(), {(self.owner.id, None, FileAccess.ALL)})
+
+    def test_grant_and_revoke(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ | FileAccess.WRITE)
+        self.assertIn(
+            (self.grantee.id, None, FileAccess.READ | FileAccess.WRITE), self.indexed()
+        )
+        self.assertEqual(self.listed(self.grantee), [str(self.file.guid)])
+        revoke(self.file.id, self.grantee.id, FileAccess.READ)
+        # Write access alone does not make a file visible.
+        self.assertEqual(self.indexed(), {(self.owner.id, None, FileAccess.ALL)})
+        self.assertEqual(self.listed(self.grantee), [])
+
+    def test_team_grant(self):
+        team = Team.objects.create(name="team", owner=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_member(team.id, self.grantee.id)
+            grant_team(self.file.id, team.id, FileAccess.READ)
+        self.assertIn((None, team.id, FileAccess.READ), self.indexed())
+        self.assertEqual(self.listed(self.grantee), [str(self.file.guid)])
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_member(team.id, self.grantee.id)
+        self.assertIn((None, team.id, FileAccess.READ), self.indexed())
+        self.assertEqual(self.listed(self.grantee), [])
+
+    def test_delete(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f"/api/file/delete?file_guid={self.file.guid}",
+                **auth_headers(self.owner),
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.indexed(), set())
+        self.assertEqual(self.listed(self.grantee), [])
+
+
+class ConditionalGetTests(AccessTestCase):
+    def get(self, path, etag=None):
+        headers = auth_headers(self.owner)
+        if etag:
+            headers["HTTP_IF_NONE_MATCH"] = etag
+        return self.client.get(path, **headers)
+
+    def assertRevalidates(self, path, change):
+        response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = self.get(path, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        change()
+        response = self.get(path, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_details(self):
+        self.assertRevalidates(
+            f"/api/file/details?file_guid={self.file.guid}",
+            lambda: grant(self.file.id, self.grantee.id, FileAccess.READ),
+        )
+
+    def test_list(self):
+        def upload():
+            file = File.objects.create(file_name="new.txt", file_owner=self.owner)
+            grant(file.id, self.owner.id, FileAccess.ALL)
+
+        self.assertRevalidates("/api/file/list", upload)
+
+
+class ChangesFeedTests(AccessTestCase):
+    def test_token_only_without_since(self):
+        body = self.changes(self.grantee)
+        self.assertEqual(body["changes"], [])
+        self.assertFalse(body["has_more"])
+
+    def test_cursor_advances_past_seen_changes(self):
+        token = self.changes(self.grantee)["next_token"]
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        body = self.changes(self.grantee, token)
+        (change,) = body["changes"]
+        self.assertEqual(change["action"], "granted")
+        self.assertTrue(change["visible"])
+        self.assertEqual(change["file"]["file_name"], "shared.txt")
+        self.assertEqual(self.changes(self.grantee, body["next_token"])["changes"], [])
+
+    def test_pages_by_size(self):
+        token = self.changes(self.grantee)["next_token"]
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        revoke(self.file.id, self.grantee.id, FileAccess.READ)
+        response = self.client.get(
+            f"/api/file/changes?since={token}&size=1", **auth_headers(self.grantee)
+        )
+        body = response.json()
+        self.assertEqual([c["action"] for c in body["changes"]], ["granted"])
+        self.assertTrue(body["has_more"])
+        body = self.changes(self.grantee, body["next_token"])
+        self.assertEqual([c["action"] for c in body["changes"]], ["revoked"])
+        self.assertFalse(body["has_more"])
+
+    def test_revoke_and_delete_leave_tombstones(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        tokens = {
+            user: self.changes(user)["next_token"]
+            for user in (self.owner, self.grantee)
+        }
+        revoke(self.file.id, self.grantee.id, FileAccess.READ)
+        (change,) = self.changes(self.grantee, tokens[self.grantee])["changes"]
+        self.assertEqual(change["action"], "revoked")
+        self.assertFalse(change["visible"])
+        self.assertIsNone(change["file"])
+        self.assertEqual(change["file_guid"], str(self.file.guid))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                f"/api/file/delete?file_guid={self.file.guid}",
+                **auth_headers(self.owner),
+            )
+        (change,) = self.changes(self.owner, tokens[self.owner])["changes"]
+        self.assertEqual(change["action"], "deleted")
+        self.assertFalse(change["visible"])
+        self.assertIsNone(change["file"])
+        self.assertEqual(change["file_guid"], str(self.file.guid))
+
+    def test_invalid_token(self):
+        response = self.client.get(
+            "/api/file/changes?since=garbage", **auth_headers(self.owner)
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TeamChangesTests(AccessTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.team = Team.objects.create(name="team", owner=cls.owner)
+        grant_team(cls.file.id, cls.team.id, FileAccess.READ)
+
+    def member_change(self, change, *args):
+        """The grantee's changes from running ``change(team, grantee)``."""
+        token = self.changes(self.grantee)["next_token"]
+        with self.captureOnCommitCallbacks(execute=True):
+            change(self.team.id, self.grantee.id, *args)
+        return self.changes(self.grantee, token)["changes"]
+
+    def test_joining_member_receives_the_team_files(self):
+        # A token newer than the team's own grant event.
+        own = File.objects.create(file_name="own.txt", file_owner=self.grantee)
+        refresh_index(own.id, action=FileChange.CREATED)
+        (change,) = self.member_change(add_member)
+        self.assertEqual(change["action"], "granted")
+        self.assertTrue(change["visible"])
+        self.assertEqual(change["file"]["guid"], str(self.file.guid))
+
+    def test_leaving_member_is_told_the_team_files_are_gone(self):
+        add_member(self.team.id, self.grantee.id)
+        (change,) = self.member_change(remove_member)
+        self.assertEqual(change["action"], "revoked")
+        self.assertFalse(change["visible"])
+        self.assertIsNone(change["file"])
+
+    def test_files_shared_directly_stay_visible_after_leaving(self):
+        add_member(self.team.id, self.grantee.id)
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        (change,) = self.member_change(remove_member)
+        self.assertEqual(change["action"], "revoked")
+        self.assertTrue(change["visible"])
+
+
+class DeleteFileTests(AccessTestCase):
+    def delete(self, prefix=""):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.delete(
+                f"/api/{prefix}file/delete?file_guid={self.file.guid}",
+                **auth_headers(self.owner),
+            )
+
+    def test_repeat_delete_is_not_found(self):
+        self.assertEqual(self.delete().status_code, 204)
+        response = self.delete()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["message"], "File Does not exist")
+
+
+class BlobReferenceTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def acquire(self, content=b"same bytes"):
+        return acquire_blob(SimpleUploadedFile("upload.txt", content))
+
+    def release(self, blob):
+        with self.captureOnCommitCallbacks(execute=True):
+            release_blob(blob.id)
+
+    def test_same_content_shares_one_blob(self):
+        first, second = self.acquire(), self.acquire()
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Blob.objects.get(id=first.id).ref_count, 2)
+        self.release(first)
+        self.assertTrue(default_storage.exists(first.file.name))
+        self.release(second)
+        self.assertFalse(Blob.objects.filter(id=first.id).exists())
+        self.assertFalse(default_storage.exists(first.file.name))
+
+    def test_acquire_before_deferred_discard_keeps_the_file(self):
+        blob = self.acquire()
+        with self.captureOnCommitCallbacks() as callbacks:
+            release_blob(blob.id)
+        reacquired = self.acquire()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(reacquired.id, blob.id)
+        self.assertEqual(Blob.objects.get(id=blob.id).ref_count, 1)
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+    def test_backfill_attaches_legacy_files(self):
+        owner = User.objects.create_user(
+            email="legacy@example.com", name="legacy", password="pw-123456!"
+        )
+        files = [
+            File.objects.create(
+                file_name=name,
+                file=default_storage.save(f"uploads/file/{name}", ContentFile(b"old")),
+                file_owner=owner,
+            )
+            for name in ("a.txt", "b.txt")
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("backfill_blobs", stdout=io.StringIO())
+        first, second = (File.objects.get(id=file.id) for file in files)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.blob.ref_count, 2)
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertFalse(default_storage.exists(files[1].file.name))
+
+
+class DeleteRaceTests(AccessTestCase):
+    def test_file_deleted_while_waiting_for_its_lock(self):
+        with mock.patch("file.api.lock_file", return_value=None):
+            response = self.client.delete(
+                f"/api/file/delete?file_guid={self.file.guid}",
+                **auth_headers(self.owner),
+            )
+        self.assertEqual(response.status_code, 404)
+
+
+class RangeParsingTests(SimpleTestCase):
+    def test_satisfiable_ranges(self):
+        self.assertEqual(parse_range("bytes=0-4", 17), [(0, 4)])
+        self.assertEqual(parse_range("bytes=10-", 17), [(10, 16)])
+        self.assertEqual(parse_range("bytes=-5", 17), [(12, 16)])
+        self.assertEqual(parse_range("bytes=5-100", 17), [(5, 16)])
+        self.assertEqual(parse_range("bytes=4-6, 0-4", 17), [(0, 6)])
+
+    def test_ranges_past_the_end_are_unsatisfiable(self):
+        self.assertEqual(parse_range("bytes=100-", 17), [])
+        self.assertEqual(parse_range("bytes=17-20", 17), [])
+        self.assertEqual(parse_range("bytes=0-", 0), [])
+
+    def test_invalid_headers_are_ignored(self):
+        self.assertIsNone(parse_range("bytes=5-4", 17))
+        self.assertIsNone(parse_range("items=0-4", 17))
+        self.assertIsNone(parse_range("bytes=a-b", 17))
+        self.assertIsNone(parse_range("bytes=4", 17))
+
+
+class StoredFileTestCase(AccessTestCase):
+    """AccessTestCase whose file has content, in a temporary MEDIA_ROOT."""
+
+    content = b"0123456789abcdef"
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = self.settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.blob = acquire_blob(SimpleUploadedFile("shared.txt", self.content))
+        File.objects.filter(pk=self.file.id).update(
+            blob=self.blob, file=self.blob.file.name
+        )
+
+    def download(self, user=None, prefix="", **headers):
+        response = self.client.get(
+            f"/api/{prefix}file/download?file_guid={self.file.guid}",
+            **auth_headers(user or self.owner),
+            **headers,
+        )
+        return response, self.read(response)
+
+    def read(self, response) -> bytes:
+        body = b"".join(response.streaming_content) if response.streaming else b""
+        response.close()
+        return body
+
+
+class DownloadTests(StoredFileTestCase):
+    def test_whole_file(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["ETag"], f'"{self.blob.digest}"')
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_single_range(self):
+        response, body = self.download(HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/16")
+        self.assertEqual(response["Content-Length"], "4")
+
+    def test_multiple_ranges(self):
+        response, body = self.download(HTTP_RANGE="bytes=0-1,-2")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        self.assertIn(b"Content-Range: bytes 0-1/16\r\n\r\n01\r\n", body)
+        self.assertIn(b"Content-Range: bytes 14-15/16\r\n\r\nef\r\n", body)
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.download(HTTP_RANGE="bytes=16-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */16")
+
+    def test_stale_if_range_sends_the_whole_file(self):
+        response, body = self.download(HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_matching_etag_is_not_modified(self):
+        response, _ = self.download(HTTP_IF_NONE_MATCH=f'"{self.blob.digest}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_requires_read_access(self):
+        response, _ = self.download(self.stranger)
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncParityTests(StoredFileTestCase):
+    """The async routes answer exactly like their sync counterparts."""
+
+    def fetch(self, path, headers=None):
+        """``(sync, async)`` responses to GET /api/file``path`` and its async twin."""
+        token = get_tokens_for_user(self.owner)["access"]
+        headers = {"Authorization": "Bearer " + token, **(headers or {})}
+        sync = self.client.get("/api/file" + path, headers=headers)
+        asynchronous = async_to_sync(self.async_client.get)(
+            "/api/async/file" + path, headers=headers
+        )
+        return sync, asynchronous
+
+    def assertSameJson(self, path, headers=None):
+        sync, asynchronous = self.fetch(path, headers)
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(asynchronous.json(), sync.json())
+        return sync, asynchronous
+
+    def test_list(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        sync, asynchronous = self.assertSameJson("/list?size=10")
+        self.assertEqual(sync.status_code, 200)
+        self.assertEqual(asynchronous["ETag"], sync["ETag"])
+        self.assertSameJson("/list?after=")
+        self.assertSameJson("/list?after=garbage")
+
+    def test_details(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        path = f"/details?file_guid={self.file.guid}"
+        sync, asynchronous = self.assertSameJson(path)
+        self.assertEqual(sync.status_code, 200)
+        self.assertEqual(asynchronous["ETag"], sync["ETag"])
+        sync, asynchronous = self.fetch(path, {"If-None-Match": sync["ETag"]})
+        self.assertEqual((sync.status_code, asynchronous.status_code), (304, 304))
+        self.assertSameJson(f"/details?file_guid={uuid.uuid4()}")
+
+    def test_download(self):
+        path = f"/download?file_guid={self.file.guid}"
+        for headers in ({}, {"Range": "bytes=2-5"}, {"Range": "bytes=99-"}):
+            sync, asynchronous = self.fetch(path, headers)
+            self.assertEqual(asynchronous.status_code, sync.status_code)
+            self.assertEqual(self.read(asynchronous), self.read(sync))
+            for header in ("ETag", "Content-Range", "Content-Length"):
+                self.assertEqual(asynchronous.get(header), sync.get(header))
+
+
+class UpdateFileTests(StoredFileTestCase):
+    def update(self, user, prefix=""):
+        body = encode_multipart(
+            BOUNDARY,
+            {
+                "file_guid": str(self.file.guid),
+                "file_name": "renamed.txt",
+                "file": SimpleUploadedFile("renamed.txt", b"new content"),
+            },
+        )
+        # The content indexer's thread cannot reach the test transaction.
+        with mock.patch("file.search._indexer"), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            return self.client.put(
+                f"/api/{prefix}file/update",
+                body,
+                content_type=MULTIPART_CONTENT,
+                **auth_headers(user),
+            )
+
+    def test_requires_write_access(self):
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        for prefix in ("", "async/"):
+            response = self.update(self.grantee, prefix)
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(File.objects.get(pk=self.file.id).file_name, "shared.txt")
+
+    def test_writers_replace_the_content(self):
+        grant(self.file.id, self.grantee.id, FileAccess.WRITE)
+        # The async route writes on a worker thread, outside this test's
+        # transaction, so only the sync one is exercised here.
+        self.assertEqual(self.update(self.grantee).status_code, 200)
+        file = File.objects.select_related("blob").get(pk=self.file.id)
+        self.assertEqual(file.file_name, "renamed.txt")
+        self.assertEqual(file.blob.digest, hashlib.sha256(b"new content").hexdigest())
+
+
+class SearchTests(StoredFileTestCase):
+    content = b"quarterly budget figures"
+
+    def setUp(self):
+        super().setUp()
+        self.other = File.objects.create(
+            file_name="budget.txt",
+            file="uploads/file/budget.txt",
+            file_owner=self.stranger,
+        )
+        grant(self.other.id, self.stranger.id, FileAccess.ALL)
+        with mock.patch("file.search._indexer"):
+            for file in (File.objects.get(pk=self.file.id), self.other):
+                queue_index(file)
+        index_file(self.file.id)
+
+    def search(self, user, q):
+        response = self.client.get("/api/file/search", {"q": q}, **auth_headers(user))
+        self.assertEqual(response.status_code, 200)
+        return [row["guid"] for row in response.json()]
+
+    def test_matches_names_and_content(self):
+        self.assertEqual(self.search(self.owner, "shared"), [str(self.file.guid)])
+        self.assertEqual(self.search(self.owner, "budg"), [str(self.file.guid)])
+        self.assertEqual(self.search(self.owner, "nothing"), [])
+        self.assertEqual(self.search(self.owner, ""), [])
+
+    def test_only_files_the_caller_can_see(self):
+        self.assertEqual(self.search(self.grantee, "budget"), [])
+        grant(self.file.id, self.grantee.id, FileAccess.READ)
+        self.assertEqual(self.search(self.grantee, "budget"), [str(self.file.guid)])
+        self.assertEqual(self.search(self.stranger, "budget"), [str(self.other.guid)])
+
+    def test_team_grants_are_searchable(self):
+        team = Team.objects.create(name="team", owner=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_member(team.id, self.grantee.id)
+            grant_team(self.file.id, team.id, FileAccess.READ)
+        self.assertEqual(self.search(self.grantee, "quarterly"), [str(self.file.guid)])
+
+
+class PermissionCacheTests(AccessTestCase):
+    def test_mask_read_before_a_revoke_is_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            grant(self.file.id, self.grantee.id, FileAccess.READ)
+        load_perms = access._load_perms
+
+        def revoke_meanwhile(*args):
+            mask = load_perms(*args)
+            with self.captureOnCommitCallbacks(execute=True):
+                revoke(self.file.id, self.grantee.id, FileAccess.READ)
+            return mask
+
+        with mock.patch("file.access._load_perms", side_effect=revoke_meanwhile):
+            self.assertEqual(get_perms(self.grantee.id, self.file.id), FileAccess.READ)
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), 0)
+
+    def test_teams_read_before_a_removal_are_not_cached(self):
+        team = Team.objects.create(name="team", owner=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_member(team.id, self.grantee.id)
+            grant_team(self.file.id, team.id, FileAccess.READ)
+        load_team_ids = access._load_team_ids
+
+        def remove_meanwhile(user_id):
+            teams = load_team_ids(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                remove_member(team.id, user_id)
+            return teams
+
+        with mock.patch("file.access._load_team_ids", side_effect=remove_meanwhile):
+            self.assertEqual(principals(self.grantee.id)[1], [team.id])
+        self.assertEqual(principals(self.grantee.id)[1], [])
+        self.assertEqual(get_perms(self.grantee.id, self.file.id), 0)
+
+
+class LookupCacheTests(AccessTestCase):
+    def test_email_change_invalidates_the_old_email(self):
+        old_email = self.grantee.email
+        self.assertEqual(resolve_user(old_email).id, self.grantee.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                "/api/auth/update/details",
+                json.dumps({"name": "renamed", "email": "renamed@example.com"}),
+                content_type="application/json",
+                **auth_headers(self.grantee),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(resolve_user(old_email))
+        self.assertEqual(resolve_user("renamed@example.com").name, "renamed")
+
+    def test_delete_invalidates_the_guid(self):
+        self.assertEqual(resolve_file(str(self.file.guid)), self.file.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f"/api/file/delete?file_guid={self.file.guid}",
+                **auth_headers(self.owner),
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(resolve_file(str(self.file.guid)))
+
+    def test_mapping_read_before_a_delete_is_not_cached(self):
+        load_files = lookups._load_files
+
+        def delete_meanwhile(guids):
+            loaded = load_files(guids)
+            with self.captureOnCommitCallbacks(execute=True):
+                File.objects.filter(pk=self.file.id).update(is_deleted=True)
+                forget_file(self.file.guid)
+            return loaded
+
+        with mock.patch("file.lookups._load_files", side_effect=delete_meanwhile):
+            self.assertEqual(resolve_file(str(self.file.guid)), self.file.id)
+        self.assertIsNone(resolve_file(str(self.file.guid)))
+
+
+class LaggingReplicaRouter:
+    """
+    Stands in for a replica that has not caught up: every read routed here
+    may return rows from before the latest commit.
+    """
+
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        self.reads.append(model.__name__)
+        return None
+
+
+@override_settings(DATABASE_ROUTERS=["file.tests.LaggingReplicaRouter"])
+class ReplicaCacheFillTests(AccessTestCase):
+    def test_cached_reads_bypass_the_replicas(self):
+        LaggingReplicaRouter.reads.clear()
+        principals(self.owner.id)
+        get_perms(self.owner.id, self.file.id)
+        get_perms_many(self.grantee.id, [self.file.id])
+        resolve_users([self.grantee.email])
+        resolve_files([str(self.file.guid)])
+        self.assertEqual(LaggingReplicaRouter.reads, [])
+
+
+class RevocationTests(AccessTestCase):
+    def revoke_elsewhere(self, token, **fields):
+        """A RevokedToken row written by another process."""
+        return RevokedToken.objects.create(
+            jti=AccessToken(token)["jti"],
+            user=self.owner,
+            expires_at=timezone.now() + timedelta(hours=1),
+            **fields,
+        )
+
+    def list_files(self, token):
+        return self.client.get(
+            "/api/file/list", HTTP_AUTHORIZATION="Bearer " + token
+        ).status_code
+
+    def test_logout_revokes_the_token(self):
+        token = get_tokens_for_user(self.owner)["access"]
+        headers = {"HTTP_AUTHORIZATION": "Bearer " + token}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get("/api/auth/logout", **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.list_files(token), 401)
+
+    def test_deactivating_a_user_in_the_admin_revokes_their_tokens(self):
+        token = get_tokens_for_user(self.grantee)["access"]
+        admin = User.objects.create_user(
+            email="admin@example.com",
+            name="admin",
+            password="pw-123456!",
+            is_staff=True,
+            is_superuser=True,
+        )
+        self.client.force_login(admin)
+        joined = timezone.localtime(self.grantee.date_joined)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/admin/user/user/{self.grantee.id}/change/",
+                {
+                    "username": self.grantee.username,
+                    "email": self.grantee.email,
+                    "name": self.grantee.name,
+                    "date_joined_0": joined.strftime("%Y-%m-%d"),
+                    "date_joined_1": joined.strftime("%H:%M:%S"),
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.list_files(token), 401)
+
+    def test_rows_committed_out_of_order_are_picked_up(self):
+        first, late = (get_tokens_for_user(self.owner)["access"] for _ in range(2))
+        row = self.revoke_elsewhere(first)
+        revocations.refresh()
+        self.assertEqual(self.list_files(first), 401)
+        self.assertEqual(self.list_files(late), 200)
+        # A lower id and an earlier created_at than rows already read, as a
+        # transaction that started first but committed last would leave.
+        late_row = self.revoke_elsewhere(late, id=row.id - 1)
+        RevokedToken.objects.filter(id=late_row.id).update(
+            created_at=timezone.now() - timedelta(seconds=10)
+        )
+        revocations.refresh()
+        self.assertEqual(self.list_files(late), 401)
+
+
+class UploadSessionTests(AccessTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = self.settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_session(self, total_size=10, chunk_size=5):
+        return self.post(
+            "/api/file/upload/session",
+            {
+                "file_name": "big.bin",
+                "total_size": total_size,
+                "chunk_size": chunk_size,
+            },
+            self.owner,
+        )
+
+    def put_chunk(self, guid, index, content, chunk_size=5):
+        return self.client.put(
+            f"/api/file/upload/session/chunk?session_guid={guid}"
+            f"&index={index}&offset={index * chunk_size}",
+            content,
+            content_type="application/octet-stream",
+            **auth_headers(self.owner),
+        )
+
+    def finalize(self, guid):
+        # The content indexer's thread cannot reach the test transaction.
+        with mock.patch("file.search._indexer"), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            return self.client.post(
+                f"/api/file/upload/session/finalize?session_guid={guid}",
+                **auth_headers(self.owner),
+            )
+
+    def test_malformed_session_guid_is_not_found(self):
+        for method in ("get", "delete"):
+            response = getattr(self.client, method)(
+                "/api/file/upload/session?session_guid=not-a-guid",
+                **auth_headers(self.owner),
+            )
+            self.assertEqual(response.status_code, 404)
+        response = self.client.post(
+            "/api/file/upload/session/finalize?session_guid=not-a-guid",
+            **auth_headers(self.owner),
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_total_size_is_capped(self):
+        with self.settings(FILE_UPLOAD_SESSION_MAX_TOTAL_SIZE=100):
+            self.assertEqual(self.create_session(101).status_code, 400)
+            self.assertEqual(self.create_session(100).status_code, 201)
+
+    def status(self, guid):
+        response = self.client.get(
+            f"/api/file/upload/session?session_guid={guid}",
+            **auth_headers(self.owner),
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def upload(self, content, order):
+        guid = self.create_session(len(content)).json()["guid"]
+        for index in order:
+            chunk = content[index * 5 : index * 5 + 5]
+            self.assertEqual(self.put_chunk(guid, index, chunk).status_code, 200)
+        return guid
+
+    def test_chunks_arrive_in_any_order(self):
+        content = b"hello chunked world"
+        guid = self.upload(content, [3, 0, 2, 1])
+        self.assertEqual(self.status(guid)["missing_chunks"], [])
+        response = self.finalize(guid)
+        self.assertEqual(response.status_code, 201)
+        file = File.objects.select_related("blob").get(guid=response.json()["guid"])
+        self.assertEqual(file.blob.digest, hashlib.sha256(content).hexdigest())
+        self.assertEqual(file.blob.size, len(content))
+        with default_storage.open(file.blob.file.name, "rb") as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertTrue(self.status(guid)["is_complete"])
+
+    def test_finalize_waits_for_every_chunk_and_uploads_resume(self):
+        content = b"resumable upload"
+        guid = self.upload(content, [0, 2])
+        self.assertEqual(self.finalize(guid).status_code, 409)
+        status = self.status(guid)
+        self.assertEqual(status["missing_chunks"], [1, 3])
+        self.assertEqual(status["received_ranges"], [[0, 5], [10, 15]])
+        for index in status["missing_chunks"]:
+            chunk = content[index * 5 : index * 5 + 5]
+            self.assertEqual(self.put_chunk(guid, index, chunk).status_code, 200)
+        self.assertEqual(self.finalize(guid).status_code, 201)
+        self.assertEqual(self.finalize(guid).status_code, 409)
+
+    def test_identical_uploads_share_a_blob(self):
+        content = b"deduplicated bytes"
+        guids = [self.upload(content, [0, 1, 2, 3]) for _ in range(2)]
+        files = [self.finalize(guid).json()["guid"] for guid in guids]
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(
+            set(File.objects.filter(guid__in=files).values_list("blob", flat=True)),
+            {blob.id},
+        )
+        # The first assembled file became the blob, the second was dropped.
+        for session in UploadSession.objects.filter(guid__in=guids):
+            self.assertFalse(default_storage.exists(session.storage_name))
+
+    def test_chunk_received_during_finalize_is_rejected(self):
+        guid = self.create_session().json()["guid"]
+        for index in range(2):
+            self.assertEqual(self.put_chunk(guid, index, b"a" * 5).status_code, 200)
+        stage_chunk = api.stage_chunk
+
+        def finalize_while_staging(stream, length):
+            # The retried chunk is still being received when finalize runs.
+            staged = stage_chunk(stream, length)
+            self.assertEqual(self.finalize(guid).status_code, 201)
+            return staged
+
+        with mock.patch.object(api, "stage_chunk", finalize_while_staging):
+            response = self.put_chunk(guid, 0, b"b" * 5)
+        self.assertEqual(response.status_code, 409)
+        blob = Blob.objects.get()
+        with default_storage.open(blob.file.name, "rb") as stored:
+            self.assertEqual(stored.read(), b"a" * 10)
+        self.assertEqual(blob.digest, hashlib.sha256(b"a" * 10).hexdigest())
+
+    def test_purge_removes_stale_sessions_and_their_storage(self):
+        stale, active, fresh = (self.create_session().json()["guid"] for _ in range(3))
+        UploadSession.objects.filter(guid__in=[stale, active]).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        # Started long ago but still receiving chunks.
+        self.assertEqual(self.put_chunk(active, 0, b"a" * 5).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("purge_upload_sessions", stdout=io.StringIO())
+        stale, active, fresh = (
+            UploadSession.objects.get(guid=guid) for guid in (stale, active, fresh)
+        )
+        self.assertTrue(stale.is_deleted)
+        self.assertFalse(default_storage.exists(stale.storage_name))
+        for session in (active, fresh):
+            self.assertFalse(session.is_deleted)
+            self.assertTrue(default_storage.exists(session.storage_name))
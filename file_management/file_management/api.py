@@ -1,4 +1,8 @@
 from ninja_extra import NinjaExtraAPI
 
-api = NinjaExtraAPI()
-api.auto_discover_controllers()
\ No newline at end of file
+import file.async_api  # noqa: F401  registers the ASGI-native controllers
+import user.async_api  # noqa: F401
+from core.metrics import TimedJSONRenderer
+
+api = NinjaExtraAPI(renderer=TimedJSONRenderer())
+api.auto_discover_controllers()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.MultipartPutMiddleware',
 ]
 
 ROOT_URLCONF = 'file_management.urls'
@@ -81,11 +84,105 @@ WSGI_APPLICATION = 'file_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE picks a profile:
+#   sqlite          a single local file (the default), tuned by SQLITE_MODE.
+#   mysql           DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT for the
+#                   primary; DB_REPLICA_HOSTS is a comma-separated list of
+#                   read replicas sharing the same credentials.
+#   sqlite-replica  a second SQLite file standing in for a replica, to exercise
+#                   the routing locally. It is not replicated to.
+# Connections are kept for DB_CONN_MAX_AGE seconds and checked before reuse.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+# SQLite profiles use WAL, synchronous=NORMAL, a busy timeout and BEGIN
+# IMMEDIATE for write transactions (see core/db/sqlite3/base.py) so
+# concurrent uploads wait for the write lock instead of failing with
+# "database is locked". SQLITE_MODE=default uses Django's stock backend.
+
+SQLITE_MODE = os.environ.get('SQLITE_MODE', 'wal')
+SQLITE_ENGINES = {
+    'wal': 'core.db.sqlite3',
+    'default': 'django.db.backends.sqlite3',
+}
+
+if DB_ENGINE == 'mysql':
+    MYSQL_DATABASE = {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': os.environ.get('DB_NAME', 'file_management'),
+        'USER': os.environ.get('DB_USER', 'file_management'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'PORT': os.environ.get('DB_PORT', '3306'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'charset': 'utf8mb4',
+            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+        },
+    }
+    DATABASES = {
+        'default': {**MYSQL_DATABASE, 'HOST': os.environ.get('DB_HOST', 'localhost')},
     }
+    replica_hosts = os.environ.get('DB_REPLICA_HOSTS', '')
+    for index, host in enumerate(filter(None, replica_hosts.split(',')), start=1):
+        DATABASES[f'replica{index}'] = {
+            **MYSQL_DATABASE,
+            'HOST': host.strip(),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': SQLITE_ENGINES[SQLITE_MODE],
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if DB_ENGINE == 'sqlite-replica':
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': BASE_DIR / 'db-replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Safe requests read from the replicas unless the client wrote within the
+# last REPLICA_STICKY_SECONDS.
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+    MIDDLEWARE.append('core.middleware.ReplicaRoutingMiddleware')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Resolved (user, file) permission masks. Entries are evicted on every ACL
+    # change, so the timeout only bounds memory for idle entries. Point this at
+    # a shared backend (memcached, redis) when running several processes,
+    # otherwise evictions only reach the process that made the change.
+    'permissions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'file-permissions',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Email -> user and guid -> file id for the access endpoints. Renames,
+    # email changes and deletes invalidate their keys; the timeout bounds
+    # anything changed outside the API. Like 'permissions', invalidation only
+    # reaches other processes through a shared backend: with this per-process
+    # cache they may resolve a changed email or deleted file for up to TIMEOUT
+    # seconds, so keep it short.
+    'lookups': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lookups',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
 AUTH_USER_MODEL = "user.User"
@@ -141,7 +238,7 @@ NINJA_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('ninja_jwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'ninja_jwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'core.auth.ClaimsUser',
 
     'JTI_CLAIM': 'jti',
 
@@ -161,11 +258,88 @@ NINJA_JWT = {
     'TOKEN_VERIFY_INPUT_SCHEMA': "ninja_jwt.schema.TokenVerifyInputSchema",
 }
 
+# FastJWTAuth: 'claims' builds request.user from the token alone, 'cached'
+# loads User rows through an in-process LRU cache trusted for the TTL below.
+# Only 'cached' checks is_active, so it is the default. Claims mode trusts a
+# token until it expires or is revoked: deactivating a user in the admin
+# revokes their tokens, but clearing is_active anywhere else must be paired
+# with revocations.revoke_user(user_id).
+
+JWT_AUTH_MODE = 'cached'
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 30
+
+# Revoked tokens are checked against an in-process Bloom filter sized for
+# JWT_REVOCATION_CAPACITY live entries; rows revoked by other processes are
+# read into it every JWT_REVOCATION_REFRESH seconds. Each read goes back
+# JWT_REVOCATION_OVERLAP seconds before the previous one, to catch rows whose
+# transaction committed late; keep it above the longest transaction plus the
+# clock skew between servers.
+
+JWT_REVOCATION_CAPACITY = 100000
+JWT_REVOCATION_ERROR_RATE = 0.001
+JWT_REVOCATION_REFRESH = 5
+JWT_REVOCATION_OVERLAP = 60
+
+# Password hashing for the async login and signup endpoints runs on a pool
+# of this many threads; once PASSWORD_HASHING_QUEUE more requests are waiting
+# they are answered with 503.
+
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_QUEUE = 64
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = 'static/'
 
+# Resumable upload sessions
+# Each chunk is staged in a temporary file, then copied into the final file,
+# so the chunk sizes only bound the size of a single PUT request. Creating a
+# session reserves its whole total size on disk; unfinished sessions that
+# received no chunk for FILE_UPLOAD_SESSION_EXPIRY seconds are removed by
+# purge_upload_sessions.
+
+FILE_UPLOAD_SESSION_CHUNK_SIZE = 8 * 1024 * 1024
+FILE_UPLOAD_SESSION_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+FILE_UPLOAD_SESSION_MAX_TOTAL_SIZE = 5 * 1024 * 1024 * 1024
+FILE_UPLOAD_SESSION_EXPIRY = 24 * 60 * 60
+
+# Hash uploads while they are parsed so identical content can be deduplicated
+# without a second read.
+
+FILE_UPLOAD_HANDLERS = [
+    'file.storage.HashingMemoryFileUploadHandler',
+    'file.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Downloads
+# None streams from Django; WSGI servers with a sendfile-backed
+# wsgi.file_wrapper (e.g. gunicorn) still avoid copying bytes in Python.
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd) hand the
+# transfer to the front-end server after the access check.
+
+FILE_DOWNLOAD_OFFLOAD = None
+FILE_DOWNLOAD_ACCEL_PREFIX = '/protected/'
+
+# Search
+# Text is extracted from uploads on a background thread after commit; only
+# the first FILE_SEARCH_MAX_TEXT_BYTES of each file are indexed.
+
+FILE_SEARCH_MAX_TEXT_BYTES = 1024 * 1024
+
+# Metrics
+# RequestMetricsMiddleware records per-route latency, SQL, storage and
+# serialization time, served in the Prometheus text format at /api/metrics.
+# Scrapes must send "Authorization: Bearer <METRICS_TOKEN>"; without a token
+# the endpoint is only open while DEBUG is on. METRICS_SERVER_TIMING=1 adds
+# the timings to response headers, which is the default only under DEBUG.
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_SERVER_TIMING = (
+    os.environ.get('METRICS_SERVER_TIMING', '1' if DEBUG else '0') == '1'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from core.auth import invalidate_user
+from core.revocation import revocations
 from .models import User
 
 class CustomUserAdmin(BaseUserAdmin):
@@ -21,4 +23,12 @@ class CustomUserAdmin(BaseUserAdmin):
     search_fields = ('email', 'name',)
     ordering = ('email',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_user(obj.id)
+        # Tokens authenticated from their claims never see is_active, so a
+        # deactivated user's outstanding tokens are revoked instead.
+        if change and 'is_active' in form.changed_data and not obj.is_active:
+            revocations.revoke_user(obj.id)
+
 admin.site.register(User, CustomUserAdmin)
@@ -7,11 +7,16 @@ from ninja_extra import (
 from ninja.constants import NOT_SET
 from django.db import transaction
 from core.schema import MessageSchema, NotFoundSchema, NotVerifiedSchema
-from user.models import User
+from file.access import add_member, remove_member
+from file.lookups import forget_user
+from user.models import Team, User
 from user.schema import (
     ChangeUserDetailsSchema,
     ReVerifyRequestSchema,
     ResetPasswordSchema,
+    TeamCreateSchema,
+    TeamMemberSchema,
+    TeamSchema,
     UserLoginRequestSchema,
     UserLoginResponseSchema,
     UserSignupRequestSchema,
@@ -23,8 +28,8 @@ from django.core.exceptions import ValidationError as DjangoValidationError
 from ninja.errors import ValidationError as NinjaValidationError
 from django.http import Http404
 from django.contrib.auth import authenticate, login, logout
-from core.auth import get_tokens_for_user
-from ninja_jwt.authentication import JWTAuth
+from core.auth import FastJWTAuth, get_tokens_for_user, invalidate_user
+from core.revocation import revocations
 
 @api_controller("/auth", tags=["User Controller"], auth=NOT_SET, permissions=[])
 class AuthController:
@@ -135,22 +140,82 @@ class AuthController:
         with transaction.atomic():
             user.set_password(data.password)
             user.save()
+            invalidate_user(user.id)
+            revocations.revoke_user(user.id)
             return 200, MessageSchema(message="Password Changed Successfully")
 
-    @http_patch("/update/details", response=[(200, MessageSchema)], auth=JWTAuth())
+    @http_patch("/update/details", response=[(200, MessageSchema)], auth=FastJWTAuth())
     def update_user_details(self, request, data: ChangeUserDetailsSchema):
         with transaction.atomic():
-            user = request.user
+            user = User.objects.get(id=request.user.id)
+            forget_user(user.email)
             user.name = data.name
             user.email = data.email
-            logout(request, user)
+            user.save()
+            invalidate_user(user.id)
+            logout(request)
             return 200, MessageSchema(
                 message="Details changed successfully. Kindly Log back in to view the new details"
             )
 
-    @http_get("/logout", response=[(200, MessageSchema)], auth=JWTAuth())
+    @http_get("/logout", response=[(200, MessageSchema)], auth=FastJWTAuth())
     def logout(self, request):
         with transaction.atomic():
+            revocations.revoke_token(request.jwt_token)
             logout(request=request)
             return 200, MessageSchema(message="Logged out")
-        
+
+
+def resolve_member(request, data: TeamMemberSchema):
+    """Look up a team owned by the caller and the user to add or remove."""
+    try:
+        team = Team.objects.get(
+            guid=data.team_guid, owner_id=request.user.id, is_deleted=False
+        )
+    except (Team.DoesNotExist, DjangoValidationError):
+        return None, None, (404, NotFoundSchema(message="Team Not Found"))
+    try:
+        user = User.objects.get(email=data.user_email)
+    except User.DoesNotExist:
+        return None, None, (404, NotFoundSchema(message="User Not Found"))
+    return team, user, None
+
+
+@api_controller("/team", tags=["Team Controller"], auth=FastJWTAuth(), permissions=[])
+class TeamController:
+    @http_post("/create", response=[(201, TeamSchema)])
+    def create_team(self, request, data: TeamCreateSchema):
+        with transaction.atomic():
+            team = Team.objects.create(name=data.name, owner_id=request.user.id)
+            add_member(team.id, request.user.id)
+            return 201, TeamSchema(
+                guid=team.guid, created_at=team.created_at, name=team.name
+            )
+
+    @http_post(
+        "/member/add",
+        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+    )
+    def add_team_member(self, request, data: TeamMemberSchema):
+        team, user, error = resolve_member(request, data)
+        if error:
+            return error
+        if not add_member(team.id, user.id):
+            return 409, MessageSchema(message="User is already a member of this team")
+        return 201, MessageSchema(
+            message="User " + user.name + " has been added to " + team.name
+        )
+
+    @http_post(
+        "/member/remove",
+        response=[(201, MessageSchema), (404, NotFoundSchema), (409, MessageSchema)],
+    )
+    def remove_team_member(self, request, data: TeamMemberSchema):
+        team, user, error = resolve_member(request, data)
+        if error:
+            return error
+        if not remove_member(team.id, user.id):
+            return 409, MessageSchema(message="User is not a member of this team")
+        return 201, MessageSchema(
+            message="User " + user.name + " has been removed from " + team.name
+        )
@@ -0,0 +1,92 @@
+from django.contrib.auth import alogin
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from ninja.constants import NOT_SET
+from ninja.errors import ValidationError as NinjaValidationError
+from ninja_extra import api_controller, http_post
+
+from core.auth import get_tokens_for_user
+from core.errors import BusyError
+from core.hashing import ahash_password, averify_password
+from core.schema import MessageSchema, NotFoundSchema, NotVerifiedSchema
+from user.models import User
+from user.schema import (
+    UserLoginRequestSchema,
+    UserLoginResponseSchema,
+    UserSignupRequestSchema,
+    UserSignupResponseSchema,
+)
+
+
+@api_controller(
+    "/async/auth", tags=["Async User Controller"], auth=NOT_SET, permissions=[]
+)
+class AsyncAuthController:
+    """
+    Login and signup with password hashing on the bounded hashing pool, so a
+    burst of them cannot occupy the threads that serve other endpoints.
+    """
+
+    def busy(self, error: BusyError):
+        self.context.response["Retry-After"] = "1"
+        return 503, MessageSchema(message=error.message)
+
+    @http_post(
+        "/signup",
+        response=[(201, UserSignupResponseSchema), (503, MessageSchema)],
+    )
+    async def signup(self, request, data: UserSignupRequestSchema):
+        try:
+            validate_password(data.password)
+        except DjangoValidationError as e:
+            raise NinjaValidationError({"password": str(e)})
+        user = User.objects.build_user(email=data.email, name=data.name)
+        try:
+            await ahash_password(user, data.password)
+        except BusyError as e:
+            return self.busy(e)
+        await user.asave()
+        return 201, UserSignupResponseSchema(
+            msg="Please use this link to verify user before login",
+            link=(
+                request.scheme
+                + "://"
+                + request.get_host()
+                + "/api/auth/verify"
+                + "?guid="
+                + str(user.guid)
+            ),
+        )
+
+    @http_post(
+        "/login",
+        response=[
+            (200, UserLoginResponseSchema),
+            (401, NotVerifiedSchema),
+            (404, NotFoundSchema),
+            (503, MessageSchema),
+        ],
+    )
+    async def login(self, request, data: UserLoginRequestSchema):
+        user = await User.objects.filter(email=data.email, is_active=True).afirst()
+        password = user.password if user else None
+        try:
+            valid = await averify_password(user, data.password)
+        except BusyError as e:
+            return self.busy(e)
+        if not valid:
+            return 404, NotFoundSchema(message="Invalid Credentials")
+        if user.password != password:
+            await user.asave(update_fields=["password"])
+        if not user.is_verified:
+            return 401, NotVerifiedSchema(
+                message="User is not verified. Verify the user using the verification link"
+            )
+        await alogin(request, user)
+        token = get_tokens_for_user(user)
+        return 200, UserLoginResponseSchema(
+            guid=user.guid,
+            created_at=user.created_at,
+            msg="User Login Successful",
+            token=str(token["access"]),
+        )
@@ -3,11 +3,15 @@ from django.db import models
 from core.models import BaseModel
 
 class CustomUserManager(BaseUserManager):
-    def create_user(self, email, name, password=None, **extra_fields):
+    def build_user(self, email, name, **extra_fields):
+        """An unsaved user without a password, for callers that hash elsewhere."""
         if not email:
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
-        user = self.model(email=email, name=name, username=email, **extra_fields)
+        return self.model(email=email, name=name, username=email, **extra_fields)
+
+    def create_user(self, email, name, password=None, **extra_fields):
+        user = self.build_user(email, name, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
         return user
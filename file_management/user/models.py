@@ -18,3 +18,61 @@ class User(AbstractUser, BaseModel):
 
     def __str__(self) -> str:
         return self.email
+
+
+class Team(BaseModel):
+    """A group of users that file access can be granted to as one principal."""
+
+    name = models.CharField(max_length=50)
+    owner = models.ForeignKey(
+        "user.User",
+        blank=True,
+        null=True,
+        related_name="owned_teams",
+        on_delete=models.DO_NOTHING,
+    )
+    members = models.ManyToManyField(
+        "user.User", through="user.TeamMembership", related_name="teams"
+    )
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class TeamMembership(models.Model):
+    team = models.ForeignKey(
+        "user.Team", related_name="memberships", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(
+        "user.User", related_name="team_memberships", on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["team", "user"], name="unique_team_membership"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.team}: {self.user}"
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked access token (``jti`` set) or a revocation of every token the
+    user was issued before ``issued_before`` (``jti`` empty).
+    """
+
+    jti = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    user = models.ForeignKey(
+        "user.User", related_name="revoked_tokens", on_delete=models.CASCADE
+    )
+    issued_before = models.DateTimeField(blank=True, null=True)
+    # Once every token the row covers has expired, the row can be dropped.
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return self.jti or f"{self.user_id} before {self.issued_before}"
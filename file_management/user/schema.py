@@ -38,4 +38,14 @@ class UserLoginResponseSchema(BaseSchema):
     
 class UserDetailsSchema(BaseSchema):
     name: str
-    email: str
\ No newline at end of file
+    email: str
+
+class TeamCreateSchema(BaseModel):
+    name: str
+
+class TeamSchema(BaseSchema):
+    name: str
+
+class TeamMemberSchema(BaseModel):
+    team_guid: str
+    user_email: str
@@ -1,3 +1,55 @@
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from user.models import User
+
+
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.csv")
+        with open(self.path, "w", encoding="utf-8") as target:
+            target.write(
+                "Email,Name,Password\n"
+                "ann@example.com,Ann,pw-ann-123!\n"
+                "bob@example.com,Bob,pw-bob-123!\n"
+                "ann@example.com,Ann again,pw-other!\n"
+            )
+
+    def import_users(self):
+        """Run the import; return its output and the batches sent to hashing."""
+        stdout = io.StringIO()
+        with mock.patch.object(
+            ProcessPoolExecutor,
+            "submit",
+            autospec=True,
+            side_effect=ProcessPoolExecutor.submit,
+        ) as submit:
+            call_command("import_users", self.path, workers=1, stdout=stdout)
+        return stdout.getvalue(), [call.args[2] for call in submit.call_args_list]
+
+    def test_creates_users_with_their_passwords(self):
+        output, batches = self.import_users()
+        self.assertIn("Imported 2 users, skipped 1", output)
+        self.assertEqual(batches, [["pw-ann-123!", "pw-bob-123!"]])
+        ann = User.objects.get(email="ann@example.com")
+        self.assertEqual(ann.name, "Ann")
+        self.assertTrue(ann.check_password("pw-ann-123!"))
+
+    def test_rerun_skips_existing_emails_before_hashing(self):
+        self.import_users()
+        User.objects.filter(email="bob@example.com").delete()
+        output, batches = self.import_users()
+        self.assertIn("Imported 1 users, skipped 2", output)
+        self.assertEqual(batches, [["pw-bob-123!"]])
+        output, batches = self.import_users()
+        self.assertIn("Imported 0 users, skipped 3", output)
+        self.assertEqual(batches, [])
+        self.assertEqual(User.objects.count(), 2)